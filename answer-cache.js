@@ -0,0 +1,187 @@
+#!/usr/bin/env node
+
+/**
+ * answer-cache - ask_user回答缓存
+ * 对重复出现的确认类提问直接返回上次的回答，避免每次都打开窗口等待倒计时
+ *
+ * 缓存默认关闭，只有在缓存文件的rules中配置了匹配提示文字的规则后才会生效：
+ * {
+ *   "rules": [{ "prompt": "^请审查代码修改", "ttl": 3600 }],
+ *   "max_entries": 200,
+ *   "max_bytes": 1048576,
+ *   "entries": { ... }
+ * }
+ * 需与ask_user_ui.py中的AnswerCache保持一致
+ * 多个ask_user同时提问时，每次写入都在独占锁内重新读取缓存文件再合并本次的修改
+ */
+
+import { createHash } from 'crypto';
+import * as path from 'path';
+import {
+  getCacheDirPath,
+  fileExists,
+  readFile,
+  writeFileAtomic
+} from './common.js';
+import { withLock } from './fs-lock.js';
+
+export const ANSWER_CACHE_FILE = 'ask_user.json';
+export const DEFAULT_MAX_ENTRIES = 200;
+export const DEFAULT_MAX_BYTES = 1024 * 1024;
+
+/**
+ * 获取回答缓存文件路径
+ */
+export const getAnswerCachePath = () => {
+  return path.join(getCacheDirPath(), ANSWER_CACHE_FILE);
+};
+
+/**
+ * 缓存键：提示文字与stdin内容的sha256
+ */
+export const answerCacheKey = (prompt, stdin) => {
+  return createHash('sha256').update(`${prompt}\0${stdin || ''}`, 'utf8').digest('hex');
+};
+
+const now = () => Date.now() / 1000;
+
+// 回答缓存
+export class AnswerCache {
+  constructor(cachePath = getAnswerCachePath()) {
+    this.cachePath = cachePath;
+    this.data = null;
+  }
+
+  async load() {
+    if (this.data) {
+      return this.data;
+    }
+    let data = {};
+    if (fileExists(this.cachePath)) {
+      try {
+        data = JSON.parse(await readFile(this.cachePath));
+      } catch (error) {
+        throw new Error(`回答缓存文件无效 ${this.cachePath}: ${error.message}`);
+      }
+    }
+    this.data = {
+      rules: [],
+      max_entries: DEFAULT_MAX_ENTRIES,
+      max_bytes: DEFAULT_MAX_BYTES,
+      ...data,
+      entries: data.entries || {}
+    };
+    return this.data;
+  }
+
+  async save() {
+    await writeFileAtomic(this.cachePath, JSON.stringify(this.data, null, 2) + '\n');
+  }
+
+  // 在独占锁内重新读取缓存文件，修改后写回，其他进程在此期间写入的条目不会被覆盖
+  async update(mutate) {
+    return withLock(`${this.cachePath}.lock`, 'exclusive', async () => {
+      this.data = null;
+      await this.load();
+      const result = mutate(this.data);
+      await this.save();
+      return result;
+    });
+  }
+
+  // 返回第一条匹配提示文字的规则，没有规则匹配时不使用缓存
+  findRule(prompt) {
+    return this.data.rules.find((rule) => new RegExp(rule.prompt).test(prompt)) || null;
+  }
+
+  /**
+   * 查询缓存，返回 { status: 'off'|'hit'|'miss', key, answer, rule }
+   */
+  async lookup(prompt, stdin) {
+    await this.load();
+    const rule = this.findRule(prompt);
+    if (!rule) {
+      return { status: 'off' };
+    }
+    const key = answerCacheKey(prompt, stdin);
+    const entry = this.data.entries[key];
+    if (!entry || entry.expires_at <= now()) {
+      return { status: 'miss', key, rule };
+    }
+    await this.update((data) => {
+      const current = data.entries[key];
+      if (current) {
+        current.last_used_at = now();
+        current.hits = (current.hits || 0) + 1;
+      }
+    });
+    return { status: 'hit', key, rule, answer: entry.answer, expiresIn: Math.round(entry.expires_at - now()) };
+  }
+
+  // 记录回答，并按LRU淘汰超出数量或大小上限的条目
+  async store(lookup, prompt, answer) {
+    const time = now();
+    await this.update((data) => {
+      data.entries[lookup.key] = {
+        prompt,
+        answer,
+        size: Buffer.byteLength(answer),
+        created_at: time,
+        last_used_at: time,
+        expires_at: time + (lookup.rule.ttl || 3600),
+        hits: 0
+      };
+      this.evict();
+    });
+  }
+
+  evict() {
+    const time = now();
+    const entries = this.data.entries;
+    for (const [key, entry] of Object.entries(entries)) {
+      if (entry.expires_at <= time) {
+        delete entries[key];
+      }
+    }
+    const ordered = Object.entries(entries).sort((a, b) => a[1].last_used_at - b[1].last_used_at);
+    let totalBytes = ordered.reduce((sum, [, entry]) => sum + entry.size, 0);
+    let count = ordered.length;
+    for (const [key, entry] of ordered) {
+      if (count <= this.data.max_entries && totalBytes <= this.data.max_bytes) {
+        break;
+      }
+      delete entries[key];
+      count--;
+      totalBytes -= entry.size;
+    }
+  }
+
+  // 列出缓存条目，最近使用的在前
+  async list() {
+    await this.load();
+    return Object.entries(this.data.entries)
+      .map(([key, entry]) => ({ key, ...entry }))
+      .sort((a, b) => b.last_used_at - a.last_used_at);
+  }
+
+  // 清除缓存条目（保留规则），expiredOnly时只清除已过期的条目，返回清除的数量
+  async purge(expiredOnly = false) {
+    if (!fileExists(this.cachePath)) {
+      return 0;
+    }
+    return this.update((data) => {
+      const before = Object.keys(data.entries).length;
+      if (expiredOnly) {
+        const time = now();
+        for (const [key, entry] of Object.entries(data.entries)) {
+          if (entry.expires_at <= time) {
+            delete data.entries[key];
+          }
+        }
+      } else {
+        data.entries = {};
+      }
+      return before - Object.keys(data.entries).length;
+    });
+  }
+}
@@ -0,0 +1,186 @@
+#!/usr/bin/env node
+
+/**
+ * ask-control - 向已打开的ask_user窗口发送控制消息
+ * ask_user --control <名称> 提问期间在本地socket上监听，把收到的JSON行转发给ask_user_ui.py的--control-fd；
+ * ask_user --send <名称> 连接该socket发送消息，窗口无需关闭重开，用户已输入的内容不会丢失
+ */
+
+import { promises as fs } from 'fs';
+import * as net from 'net';
+import {
+  getAskUserControlPath,
+  fileExists
+} from './common.js';
+
+// 消息类型，与ask_user_ui.py中ControlChannelReader.MESSAGE_TYPES一致
+export const CONTROL_MESSAGE_TYPES = ['prompt', 'status', 'countdown', 'close'];
+
+const CONTROL_NAME_PATTERN = /^[\w.-]{1,64}$/;
+
+// 连接失败时视为没有对应窗口的错误码
+const NOT_LISTENING_CODES = ['ENOENT', 'ECONNREFUSED'];
+
+/**
+ * 校验控制通道名称并返回socket路径
+ */
+export const getControlPath = (name) => {
+  if (!CONTROL_NAME_PATTERN.test(name)) {
+    throw new Error(`无效的控制通道名称: ${name}（只能包含字母、数字、_、.和-）`);
+  }
+  return getAskUserControlPath(name);
+};
+
+/**
+ * 解析并校验一行控制消息，无效时抛出错误
+ */
+export const parseControlMessage = (line) => {
+  let message;
+  try {
+    message = JSON.parse(line);
+  } catch (error) {
+    throw new Error(`控制消息不是有效的JSON: ${error.message}`);
+  }
+  if (!message || typeof message !== 'object' || !CONTROL_MESSAGE_TYPES.includes(message.type)) {
+    throw new Error(`未知的控制消息类型: ${line.slice(0, 200)}`);
+  }
+  if (message.type === 'countdown' && message.action !== 'cancel' && !(Number(message.seconds) > 0)) {
+    throw new Error('countdown消息需要action为cancel，或者指定正数seconds');
+  }
+  return message;
+};
+
+// 提问期间监听控制消息，界面进程启动前收到的消息先缓存，启动后依次转发
+export class AskControlServer {
+  constructor(name) {
+    this.name = name;
+    this.socketPath = getControlPath(name);
+    this.server = null;
+    this.target = null;
+    this.pending = [];
+  }
+
+  async listen() {
+    // 同名通道正被其他ask_user使用时报错，上次异常退出残留的socket文件直接删除
+    if (fileExists(this.socketPath)) {
+      if (await probe(this.socketPath)) {
+        throw new Error(`控制通道${this.name}正被其他ask_user使用`);
+      }
+      await fs.rm(this.socketPath, { force: true });
+    }
+    this.server = net.createServer((socket) => this.handleConnection(socket));
+    await new Promise((resolve, reject) => {
+      this.server.once('error', reject);
+      this.server.listen(this.socketPath, resolve);
+    });
+    await fs.chmod(this.socketPath, 0o600);
+  }
+
+  // 每个连接发送若干行消息，结束后回复 { delivered, errors }
+  handleConnection(socket) {
+    let buffered = '';
+    const reply = { delivered: 0, errors: [] };
+    const deliverLines = (lines) => {
+      for (const line of lines) {
+        if (!line.trim()) {
+          continue;
+        }
+        try {
+          this.deliver(parseControlMessage(line));
+          reply.delivered++;
+        } catch (error) {
+          reply.errors.push(error.message);
+        }
+      }
+    };
+    socket.setEncoding('utf8');
+    socket.on('data', (data) => {
+      const lines = (buffered + data).split('\n');
+      buffered = lines.pop();
+      deliverLines(lines);
+    });
+    socket.on('end', () => {
+      deliverLines([buffered]);
+      socket.end(JSON.stringify(reply) + '\n');
+    });
+    socket.on('error', () => {});
+  }
+
+  deliver(message) {
+    const data = JSON.stringify(message) + '\n';
+    if (this.target) {
+      this.target.write(data);
+    } else {
+      this.pending.push(data);
+    }
+  }
+
+  /**
+   * 开始向界面进程的控制管道转发消息
+   */
+  attach(stream) {
+    stream.on('error', () => {});
+    this.target = stream;
+    for (const data of this.pending) {
+      stream.write(data);
+    }
+    this.pending = [];
+  }
+
+  detach() {
+    if (this.target) {
+      this.target.end();
+      this.target = null;
+    }
+  }
+
+  async close() {
+    this.detach();
+    if (this.server) {
+      await new Promise((resolve) => this.server.close(resolve));
+      this.server = null;
+    }
+    await fs.rm(this.socketPath, { force: true });
+  }
+}
+
+// socket上是否有进程在监听
+const probe = (socketPath) => new Promise((resolve) => {
+  const socket = net.createConnection(socketPath);
+  socket.on('connect', () => {
+    socket.destroy();
+    resolve(true);
+  });
+  socket.on('error', () => resolve(false));
+});
+
+/**
+ * 向名为name的控制通道发送若干行消息，返回 { delivered, errors }
+ */
+export const sendControlMessages = (name, lines) => {
+  const socketPath = getControlPath(name);
+  return new Promise((resolve, reject) => {
+    const socket = net.createConnection(socketPath);
+    const chunks = [];
+    socket.on('connect', () => {
+      socket.end(lines.join('\n') + '\n');
+    });
+    socket.on('data', (data) => {
+      chunks.push(data);
+    });
+    socket.on('end', () => {
+      try {
+        resolve(JSON.parse(Buffer.concat(chunks).toString('utf8')));
+      } catch (error) {
+        reject(new Error(`控制通道${name}响应无效: ${error.message}`));
+      }
+    });
+    socket.on('error', (error) => {
+      if (NOT_LISTENING_CODES.includes(error.code)) {
+        reject(new Error(`没有使用控制通道${name}的ask_user（需以 ask_user --control ${name} 提问）`));
+      } else {
+        reject(error);
+      }
+    });
+  });
+};
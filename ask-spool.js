@@ -0,0 +1,203 @@
+#!/usr/bin/env node
+
+/**
+ * ask-spool - ask_user异步提问的工单目录
+ * ask_user --async把问题写入.sleepdog/.ask_user/spool/<ticket>/question.json后立即返回工单号，
+ * 后台进程打开界面，得到回答后原子写入answer.json；--poll/--wait读取回答，读取后删除工单。
+ * 读取回答并删除工单在工单锁内完成，多个进程同时等待同一工单时只有一个能取得回答
+ */
+
+import { randomBytes } from 'crypto';
+import { promises as fs, watch } from 'fs';
+import * as path from 'path';
+import {
+  getSleepDogPath,
+  fileExists,
+  isProcessAlive,
+  readFile,
+  writeFileAtomic,
+  ASK_USER_DIR
+} from './common.js';
+import { withLock } from './fs-lock.js';
+
+export const SPOOL_DIR = 'spool';
+export const QUESTION_FILE = 'question.json';
+export const ANSWER_FILE = 'answer.json';
+
+// 超过该时间仍未被读取的工单在创建新工单时清理
+export const SPOOL_RETENTION_MS = 24 * 60 * 60 * 1000;
+// --wait在文件监听之外的轮询间隔，监听不可用或漏报时兜底
+const WAIT_POLL_INTERVAL_MS = 500;
+
+const TICKET_PATTERN = /^[0-9a-z]+-[0-9a-f]+$/;
+
+/**
+ * 获取工单目录路径
+ */
+export const getSpoolDirPath = () => {
+  return path.join(getSleepDogPath(), ASK_USER_DIR, SPOOL_DIR);
+};
+
+/**
+ * 生成工单号：时间戳（36进制）加随机后缀，按创建时间排序
+ */
+export const generateTicket = () => {
+  return `${Date.now().toString(36)}-${randomBytes(4).toString('hex')}`;
+};
+
+const readJson = async (filePath) => {
+  try {
+    return JSON.parse(await readFile(filePath));
+  } catch (error) {
+    if (error.code === 'ENOENT') {
+      return null;
+    }
+    throw new Error(`工单文件无效 ${filePath}: ${error.message}`);
+  }
+};
+
+// 异步提问的工单目录
+export class AskSpool {
+  constructor(spoolPath = getSpoolDirPath()) {
+    this.spoolPath = spoolPath;
+  }
+
+  ticketPath(ticket) {
+    if (!TICKET_PATTERN.test(ticket)) {
+      throw new Error(`无效的工单号: ${ticket}`);
+    }
+    return path.join(this.spoolPath, ticket);
+  }
+
+  /**
+   * 创建工单并写入问题，返回工单号
+   */
+  async create(prompt, stdin) {
+    await this.prune();
+    const ticket = generateTicket();
+    await writeFileAtomic(path.join(this.ticketPath(ticket), QUESTION_FILE), JSON.stringify({
+      ticket,
+      prompt,
+      stdin: stdin || '',
+      created_at: Date.now() / 1000
+    }, null, 2) + '\n');
+    return ticket;
+  }
+
+  async readQuestion(ticket) {
+    const question = await readJson(path.join(this.ticketPath(ticket), QUESTION_FILE));
+    if (!question) {
+      throw new Error(`工单不存在或已被读取: ${ticket}`);
+    }
+    return question;
+  }
+
+  /**
+   * 记录处理工单的后台进程，便于判断进程是否已异常退出
+   */
+  async setRunner(ticket, pid) {
+    const question = await this.readQuestion(ticket);
+    await writeFileAtomic(path.join(this.ticketPath(ticket), QUESTION_FILE),
+      JSON.stringify({ ...question, runner_pid: pid }, null, 2) + '\n');
+  }
+
+  /**
+   * 原子写入回答：{ status, result, message }，status与ask_user_ui.py的结果状态一致，另有'error'
+   */
+  async writeAnswer(ticket, answer) {
+    await writeFileAtomic(path.join(this.ticketPath(ticket), ANSWER_FILE), JSON.stringify({
+      ...answer,
+      finished_at: Date.now() / 1000
+    }) + '\n');
+  }
+
+  /**
+   * 查询工单状态，返回 { state: 'answered', answer } 或 { state: 'pending' }
+   * 已回答的工单在读取后删除；后台进程已退出却没有回答时抛出错误
+   */
+  async poll(ticket) {
+    const ticketPath = this.ticketPath(ticket);
+    if (fileExists(path.join(ticketPath, ANSWER_FILE))) {
+      return withLock(`${ticketPath}.lock`, 'exclusive', async () => {
+        const answer = await readJson(path.join(ticketPath, ANSWER_FILE));
+        if (!answer) {
+          throw new Error(`工单不存在或已被读取: ${ticket}`);
+        }
+        await fs.rm(ticketPath, { recursive: true, force: true });
+        return { state: 'answered', answer };
+      });
+    }
+    const question = await this.readQuestion(ticket);
+    if (question.runner_pid && !isProcessAlive(question.runner_pid)) {
+      // 进程退出前可能刚写完回答
+      if (fileExists(path.join(ticketPath, ANSWER_FILE))) {
+        return this.poll(ticket);
+      }
+      await fs.rm(ticketPath, { recursive: true, force: true });
+      throw new Error(`工单${ticket}的后台进程(${question.runner_pid})已退出，未得到回答`);
+    }
+    return { state: 'pending', question };
+  }
+
+  /**
+   * 等待工单被回答，最多等待timeoutMs毫秒，超时返回 { state: 'pending' }
+   */
+  async wait(ticket, timeoutMs) {
+    const ticketPath = this.ticketPath(ticket);
+    const deadline = Date.now() + timeoutMs;
+    let status = await this.poll(ticket);
+    if (status.state === 'answered' || timeoutMs <= 0) {
+      return status;
+    }
+
+    // 回答通过rename写入，监听工单目录即可及时得知；轮询用于兜底和检测后台进程退出
+    let wake = null;
+    let watcher = null;
+    try {
+      watcher = watch(ticketPath, () => wake && wake());
+      watcher.on('error', () => {});
+    } catch (error) {
+      watcher = null;
+    }
+    try {
+      while (status.state === 'pending' && Date.now() < deadline) {
+        await new Promise((resolve) => {
+          const timer = setTimeout(resolve, Math.min(WAIT_POLL_INTERVAL_MS, deadline - Date.now()));
+          wake = () => {
+            clearTimeout(timer);
+            resolve();
+          };
+        });
+        wake = null;
+        status = await this.poll(ticket);
+      }
+      return status;
+    } finally {
+      if (watcher) {
+        watcher.close();
+      }
+    }
+  }
+
+  /**
+   * 清理超过保留时间的工单
+   */
+  async prune(retentionMs = SPOOL_RETENTION_MS) {
+    let tickets;
+    try {
+      tickets = await fs.readdir(this.spoolPath);
+    } catch (error) {
+      return 0;
+    }
+    const expireBefore = Date.now() - retentionMs;
+    let removed = 0;
+    for (const ticket of tickets) {
+      const created = parseInt(ticket.split('-')[0], 36);
+      if (TICKET_PATTERN.test(ticket) && created < expireBefore) {
+        await fs.rm(path.join(this.spoolPath, ticket), { recursive: true, force: true });
+        removed++;
+      }
+    }
+    return removed;
+  }
+}
@@ -8,62 +8,578 @@
  */
 
 import { spawn } from 'child_process';
+import { randomUUID } from 'crypto';
+import * as net from 'net';
+import * as path from 'path';
+import { performance } from 'perf_hooks';
 import {
   generateTaskId,
-  getTaskFilePath,
   getRelativeTaskFilePath,
   getSleepDogPath,
+  getAskUserSocketPath,
   findAskUserScript,
   fileExists,
   readFile,
+  appendFile,
   setupErrorHandling,
   withErrorHandling,
   MESSAGES,
-  TASK_STATUS,
+  IS_WINDOWS,
+  ASK_USER_DIR,
+  parseResultFrames,
   formatNextStep} from './common.js';
+import { AnswerCache } from './answer-cache.js';
+import { TaskIndex, formatTaskStatus } from './task-index.js';
+import { AskSpool } from './ask-spool.js';
+import { AskControlServer, sendControlMessages } from './ask-control.js';
+
+// 连接常驻进程失败时回退到直接启动的错误码
+const SOCKET_FALLBACK_CODES = ['ENOENT', 'ECONNREFUSED', 'ENOTSOCK', 'EACCES'];
+
+// 结果帧写入的子进程fd（stdio中的第4个管道）
+const RESULT_FD = 3;
+
+// 控制消息写入的子进程fd（stdio中的第5个管道），使用--control时才创建
+const CONTROL_FD = 4;
+
+// --poll/--wait时工单尚未回答的退出码
+const PENDING_EXIT_CODE = 2;
+
+// 回答历史数据库（ask_user_ui.py --history），位于.sleepdog/.ask_user下
+const HISTORY_FILE = 'history.db';
+
+// 截止时间到期、返回默认回答时的退出码，与ask_user_ui.py的DEADLINE_EXIT_CODE一致
+const DEADLINE_EXIT_CODE = 3;
+
+// ask_user_ui.py自身的截止时间之外再等待的时间，之后由ask_user.js终止界面并返回默认回答
+const DEADLINE_GRACE_MS = 2000;
+
+// 带值的命令行选项：参数名 -> options字段
+const VALUE_OPTIONS = {
+  '--batch': 'batch',
+  '--poll': 'poll',
+  '--wait': 'wait',
+  '--timeout': 'timeout',
+  '--deadline': 'deadline',
+  '--deadline-default': 'deadlineDefault',
+  '--control': 'control',
+  '--send': 'send',
+  '--run-ticket': 'runTicket'
+};
+
+// 不带值的命令行选项：参数名 -> options字段
+const FLAG_OPTIONS = {
+  '--status': 'status',
+  '--async': 'async',
+  '--cache-list': 'cacheList',
+  '--cache-purge': 'cachePurge',
+  '--expired': 'expired'
+};
+
+// 解析命令行参数，返回选项和提示文字
+const parseArgs = (args) => {
+  const options = {};
+  const rest = [];
+  for (let i = 0; i < args.length; i++) {
+    const name = VALUE_OPTIONS[args[i]];
+    if (FLAG_OPTIONS[args[i]]) {
+      options[FLAG_OPTIONS[args[i]]] = true;
+    } else if (name) {
+      if (i + 1 >= args.length) {
+        throw new Error(`${args[i]} 需要一个参数`);
+      }
+      options[name] = args[++i];
+    } else {
+      rest.push(args[i]);
+    }
+  }
+  return { options, text: rest.join(' '), tips: rest.join(' ') || MESSAGES.DEFAULT_TIPS };
+};
+
+// 读取stdin的全部内容
+const readStdin = async () => {
+  const chunks = [];
+  for await (const chunk of process.stdin) {
+    chunks.push(chunk);
+  }
+  return Buffer.concat(chunks).toString('utf8');
+};
+
+// 截止时间：--deadline或环境变量ASK_USER_DEADLINE（秒），未设置时返回null
+const parseDeadline = (options) => {
+  const value = options.deadline ?? process.env.ASK_USER_DEADLINE;
+  if (!value) {
+    return null;
+  }
+  const seconds = Number(value);
+  if (!(seconds > 0)) {
+    throw new Error(`--deadline 需要一个正数秒数: ${value}`);
+  }
+  return {
+    seconds,
+    answer: options.deadlineDefault ?? MESSAGES.DEADLINE_DEFAULT,
+    // 未指定默认回答时，批量提问由ask_user_ui.py使用各问题的默认答案
+    explicitAnswer: options.deadlineDefault !== undefined
+  };
+};
 
 // 用户交互管理类
 class UserInteractionManager {
   constructor() {
     this.sleepDogPath = getSleepDogPath();
+    this.answerCache = new AnswerCache();
+    this.taskIndex = new TaskIndex();
+    this.spool = new AskSpool();
+    // 截止时间 { seconds, answer }，未设置时为null
+    this.deadline = null;
+    this.deadlineReached = false;
+    // --control打开的控制通道，提问期间转发控制消息
+    this.control = null;
   }
 
   // 主要的ask_user功能
   async askUser(args) {
-    const tips = args.join(' ') || MESSAGES.DEFAULT_TIPS;
-    var result = await this.interactiveInput(tips)
+    const { options, text, tips } = parseArgs(args);
+    this.deadline = parseDeadline(options);
+    if (options.status) {
+      console.log(formatTaskStatus(await this.taskIndex.summary(), await generateTaskId()));
+      return;
+    }
+    if (options.cacheList) {
+      await this.listCache();
+      return;
+    }
+    if (options.cachePurge) {
+      const count = await this.answerCache.purge(options.expired);
+      console.log(`已清除${count}条缓存的回答`);
+      return;
+    }
+    if (options.send) {
+      await this.sendControl(options.send, text);
+      return;
+    }
+    if (options.batch) {
+      this.printResult(await this.withControl(options.control, () => this.batchInput(options.batch)));
+      return;
+    }
+    if (options.runTicket) {
+      await this.withControl(options.control, () => this.runTicket(options.runTicket));
+      return;
+    }
+    if (options.async) {
+      const ticket = await this.submitAsync(tips, options.control);
+      console.log(ticket);
+      console.error(`[ask_user] 已提交异步提问，使用 ask_user --poll ${ticket} 或 ask_user --wait ${ticket} --timeout 秒数 获取回答`);
+      return;
+    }
+    if (options.poll || options.wait) {
+      await this.collectAnswer(options.poll || options.wait, options.wait ? options.timeout : 0);
+      return;
+    }
+    var result = await this.withControl(options.control, () => this.interactiveInput(tips));
+    this.printResult(result);
+  }
+
+  // 指定了控制通道名称时，提问期间接收ask_user --send发来的消息
+  async withControl(name, run) {
+    if (!name) {
+      return run();
+    }
+    if (IS_WINDOWS) {
+      console.error('[ask_user] Windows下暂不支持--control，已忽略');
+      return run();
+    }
+    this.control = new AskControlServer(name);
+    await this.control.listen();
+    try {
+      return await run();
+    } finally {
+      await this.control.close();
+      this.control = null;
+    }
+  }
+
+  // 向--control打开的窗口发送控制消息：参数为一条JSON消息，或作为一行状态文字；省略时从stdin读取JSON行
+  async sendControl(name, text) {
+    let lines;
+    if (!text) {
+      lines = (await readStdin()).split('\n');
+    } else if (text.trimStart().startsWith('{')) {
+      lines = [text];
+    } else {
+      lines = [JSON.stringify({ type: 'status', text })];
+    }
+    const reply = await sendControlMessages(name, lines);
+    for (const error of reply.errors) {
+      console.error(`[ask_user] ${error}`);
+    }
+    if (reply.errors.length > 0) {
+      process.exitCode = 1;
+    }
+  }
+
+  // 输出回答，任务全部完成时附加更新项目文档的提示；截止时间到期时以DEADLINE_EXIT_CODE退出
+  printResult(result) {
     console.log(result);
     if(result.startsWith(MESSAGES.TASK_COMPLETE)) {
       console.log(MESSAGES.TASK_COMPLETE_TIP);
     }
+    if (this.deadlineReached) {
+      process.exitCode = DEADLINE_EXIT_CODE;
+    }
+  }
+
+  // 异步提问：写入工单后在后台进程中打开界面，立即返回工单号
+  // 指定controlName时后台进程以该名称接收控制消息，未指定时不打开控制通道，可以复用常驻进程
+  async submitAsync(tips, controlName) {
+    const unfinishedTaskInfo = await this.checkUnfinishedTasks();
+    const ticket = await this.spool.create(tips, unfinishedTaskInfo);
+    const runnerArgs = [process.argv[1], '--run-ticket', ticket];
+    if (controlName) {
+      runnerArgs.push('--control', controlName);
+    }
+    if (this.deadline) {
+      runnerArgs.push('--deadline', String(this.deadline.seconds), '--deadline-default', this.deadline.answer);
+    }
+    const child = spawn(process.execPath, runnerArgs, {
+      detached: true,
+      stdio: 'ignore',
+      windowsHide: true
+    });
+    child.unref();
+    await this.spool.setRunner(ticket, child.pid);
+    return ticket;
+  }
+
+  // 后台进程：完成工单中的提问并原子写入回答
+  async runTicket(ticket) {
+    const question = await this.spool.readQuestion(ticket);
+    let uiSession = null;
+    try {
+      const result = await this.trackSession((session) => {
+        uiSession = session;
+        session.ticket = ticket;
+        return this.requestInput(question.prompt, session, question.stdin);
+      });
+      await this.spool.writeAnswer(ticket, { status: uiSession.ui_status || 'submitted', result });
+    } catch (error) {
+      const status = uiSession && uiSession.ui_status === 'cancelled' ? 'cancelled' : 'error';
+      await this.spool.writeAnswer(ticket, { status, message: error.message });
+    }
+  }
+
+  // 读取异步提问的回答；timeout为等待的秒数，未指定时一直等待
+  async collectAnswer(ticket, timeout) {
+    const timeoutMs = timeout === undefined ? Infinity : Number(timeout) * 1000;
+    if (Number.isNaN(timeoutMs) || timeoutMs < 0) {
+      throw new Error(`--timeout 需要一个非负的秒数: ${timeout}`);
+    }
+    const status = await this.spool.wait(ticket, timeoutMs);
+    if (status.state === 'pending') {
+      console.log(`[ask_user] 工单${ticket}尚未回答，稍后使用 ask_user --wait ${ticket} 获取`);
+      process.exitCode = PENDING_EXIT_CODE;
+      return;
+    }
+    const { answer } = status;
+    if (answer.status === 'cancelled') {
+      throw new Error('用户取消了输入');
+    }
+    if (answer.status === 'error') {
+      throw new Error(answer.message);
+    }
+    this.deadlineReached = answer.status === 'deadline';
+    this.printResult(answer.result);
   }
 
   // 交互式输入处理
   async interactiveInput(tips) {
-    // 先检查未完成任务
-    const unfinishedTaskInfo = await this.checkUnfinishedTasks();
+    return this.trackSession((session) => this.requestInput(tips, session));
+  }
+
+  // 批量提问：多个问题在一个窗口中回答，输出JSON答案
+  async batchInput(batchFile) {
+    const spec = await readFile(batchFile);
+    try {
+      JSON.parse(spec);
+    } catch (error) {
+      throw new Error(`${batchFile} 不是有效的JSON: ${error.message}`);
+    }
+    return this.trackSession((session) => this.spawnInput(['--batch'], spec, session));
+  }
+
+  // 列出缓存的回答
+  async listCache() {
+    const entries = await this.answerCache.list();
+    const { rules } = this.answerCache.data;
+    console.log(`缓存文件: ${this.answerCache.cachePath}`);
+    console.log(`规则: ${rules.length ? rules.map((rule) => `${rule.prompt} (ttl ${rule.ttl || 3600}s)`).join(', ') : '无（缓存未启用）'}`);
+    const now = Date.now() / 1000;
+    for (const entry of entries) {
+      const state = entry.expires_at <= now ? '已过期' : `剩余${Math.round(entry.expires_at - now)}s`;
+      console.log(`${entry.key.slice(0, 12)}  ${state}  命中${entry.hits}次  ${entry.size}B  ${JSON.stringify(entry.prompt)} -> ${JSON.stringify(entry.answer)}`);
+    }
+    console.log(`共${entries.length}条`);
+  }
+
+  // 执行一次提问并记录会话耗时
+  async trackSession(run) {
+    // 设置ASK_USER_METRICS时记录本次会话耗时，与ask_user_ui.py的记录通过sessionId关联
+    const session = {
+      source: 'ask_user.js',
+      session_id: randomUUID(),
+      started_at: Date.now() / 1000,
+      transport: 'spawn',
+      status: 'error'
+    };
+    const startTime = performance.now();
+    try {
+      const result = await run(session);
+      session.status = 'ok';
+      return result;
+    } finally {
+      session.spawn_to_exit_ms = Math.round((performance.now() - startTime) * 1000) / 1000;
+      await this.recordMetrics(session);
+    }
+  }
+
+  // 优先使用回答缓存，否则选择常驻进程或新进程完成提问
+  // unfinishedTaskInfo未传入时检查未完成的任务（异步提问在提交时已检查）
+  async requestInput(tips, session, unfinishedTaskInfo = null) {
+    if (unfinishedTaskInfo === null) {
+      unfinishedTaskInfo = await this.checkUnfinishedTasks();
+    }
     
+    // 配置了匹配的缓存规则时，相同的提示和stdin内容直接返回缓存的回答，不打开窗口
+    const cached = await this.answerCache.lookup(tips, unfinishedTaskInfo);
+    session.cache = cached.status;
+    if (cached.status === 'hit') {
+      session.transport = 'cache';
+      console.error(`[ask_user] 命中回答缓存 ${cached.key.slice(0, 12)}（${cached.expiresIn}s后过期）`);
+      return `${cached.answer}\n`;
+    }
+    const result = await this.requestUI(tips, unfinishedTaskInfo, session);
+    // 截止时间到期返回的默认回答不记入缓存
+    if (cached.status === 'miss' && !this.deadlineReached) {
+      await this.answerCache.store(cached, tips, result.replace(/\n$/, ''));
+      console.error(`[ask_user] 未命中回答缓存，已记录本次回答 ${cached.key.slice(0, 12)}`);
+    }
+    return result;
+  }
+
+  // 打开界面提问；设置了截止时间时，界面超过截止时间加宽限仍未返回则终止并返回默认回答
+  async requestUI(tips, unfinishedTaskInfo, session) {
+    if (!this.deadline) {
+      return this.openUI(tips, unfinishedTaskInfo, session);
+    }
+    const controller = new AbortController();
+    let timer = null;
+    const expired = new Promise((resolve) => {
+      timer = setTimeout(() => {
+        controller.abort();
+        session.ui_status = 'deadline';
+        session.deadline_enforced_by = 'ask_user.js';
+        this.deadlineReached = true;
+        console.error(`[ask_user] 超过截止时间${this.deadline.seconds}s，返回默认回答`);
+        resolve(`${this.deadline.answer}\n`);
+      }, this.deadline.seconds * 1000 + DEADLINE_GRACE_MS);
+    });
+    try {
+      return await Promise.race([this.openUI(tips, unfinishedTaskInfo, session, controller.signal), expired]);
+    } finally {
+      clearTimeout(timer);
+    }
+  }
+
+  // 打开界面（常驻进程或新进程）提问
+  async openUI(tips, unfinishedTaskInfo, session, signal) {
+    // 优先复用常驻的ask_user_ui.py --serve进程，避免每次冷启动python3和Tk
+    // 常驻进程不接收控制消息，使用控制通道时直接启动新进程
+    const socketPath = getAskUserSocketPath();
+    if (!IS_WINDOWS && !this.control && fileExists(socketPath)) {
+      try {
+        session.transport = 'socket';
+        return await this.requestFromServer(socketPath, tips, unfinishedTaskInfo, session, signal);
+      } catch (error) {
+        if (!SOCKET_FALLBACK_CODES.includes(error.code)) {
+          throw error;
+        }
+        session.transport = 'spawn';
+      }
+    }
+    
+    return this.spawnInput([tips], unfinishedTaskInfo, session, signal);
+  }
+
+  // 追加写入本次会话的metrics记录
+  async recordMetrics(session) {
+    const metricsPath = process.env.ASK_USER_METRICS;
+    if (!metricsPath) {
+      return;
+    }
+    try {
+      await appendFile(metricsPath, JSON.stringify(session) + '\n');
+    } catch (error) {
+      console.error(`写入metrics失败: ${error.message}`);
+    }
+  }
+
+  // 回答历史数据库路径：ASK_USER_HISTORY（off为不记录），未设置时为.sleepdog/.ask_user/history.db（未初始化时不记录）
+  getHistoryPath() {
+    const configured = process.env.ASK_USER_HISTORY;
+    if (configured) {
+      return configured === 'off' ? null : configured;
+    }
+    return fileExists(this.sleepDogPath) ? path.join(this.sleepDogPath, ASK_USER_DIR, HISTORY_FILE) : null;
+  }
+
+  // 根据结果帧中的状态返回结果或抛出错误
+  settleFrames(frames, session) {
+    session.ui_status = frames.status;
+    switch (frames.status) {
+      case 'submitted':
+      case 'auto_submitted':
+      case 'closed':
+        return `${frames.result}\n`;
+      case 'deadline':
+        this.deadlineReached = true;
+        return `${frames.result}\n`;
+      case 'cancelled':
+        throw new Error('用户取消了输入');
+      default:
+        throw new Error(frames.message || `ask_user_ui.py返回未知状态: ${frames.status}`);
+    }
+  }
+
+  // 通过本地socket向常驻进程提问
+  requestFromServer(socketPath, tips, unfinishedTaskInfo, session, signal) {
+    return new Promise((resolve, reject) => {
+      const socket = net.createConnection(socketPath);
+      const chunks = [];
+      if (signal) {
+        signal.addEventListener('abort', () => socket.destroy(), { once: true });
+      }
+
+      // 发送请求后不关闭写入端：常驻进程检测到连接断开（被终止或超过截止时间）时放弃本次提问
+      socket.on('connect', () => {
+        // cwd用于窗口标题，常驻进程自身的工作目录与提问方无关
+        const request = { prompt: tips, stdin: unfinishedTaskInfo || '', history: this.getHistoryPath(), cwd: process.cwd() };
+        if (this.deadline) {
+          request.deadline = this.deadline.seconds;
+          request.deadline_default = this.deadline.answer;
+        }
+        socket.write(JSON.stringify(request) + '\n');
+      });
+      socket.on('data', (data) => {
+        chunks.push(data);
+      });
+      socket.on('end', () => {
+        let frames;
+        try {
+          frames = parseResultFrames(Buffer.concat(chunks));
+        } catch (error) {
+          reject(new Error(`常驻进程响应无效: ${error.message}`));
+          return;
+        }
+        if (!frames) {
+          reject(new Error('常驻进程响应无效: 缺少状态帧'));
+          return;
+        }
+        try {
+          resolve(this.settleFrames(frames, session));
+        } catch (error) {
+          reject(error);
+        }
+      });
+      socket.on('error', (error) => {
+        reject(error);
+      });
+    });
+  }
+
+  // 启动ask_user_ui.py进程提问
+  async spawnInput(uiArgs, stdinContent, session, signal) {
     // 查找ask_user_ui.py文件的位置
     const askUserScript = findAskUserScript();
+    const args = [askUserScript, ...uiArgs];
+    if (process.env.ASK_USER_METRICS) {
+      args.push('--metrics', process.env.ASK_USER_METRICS, '--session-id', session.session_id);
+    }
+    // 结果通过独立的fd以帧的形式返回，不再依赖退出码和stderr判断状态
+    // Windows下不支持额外的管道fd，仍使用stdout
+    const useResultFd = !IS_WINDOWS;
+    if (useResultFd) {
+      args.push('--result-fd', String(RESULT_FD));
+    }
+    // Windows下不会打开控制通道（见withControl）
+    const stdio = useResultFd ? ['pipe', 'pipe', 'pipe', 'pipe'] : 'pipe';
+    if (this.control) {
+      args.push('--control-fd', String(CONTROL_FD));
+      stdio.push('pipe');
+    }
+    const historyPath = uiArgs.includes('--batch') ? null : this.getHistoryPath();
+    if (historyPath) {
+      args.push('--history', historyPath);
+    }
+    if (this.deadline) {
+      args.push('--deadline', String(this.deadline.seconds));
+      if (!uiArgs.includes('--batch') || this.deadline.explicitAnswer) {
+        args.push('--deadline-default', this.deadline.answer);
+      }
+    }
     
     // 使用spawn方式直接通过stdin传递数据
     return new Promise((resolve, reject) => {
-      const child = spawn("python3", [askUserScript, tips]);
+      const child = spawn("python3", args, {
+        stdio,
+        signal,
+        killSignal: 'SIGKILL'
+      });
       
-      let stdout = '';
-      let stderr = '';
+      const stdoutChunks = [];
+      const stderrChunks = [];
+      const resultChunks = [];
       
       child.stdout.on('data', (data) => {
-        stdout += data.toString();
+        stdoutChunks.push(data);
       });
       
       child.stderr.on('data', (data) => {
-        stderr += data.toString();
+        stderrChunks.push(data);
       });
       
+      if (useResultFd) {
+        child.stdio[RESULT_FD].on('data', (data) => {
+          resultChunks.push(data);
+        });
+      }
+      
+      const control = this.control;
+      if (control) {
+        control.attach(child.stdio[CONTROL_FD]);
+      }
+      
       child.on('close', (code) => {
-        if (code === 0) {
-          resolve(stdout);
+        session.exit_code = code;
+        if (control) {
+          control.detach();
+        }
+        const stderr = Buffer.concat(stderrChunks).toString('utf8');
+        let frames = null;
+        try {
+          frames = parseResultFrames(Buffer.concat(resultChunks));
+        } catch (error) {
+          reject(new Error(`ask_user_ui.py结果无效: ${error.message}`));
+          return;
+        }
+        if (frames) {
+          try {
+            resolve(this.settleFrames(frames, session));
+          } catch (error) {
+            reject(error);
+          }
+        } else if (code === 0 || code === DEADLINE_EXIT_CODE) {
+          this.deadlineReached = code === DEADLINE_EXIT_CODE;
+          resolve(Buffer.concat(stdoutChunks).toString('utf8'));
         } else {
           reject(new Error(`Process exited with code ${code}: ${stderr}`));
         }
@@ -73,9 +589,9 @@ class UserInteractionManager {
         reject(error);
       });
       
-      // 将未完成任务信息写入stdin
-      if(unfinishedTaskInfo) {
-        child.stdin.write(unfinishedTaskInfo);
+      // 将未完成任务信息（或批量问题）写入stdin
+      if(stdinContent) {
+        child.stdin.write(stdinContent);
       }
       child.stdin.end();
     });
@@ -87,21 +603,12 @@ class UserInteractionManager {
       return "继续";
     }
     const taskId = await generateTaskId();
-    const taskFile = await getTaskFilePath(taskId);
     const relativeTaskFile = await getRelativeTaskFilePath(taskId);
 
-    if (!fileExists(taskFile)) {
-      return MESSAGES.TASK_COMPLETE;
-    }
-
-    const content = await readFile(taskFile);
-    const lines = content.split('\n');
-
-    // 查找未完成的任务
-    for (const line of lines) {
-      if (line.includes(TASK_STATUS.PENDING)) {
-        return formatNextStep(`完成${relativeTaskFile}中尚未完成的任务：\n${line.trim()}\n`);
-      }
+    // 通过任务索引定位首个未完成的任务，文件未变化时无需重新读取
+    const line = await this.taskIndex.firstPending(taskId);
+    if (line !== null) {
+      return formatNextStep(`完成${relativeTaskFile}中尚未完成的任务：\n${line.trim()}\n`);
     }
     return MESSAGES.TASK_COMPLETE;
   }
@@ -4,33 +4,209 @@
 import sys
 import os
 import argparse
-import tkinter as tk
-from tkinter import messagebox
 import threading
 import select
+import math
+import codecs
+import mmap
+import tracemalloc
+import re
+from array import array
 import time
+PROCESS_START = time.perf_counter()
+import socket
+import json
+import queue
+import struct
+import hashlib
+import tempfile
+import signal
+from difflib import SequenceMatcher
 sys.stdout.reconfigure(encoding='utf-8')
 
+# tkinter按需导入（见load_tkinter），终端模式下不承担其导入开销
+tk = None
+messagebox = None
+
+
+def load_tkinter():
+    """导入tkinter并注册为模块级名称"""
+    global tk, messagebox
+    if tk is None:
+        import tkinter
+        import tkinter.font
+        from tkinter import messagebox as tk_messagebox
+        tk, messagebox = tkinter, tk_messagebox
+        metrics.mark('tk_imported')
+    return tk
+
+
+class SessionMetrics:
+    """一次提问会话的延迟数据（--metrics），结束时以一行JSON追加写入指定文件
+
+    时间点均为相对进程启动（模块导入）的毫秒数；未启用时所有记录调用直接返回。
+    """
+
+    def __init__(self):
+        self.path = None
+        self.record = {}
+        self.written = False
+        self.write_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def enable(self, path, session_id=None):
+        self.path = path
+        self.record = {
+            'source': 'ask_user_ui.py',
+            'session_id': session_id,
+            'pid': os.getpid(),
+            'started_at': time.time(),
+            'interpreter_startup_ms': self.interpreter_startup_ms(),
+            'marks': {},
+        }
+        tracemalloc.start()
+
+    @staticmethod
+    def interpreter_startup_ms():
+        """Linux下通过/proc计算进程创建到本模块导入的耗时，其他系统返回None"""
+        try:
+            with open('/proc/self/stat') as f:
+                start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+            with open('/proc/uptime') as f:
+                uptime = float(f.read().split()[0])
+            age = uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+            return round((age - (time.perf_counter() - PROCESS_START)) * 1000, 1)
+        except (OSError, ValueError, IndexError, AttributeError):
+            return None
+
+    def mark(self, name):
+        """记录时间点，同名时间点只记录第一次"""
+        if self.enabled and name not in self.record['marks']:
+            self.record['marks'][name] = round((time.perf_counter() - PROCESS_START) * 1000, 3)
+
+    def set(self, key, value):
+        if self.enabled:
+            self.record.setdefault(key, value)
+
+    def write(self):
+        """写入本次会话的记录，只写入一次（截止时间到期时由watchdog线程写入）"""
+        with self.write_lock:
+            if not self.enabled or self.written:
+                return
+            self.written = True
+        self.record['tracemalloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        try:
+            import resource
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # macOS以字节为单位，Linux以KB为单位
+            self.record['peak_rss_kb'] = max_rss // 1024 if sys.platform == 'darwin' else max_rss
+        except ImportError:
+            self.record['peak_rss_kb'] = None
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.record, ensure_ascii=False) + '\n')
+        except OSError as e:
+            print(f"写入metrics失败: {e}", file=sys.stderr)
+
+
+metrics = SessionMetrics()
+
+
+def has_display():
+    """判断当前环境是否有可用的图形显示，无需导入tkinter"""
+    if os.name == 'nt' or sys.platform == 'darwin':
+        return True
+    return bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+
+# 单独按下时不视为编辑的修饰键
+MODIFIER_KEYS = ('Control_L', 'Control_R', 'Alt_L', 'Alt_R', 'Shift_L', 'Shift_R')
+
+
+class UIEventDispatcher:
+    """把高频界面事件合并为每帧最多一次的回调
+
+    同名请求在同一帧内只保留最后一个回调，帧结束时按请求顺序执行。
+    """
+    FRAME_MS = 16
+
+    def __init__(self, root):
+        self.root = root
+        self.pending = {}
+        self.after_id = None
+        self.stats = {}  # 名称 -> [请求次数, 实际执行次数]
+
+    def request(self, name, callback):
+        self.pending[name] = callback
+        self.stats.setdefault(name, [0, 0])[0] += 1
+        if self.after_id is None:
+            self.after_id = self.root.after(self.FRAME_MS, self.flush)
+
+    def flush(self):
+        self.after_id = None
+        pending, self.pending = self.pending, {}
+        for name, callback in pending.items():
+            self.stats[name][1] += 1
+            callback()
+
+
 class ModernPromptInputWindow:
-    def __init__(self, prompt_text, stdin_content=None, countdown_seconds=60):
+    HINT_TEXT = "💡 Ctrl+Enter 提交  •  Esc 取消"
+    HISTORY_HINT_TEXT = "  •  Ctrl+R 历史回答"
+    # stdin分块插入：每次最多合并的块数及队列为空时的轮询间隔
+    STDIN_BATCH_CHUNKS = 16
+    STDIN_POLL_MS = 30
+    # 控制消息每次最多应用的条数及队列为空时的轮询间隔
+    CONTROL_BATCH_MESSAGES = 64
+    CONTROL_POLL_MS = 50
+    # 状态区最多保留的行数
+    STATUS_MAX_LINES = 200
+
+    def __init__(self, prompt_text, stdin_content=None, countdown_seconds=60, on_finish=None,
+                 stdin_stream=None, preview_file=None, keep_original=False, history=None):
         self.result = None
+        self.end_reason = None  # submit / auto_submit / cancel
         self.root = tk.Tk()
-        self.stdin_content = stdin_content  # 存储从stdin读取的内容
+        self.preview_file = preview_file  # --file模式下只读预览的MappedTextFile
+        self.window_size = self.get_window_size()
+        self.stdin_content = stdin_content  # 待插入的stdin内容，插入文本框后即释放
+        self.has_stdin_content = False  # 文本框中是否为stdin预填内容
+        self.stdin_stream = None  # 正在加载的StdinStreamReader
+        self.control = None  # 接收控制消息的ControlChannelReader
+        self.status_area = None  # 控制消息追加的只读状态区，收到第一条状态时创建
+        self.history = history  # Ctrl+R搜索的AnswerHistory，数据库在首次搜索时才打开
+        self.history_panel = None
+        # --output diff时保留预填内容的副本，用于提交时计算差异
+        self.original_parts = [] if keep_original else None
+        # 常驻模式下的结束回调，设置后窗口在提交/取消时只隐藏不销毁
+        self.on_finish = on_finish
         
         # 倒计时设置
         self.countdown_total_seconds = max(0, int(countdown_seconds or 0))
         self.countdown_remaining_seconds = self.countdown_total_seconds
         self.countdown_active = False
         self.countdown_after_id = None
+        self.countdown_ends_at = None  # 倒计时结束的单调时钟时间，避免逐秒累减产生漂移
+        # 一次性闩锁：倒计时被用户交互终止后，后续按键/修改/鼠标事件直接忽略
+        self.countdown_cancelled = False
         # 程序化内容更新标记，避免误触发倒计时终止
         self.is_programmatic_update = False
         
+        # 合并高频界面事件，每帧最多执行一次布局
+        self.dispatcher = UIEventDispatcher(self.root)
+        # 滚动条当前是否已显示，只在可见性真正变化时重新pack
+        self.scrollbar_visible = {'v': False, 'h': False}
+        self.geometry_passes = 0
+        
         # 获取当前目录名称作为标题
         current_dir = os.path.basename(os.getcwd())
         self.root.title(f"💻 {current_dir} ")
 
         
-        self.root.geometry("600x450")  # 增加高度以适应自定义标题栏
+        self.root.geometry("{}x{}".format(*self.window_size))  # 增加高度以适应自定义标题栏
         
         # 全局置顶
         self.root.attributes("-topmost", True)
@@ -68,47 +244,105 @@ class ModernPromptInputWindow:
         # 在界面创建完成后居中显示
         self.center_window()
         
+        metrics.mark('window_ready')
+        self.text_area.bind('<Expose>', self.on_first_paint, add='+')
+        
+        # 常驻模式：预先构建好窗口后隐藏，等待present()
+        if self.on_finish is not None:
+            self.root.withdraw()
+            return
+        
         # 如果有stdin内容，设置到文本框中
         if self.stdin_content:
             self.root.after(100, self.set_stdin_content)
+        elif stdin_stream is not None:
+            self.attach_stdin_stream(stdin_stream)
         
         # 启动倒计时（如果需要）
         if self.countdown_total_seconds > 0:
             self.start_countdown()
     
+    def get_window_size(self):
+        """窗口宽高，--file模式下加大以容纳预览区"""
+        return (800, 700) if self.preview_file is not None else (600, 450)
+    
     def set_stdin_content(self):
         """将stdin内容设置到文本框中并全选"""
         if self.stdin_content:
+            content, self.stdin_content = self.stdin_content, None
+            self.append_stdin_text(content)
+            self.on_stdin_loaded()
+    
+    def attach_stdin_stream(self, stdin_stream):
+        """开始从后台读取线程接收stdin内容，窗口无需等待读取完成即可显示"""
+        self.stdin_stream = stdin_stream
+        self.root.after(0, self.pump_stdin_stream)
+    
+    def pump_stdin_stream(self):
+        """从队列中批量取出已读取的块并插入文本框"""
+        if self.stdin_stream is None:
+            return
+        batch = []
+        finished = False
+        for _ in range(self.STDIN_BATCH_CHUNKS):
+            try:
+                chunk = self.stdin_stream.chunks.get_nowait()
+            except queue.Empty:
+                break
+            if chunk is None:
+                finished = True
+                break
+            batch.append(chunk)
+        
+        if batch:
+            self.append_stdin_text(''.join(batch))
+        if finished:
+            self.stdin_stream = None
+            self.on_stdin_loaded()
+            return
+        # 队列中还有数据时尽快继续，否则稍后轮询
+        self.root.after(1 if batch else self.STDIN_POLL_MS, self.pump_stdin_stream)
+    
+    def append_stdin_text(self, text):
+        """将一段stdin内容追加到文本框末尾（程序化更新，不进入撤销栈也不终止倒计时）"""
+        if not self.has_stdin_content:
             # 先设置为非占位符状态，防止focus事件干扰
             self.is_placeholder = False
-            
-            # 直接清除所有内容并设置正常文字颜色
+            self.has_stdin_content = True
             self.text_area.delete('1.0', 'end')
             self.text_area.config(fg='#d4d4d4')  # 恢复正常文字颜色
-            
-            # 插入stdin内容
-            self.text_area.insert('1.0', self.stdin_content)
-            # 插入为程序化更新，重置modified状态
-            try:
-                self.text_area.edit_modified(False)
-            except Exception:
-                pass
-            
-            # 全选内容
-            self.text_area.tag_remove('sel', '1.0', 'end')
-            lines = self.stdin_content.split('\n')
-            last_line = len(lines)
-            last_char = len(lines[-1])
-            end_pos = f"{last_line}.{last_char}"
-            self.text_area.tag_add('sel', '1.0', end_pos)
-            self.text_area.mark_set('insert', end_pos)
-            
-            # 设置焦点到文本框
-            self.text_area.focus_set()
+        
+        if self.original_parts is not None:
+            self.original_parts.append(text)
+        self.text_area.config(undo=False)
+        self.text_area.insert('end-1c', text)
+        self.text_area.config(undo=True)
+        # 插入为程序化更新，重置modified状态
+        try:
+            self.text_area.edit_modified(False)
+        except Exception:
+            pass
+    
+    def on_stdin_loaded(self):
+        """stdin内容全部插入后全选，方便用户直接覆盖输入"""
+        if not self.has_stdin_content:
+            return
+        self.text_area.tag_remove('sel', '1.0', 'end')
+        self.text_area.tag_add('sel', '1.0', 'end-1c')
+        self.text_area.mark_set('insert', 'end-1c')
+        
+        # 设置焦点到文本框
+        self.text_area.focus_set()
+    
+    def original_content(self):
+        """预填内容的副本（未设置keep_original时为None）"""
+        if self.original_parts is None:
+            return None
+        return ''.join(self.original_parts)
     
     def center_window(self):
         self.root.update_idletasks()
-        width, height = 600, 450
+        width, height = self.window_size
         x = (self.root.winfo_screenwidth() // 2) - (width // 2)
         y = (self.root.winfo_screenheight() // 2) - (height // 2)
         self.root.geometry(f"{width}x{height}+{x}+{y}")
@@ -125,6 +359,7 @@ class ModernPromptInputWindow:
                               bg='#2d2d30', fg='#569cd6',
                               anchor='w')
         title_label.pack(side='left', padx=10, pady=5)
+        self.title_label = title_label
         
         # 关闭按钮
         close_btn = tk.Button(titlebar_frame, text="✕", 
@@ -211,12 +446,60 @@ class ModernPromptInputWindow:
         content_frame.pack(fill='both', expand=True)
         
         # 提示标签 - 使用编程工具常见的蓝色，支持自动换行
-        prompt_label = tk.Label(content_frame, text=f"💻 {prompt_text}", 
+        self.prompt_label = tk.Label(content_frame, text=f"💻 {prompt_text}", 
                                font=('Consolas', 13, 'normal'), 
                                bg='#2d2d30', fg='#569cd6',
                                anchor='w', justify='left',
                                wraplength=560)  # 设置自动换行宽度
-        prompt_label.pack(anchor='w', pady=(0, 15), fill='x')
+        self.prompt_label.pack(anchor='w', pady=(0, 15), fill='x')
+        
+        # 输入区域
+        self.create_input_area(content_frame)
+        
+        # 底部信息和按钮区域
+        info_frame = tk.Frame(content_frame, bg='#2d2d30')
+        info_frame.pack(fill='x', pady=(5, 0))
+        
+        # 提示信息 - 简化快捷键提示
+        self.hint_label = tk.Label(info_frame, 
+                             text=self.hint_text(),
+                             font=('Consolas', 9), 
+                             bg='#2d2d30', fg='#808080')
+        self.hint_label.pack(side='left')
+        
+        # 按钮区域
+        button_frame = tk.Frame(info_frame, bg='#2d2d30')
+        button_frame.pack(side='right')
+        
+        # 取消按钮 - 灰色主题
+        cancel_btn = tk.Button(button_frame, text="取消", command=self.on_cancel,
+                              font=('Consolas', 10), width=8,
+                              bg='#3e3e42', fg='#cccccc',
+                              relief='flat', bd=1,
+                              activebackground='#4e4e52',
+                              activeforeground='#ffffff',
+                              cursor='hand2')
+        cancel_btn.pack(side='right', padx=(10, 0))
+        
+        # 完成按钮 - 蓝色主题
+        self.submit_btn = tk.Button(button_frame, text="完成", command=self.on_submit,
+                              font=('Consolas', 10, 'bold'), width=12,
+                              bg='#007acc', fg='white',
+                              relief='flat', bd=1,
+                              activebackground='#005a9e',
+                              activeforeground='#ffffff',
+                              cursor='hand2')
+        self.submit_btn.pack(side='right')
+        
+        # 初始更新按钮文案（可能包含倒计时）
+        self.update_submit_button_label()
+    
+    def create_input_area(self, content_frame):
+        """创建文本输入区域（批量提问窗口会覆盖此方法）"""
+        # --file模式：只读预览区，下方的文本框作为回复区
+        if self.preview_file is not None:
+            self.preview_pane = FilePreviewPane(content_frame, self.preview_file)
+            self.preview_pane.frame.pack(fill='both', expand=True, pady=(0, 15))
         
         # 文本输入区域容器
         text_container = tk.Frame(content_frame, bg='#1e1e1e', relief='solid', bd=1)
@@ -254,78 +537,48 @@ class ModernPromptInputWindow:
         # 布局
         self.text_area.pack(side='left', fill='both', expand=True)
         
-        # 底部信息和按钮区域
-        info_frame = tk.Frame(content_frame, bg='#2d2d30')
-        info_frame.pack(fill='x', pady=(5, 0))
-        
-        # 提示信息 - 简化快捷键提示
-        hint_label = tk.Label(info_frame, 
-                             text="💡 Ctrl+Enter 提交  •  Esc 取消  •  Ctrl+A 全选",
-                             font=('Consolas', 9), 
-                             bg='#2d2d30', fg='#808080')
-        hint_label.pack(side='left')
-        
-        # 按钮区域
-        button_frame = tk.Frame(info_frame, bg='#2d2d30')
-        button_frame.pack(side='right')
-        
-        # 取消按钮 - 灰色主题
-        cancel_btn = tk.Button(button_frame, text="取消", command=self.on_cancel,
-                              font=('Consolas', 10), width=8,
-                              bg='#3e3e42', fg='#cccccc',
-                              relief='flat', bd=1,
-                              activebackground='#4e4e52',
-                              activeforeground='#ffffff',
-                              cursor='hand2')
-        cancel_btn.pack(side='right', padx=(10, 0))
-        
-        # 完成按钮 - 蓝色主题
-        self.submit_btn = tk.Button(button_frame, text="完成", command=self.on_submit,
-                              font=('Consolas', 10, 'bold'), width=12,
-                              bg='#007acc', fg='white',
-                              relief='flat', bd=1,
-                              activebackground='#005a9e',
-                              activeforeground='#ffffff',
-                              cursor='hand2')
-        self.submit_btn.pack(side='right')
-        
         # 占位符设置
         self.placeholder_text = "在此输入您的内容..."
         self.is_placeholder = True
         self.show_placeholder()
-        
-        # 初始更新按钮文案（可能包含倒计时）
-        self.update_submit_button_label()
     
     def on_text_scroll_v(self, *args):
         """垂直滚动条回调，自动显示/隐藏"""
         self.scrollbar_v.set(*args)
-        self.auto_show_hide_scrollbars()
+        self.request_scrollbar_layout()
     
     def on_text_scroll_h(self, *args):
         """水平滚动条回调，自动显示/隐藏"""
         self.scrollbar_h.set(*args)
-        self.auto_show_hide_scrollbars()
+        self.request_scrollbar_layout()
+    
+    def request_scrollbar_layout(self, event=None):
+        """请求一次滚动条布局检查，同一帧内的多次请求合并为一次"""
+        self.dispatcher.request('scrollbars', self.auto_show_hide_scrollbars)
     
     def auto_show_hide_scrollbars(self):
         """自动显示/隐藏滚动条"""
         # 检查是否需要垂直滚动条
         v_pos = self.scrollbar_v.get()
-        if v_pos[0] <= 0.0 and v_pos[1] >= 1.0:
-            # 不需要垂直滚动条
-            self.scrollbar_v.pack_forget()
-        else:
-            # 需要垂直滚动条
-            self.scrollbar_v.pack(side='right', fill='y')
+        self.set_scrollbar_visible('v', not (v_pos[0] <= 0.0 and v_pos[1] >= 1.0))
         
         # 检查是否需要水平滚动条
         h_pos = self.scrollbar_h.get()
-        if h_pos[0] <= 0.0 and h_pos[1] >= 1.0:
-            # 不需要水平滚动条
-            self.scrollbar_h.pack_forget()
+        self.set_scrollbar_visible('h', not (h_pos[0] <= 0.0 and h_pos[1] >= 1.0))
+    
+    def set_scrollbar_visible(self, axis, visible):
+        """只在可见性变化时pack/pack_forget，避免无谓的重新布局"""
+        if self.scrollbar_visible[axis] == visible:
+            return
+        self.scrollbar_visible[axis] = visible
+        self.geometry_passes += 1
+        scrollbar = self.scrollbar_v if axis == 'v' else self.scrollbar_h
+        if not visible:
+            scrollbar.pack_forget()
+        elif axis == 'v':
+            scrollbar.pack(side='right', fill='y')
         else:
-            # 需要水平滚动条
-            self.scrollbar_h.pack(side='bottom', fill='x')
+            scrollbar.pack(side='bottom', fill='x')
     
     def setup_bindings(self):
         # 绑定事件
@@ -335,7 +588,7 @@ class ModernPromptInputWindow:
         self.root.protocol("WM_DELETE_WINDOW", self.on_cancel)
         
         # 鼠标进入窗口终止倒计时（按需）。不在获得焦点时终止，避免初始显示即终止
-        self.root.bind('<Enter>', lambda e: self.terminate_countdown())
+        self.root.bind('<Enter>', lambda e: self.terminate_countdown('mouse_enter'))
         
         # 添加撤销重做快捷键
         self.root.bind('<Control-z>', lambda e: self.undo_text())
@@ -344,6 +597,8 @@ class ModernPromptInputWindow:
         
         # 自定义全选功能
         self.text_area.bind('<Control-a>', self.select_all_text)
+        # 搜索历史回答
+        self.text_area.bind('<Control-r>', self.open_history_search)
         
         # 文本框事件绑定
         self.text_area.bind('<FocusIn>', self.on_text_focus_in)
@@ -353,8 +608,8 @@ class ModernPromptInputWindow:
         self.text_area.bind('<<Modified>>', self.on_text_modified)
         
         # 绑定文本变化事件，用于滚动条自动显示/隐藏
-        self.text_area.bind('<Configure>', lambda e: self.root.after_idle(self.auto_show_hide_scrollbars))
-        self.text_area.bind('<KeyRelease>', lambda e: self.root.after_idle(self.auto_show_hide_scrollbars))
+        self.text_area.bind('<Configure>', self.request_scrollbar_layout)
+        self.text_area.bind('<KeyRelease>', self.request_scrollbar_layout)
         
         # 默认选中所有文本
         self.root.after(100, self.select_initial_text)
@@ -379,55 +634,79 @@ class ModernPromptInputWindow:
     
     def on_text_focus_in(self, event):
         """文本框获得焦点时"""
-        if self.is_placeholder and not self.stdin_content:
+        if self.is_placeholder and not self.has_stdin_content:
             self.clear_placeholder()
     
     def on_text_focus_out(self, event):
         """文本框失去焦点时"""
-        content = self.text_area.get('1.0', 'end-1c').strip()
-        if not content and not self.stdin_content:
+        if not self.has_stdin_content and not self.is_placeholder and self.is_blank():
             self.show_placeholder()
     
+    def is_blank(self):
+        """内容是否为空或只有空白字符
+
+        先用end-1c与1.0比较判断空缓冲区，否则从头查找第一个非空白字符，
+        正常内容下立即命中，无需复制整个缓冲区。
+        """
+        if self.text_area.compare('end-1c', '==', '1.0'):
+            return True
+        return not self.text_area.search(r'\S', '1.0', 'end-1c', regexp=True)
+    
+    def is_placeholder_content(self):
+        """内容是否为占位符文本；内容长度超过占位符时直接返回False，不读取缓冲区"""
+        if self.is_placeholder:
+            return True
+        limit = len(self.placeholder_text) + 64
+        if self.text_area.compare(f'1.0+{limit}c', '<', 'end-1c'):
+            return False
+        return self.text_area.get('1.0', 'end-1c').strip() == self.placeholder_text.strip()
+    
+    def on_first_paint(self, event):
+        metrics.mark('first_paint')
+    
     def on_key_press(self, event):
         """处理按键事件"""
+        metrics.mark('first_keystroke')
         # 处理Ctrl+Return组合键
         if event.keysym == 'Return' and event.state & 0x4:  # Control键被按下
             self.handle_ctrl_enter(event)
             return "break"
         
+        # 倒计时已终止且没有占位符时无需再处理
+        if self.countdown_cancelled and not self.is_placeholder:
+            return
+        
         # 清除占位符
-        if self.is_placeholder and event.keysym not in ['Control_L', 'Control_R', 'Alt_L', 'Alt_R', 'Shift_L', 'Shift_R']:
+        if self.is_placeholder and event.keysym not in MODIFIER_KEYS:
             self.clear_placeholder()
             # 用户开始编辑，终止倒计时
-            self.terminate_countdown()
+            self.terminate_countdown('keypress')
         else:
             # 对于非修饰键的按键，视为编辑，终止倒计时
-            if event.keysym not in ['Control_L', 'Control_R', 'Alt_L', 'Alt_R', 'Shift_L', 'Shift_R']:
-                self.terminate_countdown()
+            if event.keysym not in MODIFIER_KEYS:
+                self.terminate_countdown('keypress')
     
     def select_all_text(self, event):
         """自定义全选功能，只选中实际文本内容"""
         if self.is_placeholder:
             return "break"
         
-        content = self.text_area.get('1.0', 'end-1c')
-        if content:
-            lines = content.split('\n')
-            last_line = len(lines)
-            last_char = len(lines[-1])
-            end_pos = f"{last_line}.{last_char}"
-            
+        # 直接使用Tk索引end-1c（不含末尾自动换行），无需复制和拆分整个缓冲区
+        if self.text_area.compare('end-1c', '>', '1.0'):
             self.text_area.tag_remove('sel', '1.0', 'end')
-            self.text_area.tag_add('sel', '1.0', end_pos)
-            self.text_area.mark_set('insert', end_pos)
+            self.text_area.tag_add('sel', '1.0', 'end-1c')
+            self.text_area.mark_set('insert', 'end-1c')
         
         return "break"
     
     def on_text_modified(self, event):
         """文本内容修改事件，终止倒计时并重置modified标志"""
+        if self.countdown_cancelled:
+            # 倒计时已终止：不再重置modified标志，后续修改不会再产生<<Modified>>事件
+            return
         try:
             if self.text_area.edit_modified():
-                self.terminate_countdown()
+                self.terminate_countdown('modified')
                 self.text_area.edit_modified(False)
         except Exception:
             # 兼容处理，若edit_modified不可用则忽略
@@ -435,10 +714,30 @@ class ModernPromptInputWindow:
 
     def select_initial_text(self):
         """初始选中文本，方便用户直接输入"""
-        if self.is_placeholder and not self.stdin_content:
+        if self.is_placeholder and not self.has_stdin_content:
             self.text_area.tag_add('sel', '1.0', f'1.{len(self.placeholder_text)}')
             self.text_area.mark_set('insert', '1.0')
     
+    def open_history_search(self, event=None):
+        """打开历史回答搜索面板（Ctrl+R）"""
+        if self.history is None:
+            return "break"
+        self.terminate_countdown('history')
+        if self.history_panel is None:
+            self.history_panel = HistorySearchPanel(self)
+        self.history_panel.open()
+        return "break"
+
+    def insert_history_answer(self, answer):
+        """将选中的历史回答插入光标处，有选中内容时替换选中内容"""
+        self.clear_placeholder()
+        if self.text_area.tag_ranges('sel'):
+            self.text_area.delete('sel.first', 'sel.last')
+        self.text_area.insert('insert', answer)
+        self.text_area.see('insert')
+        self.text_area.focus_set()
+        self.request_scrollbar_layout()
+
     def undo_text(self):
         """撤销操作"""
         try:
@@ -455,47 +754,104 @@ class ModernPromptInputWindow:
     
     def handle_ctrl_enter(self, event):
         """处理Ctrl+Enter键盘事件"""
-        content_before_submit = self.text_area.get('1.0', 'end-1c')
-        
         # 确保内容不为空或只是换行符
-        if content_before_submit.strip():
+        if not self.is_blank():
             self.on_submit()
         else:
             messagebox.showwarning("提示", "请输入内容后再提交！")
             
         return "break"  # 阻止默认行为
     
-    def on_submit(self):
-        # 获取文本框内容
-        content = self.text_area.get("1.0", "end-1c")
-        
+    def on_submit(self, reason='submit'):
         # 检查是否为占位符内容
-        if self.is_placeholder or content.strip() == self.placeholder_text.strip():
+        if self.is_placeholder_content():
             messagebox.showwarning("提示", "请输入内容后再提交！")
             self.text_area.focus_set()
             return
         
-        self.result = content
-        self.terminate_countdown()
-        self.root.quit()
-        self.root.destroy()
+        # 只在真正提交时读取一次完整内容
+        self.finish(self.text_area.get("1.0", "end-1c"), reason)
     
     def on_cancel(self):
-        self.result = None
-        self.terminate_countdown()
+        self.finish(None, 'cancel')
+    
+    def finish(self, result, reason):
+        """结束本次输入：常驻模式下隐藏窗口并回调，否则退出主循环"""
+        self.result = result
+        self.end_reason = reason
+        metrics.mark(reason)
+        metrics.set('outcome', reason)
+        self.terminate_countdown(reason)
+        if self.on_finish is not None:
+            self.root.withdraw()
+            self.on_finish(result)
+            return
         self.root.quit()
         self.root.destroy()
     
     def show(self):
         self.root.mainloop()
         return self.result
+    
+    def hint_text(self):
+        """快捷键提示，记录回答历史时才提示Ctrl+R"""
+        return self.HINT_TEXT + (self.HISTORY_HINT_TEXT if self.history is not None else '')
+
+    def set_directory(self, cwd):
+        """常驻模式下按提问方的工作目录更新窗口标题"""
+        self.current_dir_name = os.path.basename(os.path.normpath(cwd))
+        self.root.title(f"💻 {self.current_dir_name} ")
+        self.title_label.config(text=f"💻 {self.current_dir_name} - 文字输入")
+
+    def present(self, prompt_text, stdin_content=None, countdown_seconds=60, cwd=None):
+        """常驻模式下复用已构建的窗口开始新一轮输入，只重置状态不重建控件"""
+        self.result = None
+        if cwd:
+            self.set_directory(cwd)
+        self.stdin_content = stdin_content
+        self.has_stdin_content = False
+        if self.original_parts is not None:
+            self.original_parts = []
+        self.prompt_label.config(text=f"💻 {prompt_text}")
+        self.hint_label.config(text=self.hint_text())
+        if self.history_panel is not None:
+            self.history_panel.close()
+        
+        # 重置倒计时
+        self.terminate_countdown()
+        self.countdown_cancelled = False
+        self.countdown_total_seconds = max(0, int(countdown_seconds or 0))
+        self.countdown_remaining_seconds = self.countdown_total_seconds
+        
+        # 重置文本和撤销栈
+        self.show_placeholder()
+        try:
+            self.text_area.edit_reset()
+        except Exception:
+            pass
+        self.update_submit_button_label()
+        
+        self.root.deiconify()
+        self.center_window()
+        self.root.lift()
+        self.root.focus_force()
+        
+        if self.stdin_content:
+            self.set_stdin_content()
+        else:
+            self.text_area.focus_set()
+            self.select_initial_text()
+        
+        if self.countdown_total_seconds > 0:
+            self.start_countdown()
 
     # ==================== 倒计时相关 ====================
     def start_countdown(self):
         """启动完成按钮倒计时"""
-        if self.countdown_active:
+        if self.countdown_active or self.countdown_cancelled:
             return
         self.countdown_active = True
+        self.countdown_ends_at = time.monotonic() + self.countdown_remaining_seconds
         self.update_submit_button_label()
         self.schedule_next_tick()
 
@@ -505,25 +861,31 @@ class ModernPromptInputWindow:
         if self.countdown_remaining_seconds <= 0:
             # 倒计时结束，恢复按钮文案
             self.countdown_active = False
+            metrics.set('countdown_ended_by', 'timeout')
             self.update_submit_button_label()
             # 方案B：倒计时结束自动提交（若内容有效且未被中止）
             self.auto_submit_on_timeout()
             return
-        # 安排下一秒的更新
-        self.countdown_after_id = self.root.after(1000, self.tick_countdown)
+        # 安排到剩余秒数变化时的更新，事件循环延迟不会累积
+        left = self.countdown_ends_at - time.monotonic()
+        delay_ms = int((left - (self.countdown_remaining_seconds - 1)) * 1000)
+        self.countdown_after_id = self.root.after(max(10, delay_ms), self.tick_countdown)
 
     def tick_countdown(self):
         if not self.countdown_active:
             return
-        self.countdown_remaining_seconds -= 1
-        if self.countdown_remaining_seconds < 0:
-            self.countdown_remaining_seconds = 0
+        left = self.countdown_ends_at - time.monotonic()
+        self.countdown_remaining_seconds = max(0, math.ceil(left - 0.001))
         self.update_submit_button_label()
         self.schedule_next_tick()
 
-    def terminate_countdown(self):
-        """终止倒计时（用户编辑时调用）"""
+    def terminate_countdown(self, reason='interaction'):
+        """终止倒计时（用户编辑时调用），只生效一次"""
+        if self.countdown_cancelled:
+            return
+        self.countdown_cancelled = True
         if self.countdown_active:
+            metrics.set('countdown_ended_by', reason)
             self.countdown_active = False
             if self.countdown_after_id is not None:
                 try:
@@ -548,56 +910,1430 @@ class ModernPromptInputWindow:
             # 若倒计时已经被其他交互终止，则不执行
             if self.countdown_active:
                 return
+            # stdin仍在加载时等待加载完成再提交，避免提交不完整的内容
+            if self.stdin_stream is not None:
+                self.root.after(100, self.auto_submit_on_timeout)
+                return
             # 校验内容有效性
-            content = self.text_area.get("1.0", "end-1c")
-            if not content.strip():
+            if self.is_blank():
                 # 空内容不自动提交，仅停止倒计时
                 return
-            if self.is_placeholder or content.strip() == self.placeholder_text.strip():
+            if self.is_placeholder_content():
                 # 占位符不自动提交
                 return
             # 自动执行提交
-            self.on_submit()
+            self.on_submit('auto_submit')
         except Exception:
             # 保守处理：任何异常都不影响窗口正常可用
             pass
 
+    def extend_countdown(self, seconds):
+        """延长倒计时；倒计时已结束（未被用户交互终止）时重新开始"""
+        if self.countdown_cancelled or seconds <= 0:
+            return
+        if not self.countdown_active:
+            self.countdown_remaining_seconds = math.ceil(seconds)
+            self.start_countdown()
+            return
+        if self.countdown_after_id is not None:
+            self.root.after_cancel(self.countdown_after_id)
+            self.countdown_after_id = None
+        self.countdown_ends_at += seconds
+        self.countdown_remaining_seconds = max(0, math.ceil(self.countdown_ends_at - time.monotonic() - 0.001))
+        self.update_submit_button_label()
+        self.schedule_next_tick()
+
+    # ==================== 控制通道 ====================
+    def attach_control_channel(self, control):
+        """开始接收控制消息（--control-fd），窗口打开期间调用方可更新提示、追加状态、调整倒计时或结束提问"""
+        self.control = control
+        self.root.after(0, self.pump_control_messages)
+
+    def pump_control_messages(self):
+        """从队列中批量取出控制消息并应用，消息再多也不会阻塞输入"""
+        if self.control is None:
+            return
+        batch, closed = self.control.drain(self.CONTROL_BATCH_MESSAGES)
+        if batch and self.apply_control_messages(batch):
+            # 提问已结束
+            self.control = None
+            return
+        if closed:
+            self.control = None
+            return
+        self.root.after(1 if batch else self.CONTROL_POLL_MS, self.pump_control_messages)
+
+    def apply_control_messages(self, batch):
+        """应用一批控制消息：提示文字只取最后一条，状态行合并为一次插入；返回是否已结束提问"""
+        prompt_text = None
+        status_lines = []
+        close = None
+        for message in batch:
+            kind = message['type']
+            if kind == 'prompt':
+                prompt_text = str(message.get('text', ''))
+            elif kind == 'status':
+                status_lines.append(str(message.get('text', '')))
+            elif kind == 'countdown':
+                if message.get('action') == 'cancel':
+                    self.terminate_countdown('control')
+                else:
+                    self.extend_countdown(float(message.get('seconds') or 0))
+            elif kind == 'close':
+                # 之后的消息不再处理
+                close = message
+                break
+        if prompt_text is not None:
+            self.prompt_label.config(text=f"💻 {prompt_text}")
+        if status_lines:
+            self.append_status_lines(status_lines)
+        if close is not None:
+            self.close_from_control(close.get('answer'))
+            return True
+        return False
+
+    def append_status_lines(self, lines):
+        """在提示文字下方的只读状态区追加状态行，超出STATUS_MAX_LINES时删除最早的行"""
+        if self.status_area is None:
+            self.status_area = tk.Text(self.prompt_label.master, height=4,
+                                       font=('Consolas', 9),
+                                       bg='#252526', fg='#9cdcfe',
+                                       relief='flat', bd=0, wrap='word',
+                                       padx=8, pady=4, cursor='arrow', takefocus=0)
+            self.status_area.pack(after=self.prompt_label, fill='x', pady=(0, 10))
+        self.status_area.config(state='normal')
+        prefix = '' if self.status_area.compare('end-1c', '==', '1.0') else '\n'
+        self.status_area.insert('end-1c', prefix + '\n'.join(lines))
+        excess = int(self.status_area.index('end-1c').split('.')[0]) - self.STATUS_MAX_LINES
+        if excess > 0:
+            self.status_area.delete('1.0', f'{excess + 1}.0')
+        self.status_area.config(state='disabled')
+        self.status_area.see('end')
+
+    def current_answer(self):
+        """当前可提交的内容，没有有效内容时返回None"""
+        if self.is_blank() or self.is_placeholder_content():
+            return None
+        return self.text_area.get('1.0', 'end-1c')
+
+    def close_from_control(self, answer=None):
+        """控制通道要求结束提问：提交answer，未指定时提交当前内容，没有有效内容时视为取消"""
+        if answer is None and self.stdin_stream is not None:
+            # stdin仍在加载，等待加载完成再提交
+            self.root.after(100, lambda: self.close_from_control(answer))
+            return
+        if answer is None:
+            answer = self.current_answer()
+        if answer is None:
+            self.finish(None, 'cancel')
+        else:
+            self.finish(str(answer), 'control_close')
+
+
+class BatchPromptInputWindow(ModernPromptInputWindow):
+    """批量提问窗口：所有问题显示在同一窗口中，各自一个输入框，共享倒计时，一次提交
+
+    提交结果为 {id: 回答} 的JSON对象。
+    """
+    HINT_TEXT = "💡 Ctrl+Enter 提交  •  Esc 取消  •  Tab 下一个问题"
+
+    def __init__(self, questions, countdown_seconds=60):
+        self.questions = questions
+        self.answer_fields = []
+        super().__init__(f"请回答以下{len(questions)}个问题：", countdown_seconds=countdown_seconds)
+
+    def get_window_size(self):
+        return (640, min(760, 220 + 120 * len(self.questions)))
+
+    def create_input_area(self, content_frame):
+        """可滚动的问题列表，每个问题一个输入框，默认答案预填"""
+        container = tk.Frame(content_frame, bg='#2d2d30')
+        container.pack(fill='both', expand=True, pady=(0, 15))
+        self.canvas = tk.Canvas(container, bg='#2d2d30', highlightthickness=0, bd=0)
+        scrollbar = tk.Scrollbar(container, orient='vertical', command=self.canvas.yview,
+                                 bg='#3e3e42', troughcolor='#2d2d30',
+                                 activebackground='#007acc')
+        self.questions_frame = tk.Frame(self.canvas, bg='#2d2d30')
+        window_id = self.canvas.create_window((0, 0), window=self.questions_frame, anchor='nw')
+        self.questions_frame.bind(
+            '<Configure>', lambda e: self.canvas.configure(scrollregion=self.canvas.bbox('all')))
+        self.canvas.bind('<Configure>', lambda e: self.canvas.itemconfigure(window_id, width=e.width))
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        self.canvas.pack(side='left', fill='both', expand=True)
+
+        for index, question in enumerate(self.questions):
+            label = tk.Label(self.questions_frame, text=f"{index + 1}. {question['prompt']}",
+                             font=('Consolas', 11), bg='#2d2d30', fg='#d4d4d4',
+                             anchor='w', justify='left', wraplength=560)
+            label.pack(fill='x', anchor='w', pady=(0 if index == 0 else 12, 4))
+            field = tk.Text(self.questions_frame, height=3,
+                            font=('Consolas', 12),
+                            relief='solid', bd=1,
+                            wrap='word', undo=True, maxundo=20,
+                            bg='#1e1e1e', fg='#d4d4d4',
+                            insertbackground='#ffffff',
+                            selectbackground='#264f78',
+                            selectforeground='#ffffff')
+            field.pack(fill='x')
+            if question['default']:
+                field.insert('1.0', question['default'])
+                field.edit_reset()
+            self.answer_fields.append(field)
+
+        # 通用逻辑（焦点、首次绘制）作用于第一个输入框
+        self.text_area = self.answer_fields[0]
+        self.placeholder_text = ''
+        self.is_placeholder = False
+
+    def setup_bindings(self):
+        self.root.bind('<Control-Return>', self.handle_ctrl_enter)
+        self.root.bind('<Escape>', lambda e: self.on_cancel())
+        self.root.protocol("WM_DELETE_WINDOW", self.on_cancel)
+        self.root.bind('<Enter>', lambda e: self.terminate_countdown('mouse_enter'))
+        self.root.bind('<MouseWheel>', lambda e: self.canvas.yview_scroll(-1 if e.delta > 0 else 1, 'units'))
+        self.root.bind('<Button-4>', lambda e: self.canvas.yview_scroll(-1, 'units'))
+        self.root.bind('<Button-5>', lambda e: self.canvas.yview_scroll(1, 'units'))
+        for index, field in enumerate(self.answer_fields):
+            field.bind('<KeyPress>', self.on_key_press)
+            field.bind('<Tab>', lambda e, i=index: self.focus_field(i + 1))
+            field.bind('<Shift-Tab>', lambda e, i=index: self.focus_field(i - 1))
+            field.bind('<ISO_Left_Tab>', lambda e, i=index: self.focus_field(i - 1))
+        self.root.after(100, lambda: self.focus_field(0))
+
+    def on_key_press(self, event):
+        metrics.mark('first_keystroke')
+        if event.keysym == 'Return' and event.state & 0x4:
+            return self.handle_ctrl_enter(event)
+        if event.keysym not in MODIFIER_KEYS:
+            self.terminate_countdown('keypress')
+
+    def focus_field(self, index):
+        """聚焦第index个输入框（循环），选中其内容并滚动到可见位置"""
+        field = self.answer_fields[index % len(self.answer_fields)]
+        field.focus_set()
+        field.tag_remove('sel', '1.0', 'end')
+        field.tag_add('sel', '1.0', 'end-1c')
+        field.mark_set('insert', 'end-1c')
 
-def check_stdin_input():
-    """检查是否有stdin输入"""
+        self.root.update_idletasks()
+        total_height = max(1, self.questions_frame.winfo_height())
+        view_top, view_bottom = self.canvas.yview()
+        top = field.winfo_y() / total_height
+        bottom = (field.winfo_y() + field.winfo_height()) / total_height
+        if top < view_top:
+            self.canvas.yview_moveto(top)
+        elif bottom > view_bottom:
+            self.canvas.yview_moveto(bottom - (view_bottom - view_top))
+        return "break"
+
+    def handle_ctrl_enter(self, event):
+        self.on_submit()
+        return "break"
+
+    def collect_answers(self):
+        return {question['id']: field.get('1.0', 'end-1c')
+                for question, field in zip(self.questions, self.answer_fields)}
+
+    def on_submit(self, reason='submit'):
+        self.finish(json.dumps(self.collect_answers(), ensure_ascii=False), reason)
+
+    def current_answer(self):
+        return json.dumps(self.collect_answers(), ensure_ascii=False)
+
+    def auto_submit_on_timeout(self):
+        """倒计时结束时，所有问题都有回答（含默认答案）才自动提交"""
+        if self.countdown_active:
+            return
+        if all(field.search(r'\S', '1.0', 'end-1c', regexp=True) for field in self.answer_fields):
+            self.on_submit('auto_submit')
+
+
+class TerminalBatchPromptInput:
+    """无图形显示时的批量提问：依次在终端提问，倒计时只作用于第一个问题
+
+    第一个问题因倒计时结束自动提交时，其余问题直接使用默认答案。
+    """
+
+    def __init__(self, questions, countdown_seconds=60):
+        self.questions = questions
+        self.countdown_total_seconds = countdown_seconds
+        self.end_reason = None
+
+    def show(self):
+        answers = {}
+        total = len(self.questions)
+        for index, question in enumerate(self.questions):
+            terminal = TerminalPromptInput(f"[{index + 1}/{total}] {question['prompt']}",
+                                           question['default'] or None,
+                                           self.countdown_total_seconds if index == 0 else 0)
+            answer = terminal.show()
+            self.end_reason = terminal.end_reason
+            if answer is None:
+                return None
+            answers[question['id']] = answer
+            if terminal.timed_out:
+                for rest in self.questions[index + 1:]:
+                    answers[rest['id']] = rest['default']
+                break
+        return json.dumps(answers, ensure_ascii=False)
+
+
+def parse_batch_spec(text):
+    """解析--batch的问题列表：[{"id": ..., "prompt": ..., "default": ...}, ...]"""
     try:
-        # 检查stdin是否不是终端（即通过管道或重定向输入）
-        if not sys.stdin.isatty():
-            # 在Windows环境下，尝试用二进制方式读取stdin
-            if os.name == 'nt':
-                try:
-                    # 获取二进制stdin
-                    import msvcrt
-                    import io
-                    
-                    # 尝试读取二进制数据
-                    binary_stdin = io.open(sys.stdin.fileno(), 'rb')
-                    content_bytes = binary_stdin.read()
-                    
-                    # 尝试不同的编码方式
-                    for encoding in ['utf-8', 'gbk', 'gb2312', 'cp936']:
-                        try:
-                            content = content_bytes.decode(encoding)
-                            break
-                        except UnicodeDecodeError:
-                            continue
-                    else:
-                        # 如果所有编码都失败，使用错误替换
-                        content = content_bytes.decode('utf-8', errors='replace')
-                        
-                except Exception:
-                    # 如果二进制读取失败，回退到文本模式
-                    content = sys.stdin.read()
+        spec = json.loads(text or '')
+    except json.JSONDecodeError as e:
+        raise ValueError(f"批量问题不是有效的JSON: {e}")
+    if not isinstance(spec, list) or not spec:
+        raise ValueError("批量问题必须是非空的JSON数组")
+
+    questions = []
+    seen_ids = set()
+    for index, item in enumerate(spec):
+        if not isinstance(item, dict) or 'prompt' not in item:
+            raise ValueError(f"第{index + 1}个问题缺少prompt")
+        question_id = str(item.get('id', index + 1))
+        if question_id in seen_ids:
+            raise ValueError(f"问题id重复: {question_id}")
+        seen_ids.add(question_id)
+        default = item.get('default')
+        questions.append({
+            'id': question_id,
+            'prompt': str(item['prompt']),
+            'default': '' if default is None else str(default),
+        })
+    return questions
+
+
+class MappedTextFile:
+    """以只读内存映射方式打开的文本文件
+
+    打开时一次性建立行偏移索引，之后按行号切片读取，内存占用与文件大小无关。
+    """
+    INDEX_BLOCK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.line_offsets = self.build_line_index()
+
+    def build_line_index(self):
+        """按块扫描换行符，记录每一行的起始字节偏移（末尾附加文件大小）"""
+        offsets = array('Q', [0])
+        if self.mm is None:
+            return offsets
+        newline = re.compile(b'\n')
+        pos = 0
+        while pos < self.size:
+            block = self.mm[pos:pos + self.INDEX_BLOCK_SIZE]
+            offsets.extend(m.end() + pos for m in newline.finditer(block))
+            pos += len(block)
+        if offsets[-1] != self.size:
+            offsets.append(self.size)
+        return offsets
+
+    @property
+    def line_count(self):
+        return len(self.line_offsets) - 1
+
+    def get_lines(self, start, count):
+        """读取从第start行（0起）开始的count行文本"""
+        if self.mm is None or count <= 0:
+            return ''
+        start = max(0, min(start, self.line_count))
+        end = min(start + count, self.line_count)
+        data = self.mm[self.line_offsets[start]:self.line_offsets[end]]
+        return data.decode('utf-8', errors='replace').rstrip('\r\n')
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self.file.close()
+
+
+class FilePreviewPane:
+    """只读预览区：只渲染可见的行窗口，滚动时通过行偏移索引从内存映射中切片"""
+
+    def __init__(self, parent, mapped_file):
+        self.mapped_file = mapped_file
+        self.top_line = 0
+        self.visible_lines = 15
+        self.render_pending = False
+
+        self.frame = tk.Frame(parent, bg='#2d2d30')
+        self.header_label = tk.Label(self.frame, font=('Consolas', 9),
+                                     bg='#2d2d30', fg='#808080', anchor='w')
+        self.header_label.pack(fill='x', pady=(0, 5))
+
+        body = tk.Frame(self.frame, bg='#1e1e1e', relief='solid', bd=1)
+        body.pack(fill='both', expand=True)
+        self.text = tk.Text(body, height=self.visible_lines,
+                            font=('Consolas', 11),
+                            relief='flat', bd=0,
+                            wrap='none', undo=False, state='disabled',
+                            bg='#1e1e1e', fg='#9cdcfe',
+                            selectbackground='#264f78',
+                            selectforeground='#ffffff')
+        self.scrollbar_v = tk.Scrollbar(body, orient='vertical', command=self.on_scrollbar,
+                                        bg='#3e3e42', troughcolor='#2d2d30',
+                                        activebackground='#007acc')
+        self.scrollbar_h = tk.Scrollbar(body, orient='horizontal', command=self.text.xview,
+                                        bg='#3e3e42', troughcolor='#2d2d30',
+                                        activebackground='#007acc')
+        self.text.config(xscrollcommand=self.scrollbar_h.set)
+        self.scrollbar_v.pack(side='right', fill='y')
+        self.scrollbar_h.pack(side='bottom', fill='x')
+        self.text.pack(side='left', fill='both', expand=True)
+
+        # 鼠标滚轮（Windows/macOS使用<MouseWheel>，X11使用Button-4/5）和翻页键
+        self.text.bind('<MouseWheel>', lambda e: self.scroll_by(-1 if e.delta > 0 else 1, 'units', 3))
+        self.text.bind('<Button-4>', lambda e: self.scroll_by(-1, 'units', 3))
+        self.text.bind('<Button-5>', lambda e: self.scroll_by(1, 'units', 3))
+        self.text.bind('<Prior>', lambda e: self.scroll_by(-1, 'pages'))
+        self.text.bind('<Next>', lambda e: self.scroll_by(1, 'pages'))
+        self.text.bind('<Up>', lambda e: self.scroll_by(-1, 'units'))
+        self.text.bind('<Down>', lambda e: self.scroll_by(1, 'units'))
+        self.text.bind('<Control-Home>', lambda e: self.scroll_to(0))
+        self.text.bind('<Control-End>', lambda e: self.scroll_to(self.mapped_file.line_count))
+        self.text.bind('<Configure>', self.on_configure)
+
+        self.render()
+
+    def on_configure(self, event):
+        linespace = tk.font.Font(font=self.text.cget('font')).metrics('linespace') or 1
+        visible_lines = max(1, event.height // linespace)
+        if visible_lines != self.visible_lines:
+            self.visible_lines = visible_lines
+            self.request_render()
+
+    def on_scrollbar(self, *args):
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * self.mapped_file.line_count))
+        elif args[0] == 'scroll':
+            self.scroll_by(int(args[1]), args[2])
+
+    def scroll_by(self, amount, unit, step=1):
+        if unit == 'pages':
+            step = max(1, self.visible_lines - 1)
+        self.scroll_to(self.top_line + amount * step)
+        return "break"
+
+    def scroll_to(self, line):
+        max_top = max(0, self.mapped_file.line_count - self.visible_lines)
+        line = max(0, min(line, max_top))
+        if line != self.top_line:
+            self.top_line = line
+            self.request_render()
+        return "break"
+
+    def request_render(self):
+        """合并连续的滚动请求，每次空闲时只渲染一次"""
+        if not self.render_pending:
+            self.render_pending = True
+            self.text.after_idle(self.render)
+
+    def render(self):
+        self.render_pending = False
+        total = self.mapped_file.line_count
+        content = self.mapped_file.get_lines(self.top_line, self.visible_lines)
+        self.text.config(state='normal')
+        self.text.delete('1.0', 'end')
+        self.text.insert('1.0', content)
+        self.text.config(state='disabled')
+
+        if total:
+            self.scrollbar_v.set(self.top_line / total,
+                                 min(1.0, (self.top_line + self.visible_lines) / total))
+        last_line = min(total, self.top_line + self.visible_lines)
+        self.header_label.config(
+            text=f"📄 {os.path.basename(self.mapped_file.path)}  •  "
+                 f"第{self.top_line + 1 if total else 0}-{last_line}行 / 共{total}行")
+
+
+class HistorySearchPanel:
+    """Ctrl+R历史回答搜索面板，覆盖在文本框上方
+
+    输入即搜索（每帧最多查询一次），上下键选择，Enter插入选中的回答，Esc关闭。
+    """
+    RESULT_LIMIT = 20
+    # 列表中每条回答显示的最大字符数
+    LABEL_CHARS = 80
+
+    def __init__(self, window):
+        self.window = window
+        self.results = []
+        self.frame = tk.Frame(window.text_area.master, bg='#252526', relief='solid', bd=1)
+        header = tk.Label(self.frame, text="🔍 搜索历史回答（↑↓ 选择  •  Enter 插入  •  Esc 关闭）",
+                          font=('Consolas', 9), bg='#252526', fg='#808080', anchor='w')
+        header.pack(fill='x', padx=6, pady=(4, 2))
+        self.query = tk.StringVar()
+        self.entry = tk.Entry(self.frame, textvariable=self.query,
+                              font=('Consolas', 12),
+                              relief='flat', bd=4,
+                              bg='#1e1e1e', fg='#d4d4d4',
+                              insertbackground='#ffffff',
+                              selectbackground='#264f78',
+                              selectforeground='#ffffff')
+        self.entry.pack(fill='x', padx=6)
+        self.listbox = tk.Listbox(self.frame, height=8,
+                                  font=('Consolas', 11),
+                                  relief='flat', bd=0, activestyle='none',
+                                  bg='#252526', fg='#d4d4d4',
+                                  selectbackground='#264f78',
+                                  selectforeground='#ffffff')
+        self.listbox.pack(fill='both', expand=True, padx=6, pady=(4, 6))
+
+        self.query.trace_add('write', lambda *args: window.dispatcher.request('history_search', self.search))
+        self.entry.bind('<Down>', lambda e: self.move_selection(1))
+        self.entry.bind('<Up>', lambda e: self.move_selection(-1))
+        self.entry.bind('<Return>', self.insert_selected)
+        self.entry.bind('<Escape>', self.close)
+        self.listbox.bind('<Double-Button-1>', self.insert_selected)
+
+    def open(self):
+        self.frame.place(relx=0, rely=0, relwidth=1)
+        self.frame.lift()
+        self.entry.focus_set()
+        self.entry.select_range(0, 'end')
+        self.search()
+
+    def close(self, event=None):
+        self.frame.place_forget()
+        self.window.text_area.focus_set()
+        return "break"
+
+    def search(self):
+        try:
+            self.results = self.window.history.search(self.query.get(), self.RESULT_LIMIT)
+        except Exception as e:
+            self.results = []
+            print(f"搜索历史回答失败: {e}", file=sys.stderr)
+        self.listbox.delete(0, 'end')
+        for answer, _ in self.results:
+            lines = answer.splitlines() or ['']
+            label = lines[0][:self.LABEL_CHARS]
+            if len(lines) > 1:
+                label += f"  …（共{len(lines)}行）"
+            self.listbox.insert('end', label)
+        if self.results:
+            self.listbox.selection_set(0)
+
+    def move_selection(self, step):
+        if not self.results:
+            return "break"
+        current = self.listbox.curselection()
+        index = max(0, min(len(self.results) - 1, (current[0] if current else -1) + step))
+        self.listbox.selection_clear(0, 'end')
+        self.listbox.selection_set(index)
+        self.listbox.see(index)
+        return "break"
+
+    def insert_selected(self, event=None):
+        current = self.listbox.curselection()
+        if current:
+            self.close()
+            self.window.insert_history_answer(self.results[current[0]][0])
+        return "break"
+
+
+class TerminalPromptInput:
+    """无图形显示时的终端输入后端
+
+    在/dev/tty上提问，保持与窗口相同的倒计时自动提交语义和stdout输出约定：
+    倒计时内任意按键即终止倒计时；倒计时结束时若有预填内容则自动提交。
+    """
+    SUBMIT_MARKER = '.'
+    PLACEHOLDER_WARNING = "请输入内容后再提交！"
+
+    def __init__(self, prompt_text, stdin_content=None, countdown_seconds=60):
+        self.prompt_text = prompt_text
+        self.stdin_content = stdin_content
+        self.countdown_total_seconds = max(0, int(countdown_seconds or 0))
+        self.timed_out = False  # 是否因倒计时结束而自动提交
+        self.end_reason = None
+
+    def show(self):
+        try:
+            tty_in = open('/dev/tty', 'r', encoding='utf-8', errors='replace')
+            tty_out = open('/dev/tty', 'w', encoding='utf-8')
+        except OSError:
+            # 没有可交互的终端，无人能够作答：等同于倒计时结束
+            if self.countdown_total_seconds > 0 and self.stdin_content:
+                return self.finish(self.stdin_content, 'auto_submit')
+            return self.finish(None, 'cancel')
+        with tty_in, tty_out:
+            self.tty_out = tty_out
+            return self.run(tty_in)
+
+    def run(self, tty):
+        self.write(f"💻 {self.prompt_text}\n")
+        if self.stdin_content:
+            self.write(f"{self.stdin_content}\n")
+        self.write(f"💡 单独一行输入 {self.SUBMIT_MARKER} 或按 Ctrl+D 提交  •  Ctrl+C 取消"
+                        f"{'  •  直接提交将使用上方内容' if self.stdin_content else ''}\n")
+
+        first_key = ''
+        if self.countdown_total_seconds > 0:
+            first_key = self.wait_for_first_key(tty)
+            if first_key is None:
+                metrics.set('countdown_ended_by', 'timeout')
+                # 倒计时结束自动提交（若内容有效），否则仅停止倒计时
+                if self.stdin_content:
+                    return self.finish(self.stdin_content, 'auto_submit')
+                first_key = ''
             else:
-                # 非Windows系统，直接读取
-                content = sys.stdin.read()
-            
-            return content.rstrip('\n\r') if content else None
+                metrics.mark('first_keystroke')
+                metrics.set('countdown_ended_by', 'keypress')
+
+        while True:
+            content = self.read_lines(tty, first_key)
+            first_key = ''
+            if content.strip():
+                return self.finish(content, 'submit')
+            if self.stdin_content:
+                return self.finish(self.stdin_content, 'submit')
+            self.write(f"{self.PLACEHOLDER_WARNING}\n")
+
+    def read_lines(self, tty, first_key):
+        """读取多行输入，直到单独一行的提交标记或EOF"""
+        if first_key == '\x04':
+            return ''
+        lines = []
+        pending = first_key
+        if pending in ('\n', '\r'):
+            lines.append('')
+            pending = ''
+        while True:
+            line = tty.readline()
+            if not line:
+                break
+            line = (pending + line).rstrip('\r\n')
+            pending = ''
+            if line == self.SUBMIT_MARKER:
+                break
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def wait_for_first_key(self, tty):
+        """倒计时期间等待首个按键，返回None表示倒计时结束"""
+        metrics.mark('first_paint')
+        fd = tty.fileno()
+        saved_attrs = None
+        try:
+            import termios
+            saved_attrs = termios.tcgetattr(fd)
+            attrs = termios.tcgetattr(fd)
+            attrs[3] &= ~termios.ICANON
+            attrs[6][termios.VMIN] = 1
+            attrs[6][termios.VTIME] = 0
+            termios.tcsetattr(fd, termios.TCSANOW, attrs)
+        except Exception:
+            saved_attrs = None
+
+        def restore_terminal():
+            termios.tcsetattr(fd, termios.TCSANOW, saved_attrs)
+
+        if saved_attrs is not None:
+            EXIT_RESTORE_HOOKS.append(restore_terminal)
+        try:
+            deadline = time.monotonic() + self.countdown_total_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.write("\r\033[K")
+                    return None
+                self.write(f"\r\033[K(自动提交倒计时 {int(remaining + 0.999)}s) ")
+                ready, _, _ = select.select([fd], [], [], min(1.0, remaining))
+                if ready:
+                    key = os.read(fd, 16).decode('utf-8', errors='replace')
+                    # 清除倒计时提示并回显已输入的字符
+                    self.write("\r\033[K" + ('' if key in ('\x04', '\n', '\r') else key))
+                    return key
+        finally:
+            if saved_attrs is not None:
+                EXIT_RESTORE_HOOKS.remove(restore_terminal)
+                restore_terminal()
+
+    def finish(self, result, reason):
+        self.end_reason = reason
+        self.timed_out = reason == 'auto_submit'
+        metrics.mark(reason)
+        metrics.set('outcome', reason)
+        return result
+
+    def write(self, text):
+        self.tty_out.write(text)
+        self.tty_out.flush()
+
+
+class ScriptedPromptInput:
+    """非交互的脚本后端，用于基准测试和自动化
+
+    不显示任何界面，立即以ASK_USER_SCRIPT_ANSWER（未设置时为预填内容）自动提交，
+    ASK_USER_SCRIPT_DELAY_MS可模拟作答耗时；没有可提交的内容时视为取消。
+    控制通道中只处理close消息，作答耗时内收到时提前结束。
+    """
+
+    def __init__(self, answer):
+        self.answer = os.environ.get('ASK_USER_SCRIPT_ANSWER', answer)
+        self.end_reason = None
+        self.control = None
+
+    def attach_control_channel(self, control):
+        self.control = control
+
+    def show(self):
+        delay_ms = float(os.environ.get('ASK_USER_SCRIPT_DELAY_MS') or 0)
+        ends_at = time.monotonic() + delay_ms / 1000
+        answer = self.answer
+        self.end_reason = 'auto_submit' if answer is not None else 'cancel'
+        close = self.wait_for_close(ends_at) if self.control is not None else None
+        if close is not None:
+            if close.get('answer') is not None:
+                answer = str(close['answer'])
+            self.end_reason = 'control_close' if answer is not None else 'cancel'
+        elif ends_at > time.monotonic():
+            time.sleep(ends_at - time.monotonic())
+        metrics.mark(self.end_reason)
+        metrics.set('outcome', self.end_reason)
+        return answer
+
+    def wait_for_close(self, ends_at):
+        """在模拟的作答耗时内等待close消息，其他消息直接忽略"""
+        while True:
+            remaining = ends_at - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                message = self.control.messages.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if message is None:
+                return None
+            if message['type'] == 'close':
+                return message
+
+
+DIFF_CONTEXT_LINES = 3
+# 去掉首尾相同的行后，中间部分不超过该行数时用SequenceMatcher逐行匹配，
+# 超过时整段作为一处修改，避免重复行很多时匹配耗时失控
+DIFF_MAX_MATCH_LINES = 2000
+
+
+def format_diff_range(start, length):
+    """unified diff的行范围，start从0开始"""
+    if length == 1:
+        return f"{start + 1}"
+    if length == 0:
+        return f"{start},0"
+    return f"{start + 1},{length}"
+
+
+def diff_submitted_text(original, submitted, context=DIFF_CONTEXT_LINES):
+    """提交内容相对预填内容的unified diff，首行说明是否有修改
+
+    通常只修改了预填内容的一小部分：先去掉首尾相同的行，只对中间部分（连同前后context行上下文）分组匹配。
+    """
+    if not original:
+        return f"[ask_user] 没有预填内容，返回完整内容\n{submitted}"
+    if original == submitted:
+        return "[ask_user] 未修改预填内容"
+    a = original.split('\n')
+    b = submitted.split('\n')
+    prefix = 0
+    limit = min(len(a), len(b))
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+    start = max(0, prefix - context)
+    a_end = len(a) - max(0, suffix - context)
+    b_end = len(b) - max(0, suffix - context)
+    if len(a) - prefix - suffix <= DIFF_MAX_MATCH_LINES and len(b) - prefix - suffix <= DIFF_MAX_MATCH_LINES:
+        matcher = SequenceMatcher(None, a[start:a_end], b[start:b_end], autojunk=False)
+        groups = matcher.get_grouped_opcodes(context)
+    else:
+        head = prefix - start
+        groups = [[('equal', 0, head, 0, head),
+                   ('replace', head, len(a) - suffix - start, head, len(b) - suffix - start),
+                   ('equal', len(a) - suffix - start, a_end - start, len(b) - suffix - start, b_end - start)]]
+    lines = []
+    added = removed = 0
+    for group in groups:
+        group = [(tag, i1 + start, i2 + start, j1 + start, j2 + start) for tag, i1, i2, j1, j2 in group]
+        i1, i2, j1, j2 = group[0][1], group[-1][2], group[0][3], group[-1][4]
+        lines.append(f"@@ -{format_diff_range(i1, i2 - i1)} +{format_diff_range(j1, j2 - j1)} @@")
+        for tag, a1, a2, b1, b2 in group:
+            if tag == 'equal':
+                lines.extend(' ' + line for line in a[a1:a2])
+                continue
+            lines.extend('-' + line for line in a[a1:a2])
+            lines.extend('+' + line for line in b[b1:b2])
+            removed += a2 - a1
+            added += b2 - b1
+    header = f"[ask_user] 已修改预填内容：+{added} -{removed}行"
+    return '\n'.join([header, '--- 预填内容', '+++ 提交内容'] + lines)
+
+
+# 结果帧类型：每帧为1字节类型 + 4字节大端长度 + 内容
+RESULT_FRAME_STATUS = 1  # JSON：{"status": ..., "bytes": ..., "message": ...}
+RESULT_FRAME_RESULT = 2  # UTF-8编码的结果文本
+
+
+def result_status(result, reason):
+    """把结束原因映射为结果通道中的状态"""
+    if result is None:
+        return 'cancelled'
+    if reason == 'control_close':
+        return 'closed'
+    return 'auto_submitted' if reason == 'auto_submit' else 'submitted'
+
+
+def encode_result_frames(status, result=None, **extra):
+    """编码状态帧和结果帧，结果以二进制原样传输，不依赖退出码和stderr推断状态"""
+    header = dict(extra, status=status)
+    frames = []
+    if result is not None:
+        payload = result.encode('utf-8')
+        header['bytes'] = len(payload)
+    status_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    frames.append(struct.pack('>BI', RESULT_FRAME_STATUS, len(status_bytes)) + status_bytes)
+    if result is not None:
+        frames.append(struct.pack('>BI', RESULT_FRAME_RESULT, len(payload)) + payload)
+    return b''.join(frames)
+
+
+class ResultChannel:
+    """结果输出通道
+
+    指定--result-fd时向该fd写入结果帧，状态与结果分开传输；
+    否则沿用原有约定：结果输出到stdout，取消和错误信息输出到stderr。
+    每个进程只输出一次结果。
+    """
+
+    def __init__(self, fd=None):
+        self.fd = fd
+        self.sent = False
+        self.lock = threading.Lock()
+
+    def send(self, status, result=None, message=None):
+        with self.lock:
+            if self.sent:
+                return False
+            self.sent = True
+        if self.fd is not None:
+            extra = {'message': message} if message else {}
+            with os.fdopen(self.fd, 'wb') as out:
+                out.write(encode_result_frames(status, result, **extra))
+        elif result is not None:
+            sys.stdout.flush()
+            sys.stdout.buffer.write(result.encode('utf-8') + b'\n')
+            sys.stdout.buffer.flush()
+        else:
+            print(message or "用户取消了输入", file=sys.stderr)
+        return True
+
+
+DEADLINE_EXIT_CODE = 3
+# 截止时间到期时默认返回的回答，需与common.js中的MESSAGES.DEADLINE_DEFAULT保持一致
+DEFAULT_DEADLINE_ANSWER = "继续"
+# os._exit不会执行finally和atexit：临时修改了终端设置等进程外状态时在此登记恢复函数，截止时间到期退出前依次调用
+EXIT_RESTORE_HOOKS = []
+
+
+class DeadlineWatchdog(threading.Thread):
+    """进程级截止时间（--deadline）
+
+    独立于Tk事件循环的守护线程，按单调时钟从进程启动开始计时；到期时若尚未输出结果，
+    通过结果通道返回默认回答并立即以DEADLINE_EXIT_CODE退出。窗口被最小化、
+    倒计时被终止或Tk本身卡住时同样生效。
+    """
+
+    def __init__(self, seconds, channel, answer):
+        super().__init__(name='ask-user-deadline', daemon=True)
+        self.expires_at = PROCESS_START + seconds
+        self.channel = channel
+        self.answer = answer
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(max(0.0, self.expires_at - time.perf_counter())):
+            if time.perf_counter() >= self.expires_at:
+                self.expire()
+                return
+
+    def stop(self):
+        self.stopped.set()
+
+    def expire(self):
+        if not self.channel.send('deadline', self.answer):
+            # 已经输出了结果
+            return
+        metrics.mark('deadline')
+        metrics.set('outcome', 'deadline')
+        metrics.write()
+        for restore in list(EXIT_RESTORE_HOOKS):
+            try:
+                restore()
+            except Exception:
+                pass
+        os._exit(DEADLINE_EXIT_CODE)
+
+
+class AnswerCache:
+    """回答缓存，文件格式与answer-cache.js相同
+
+    只有rules中有匹配提示文字的规则时才使用缓存（规则的prompt按正则表达式搜索）；
+    命中时直接返回缓存的回答，未命中时记录本次回答，并按LRU淘汰超出数量或大小上限的条目。
+    只用于直接运行--cache的场景，写入时不加锁（ask_user.js使用answer-cache.js在锁内合并写入）。
+    """
+    DEFAULT_TTL = 3600
+    DEFAULT_MAX_ENTRIES = 200
+    DEFAULT_MAX_BYTES = 1024 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        data = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        data.setdefault('rules', [])
+        data.setdefault('max_entries', self.DEFAULT_MAX_ENTRIES)
+        data.setdefault('max_bytes', self.DEFAULT_MAX_BYTES)
+        data.setdefault('entries', {})
+        self.data = data
+
+    @staticmethod
+    def key(prompt, stdin):
+        return hashlib.sha256(f"{prompt}\0{stdin or ''}".encode('utf-8')).hexdigest()
+
+    def find_rule(self, prompt):
+        for rule in self.data['rules']:
+            if re.search(rule['prompt'], prompt):
+                return rule
+        return None
+
+    def lookup(self, prompt, stdin):
+        """返回(状态, 回答)，状态为off/hit/miss"""
+        if self.find_rule(prompt) is None:
+            return 'off', None
+        entry = self.data['entries'].get(self.key(prompt, stdin))
+        if entry is None or entry['expires_at'] <= time.time():
+            return 'miss', None
+        entry['last_used_at'] = time.time()
+        entry['hits'] = entry.get('hits', 0) + 1
+        self.save()
+        return 'hit', entry['answer']
+
+    def store(self, prompt, stdin, answer):
+        now = time.time()
+        self.data['entries'][self.key(prompt, stdin)] = {
+            'prompt': prompt,
+            'answer': answer,
+            'size': len(answer.encode('utf-8')),
+            'created_at': now,
+            'last_used_at': now,
+            'expires_at': now + self.find_rule(prompt).get('ttl', self.DEFAULT_TTL),
+            'hits': 0,
+        }
+        self.evict()
+        self.save()
+
+    def evict(self):
+        entries = self.data['entries']
+        now = time.time()
+        for key in [k for k, entry in entries.items() if entry['expires_at'] <= now]:
+            del entries[key]
+        total_bytes = sum(entry['size'] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['last_used_at']):
+            if len(entries) <= self.data['max_entries'] and total_bytes <= self.data['max_bytes']:
+                break
+            total_bytes -= entries.pop(key)['size']
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+                f.write('\n')
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class AnswerHistory:
+    """回答历史（--history），记录每次提交的回答及其提示文字，供窗口中Ctrl+R搜索
+
+    SQLite数据库，首次搜索或记录时才打开，不影响窗口启动耗时。
+    回答存放在answers表中，FTS5（trigram分词，支持中文子串）外部内容索引通过触发器同步；
+    相同的回答只保留一条，再次提交时删除旧行重新插入，id越大表示越近使用过，
+    搜索按rowid倒序流式读取，不需要对全部匹配结果排序。超出max_entries时删除最久未使用的回答。
+    SQLite不支持FTS5时退化为LIKE查询。
+    """
+    DEFAULT_MAX_ENTRIES = 100000
+    # 超过该大小的回答不记录
+    MAX_ANSWER_BYTES = 64 * 1024
+    # trigram索引只能匹配至少3个字符的词，更短的词只在最近使用的这么多条回答中查找
+    SHORT_QUERY_WINDOW = 5000
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE,
+            prompt TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            used_at REAL NOT NULL,
+            uses INTEGER NOT NULL DEFAULT 1
+        );
+    """
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS answers_fts USING fts5(
+            answer, prompt, content='answers', content_rowid='id', tokenize='trigram');
+        CREATE TRIGGER IF NOT EXISTS answers_ai AFTER INSERT ON answers BEGIN
+            INSERT INTO answers_fts(rowid, answer, prompt) VALUES (new.id, new.answer, new.prompt);
+        END;
+        CREATE TRIGGER IF NOT EXISTS answers_ad AFTER DELETE ON answers BEGIN
+            INSERT INTO answers_fts(answers_fts, rowid, answer, prompt)
+            VALUES ('delete', old.id, old.answer, old.prompt);
+        END;
+    """
+
+    def __init__(self, path, max_entries=None):
+        self.path = path
+        self.max_entries = max_entries or int(os.environ.get('ASK_USER_HISTORY_MAX_ENTRIES') or
+                                              self.DEFAULT_MAX_ENTRIES)
+        self.conn = None
+        self.fts = False
+
+    def connect(self):
+        if self.conn is not None:
+            return self.conn
+        import sqlite3
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(self.SCHEMA)
+        try:
+            conn.executescript(self.FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # 没有FTS5或trigram分词
+            self.fts = False
+        self.conn = conn
+        return conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def record(self, prompt, answer):
+        """记录一次提交的回答，返回是否已记录"""
+        if not answer.strip() or len(answer.encode('utf-8')) > self.MAX_ANSWER_BYTES:
+            return False
+        conn = self.connect()
+        key = hashlib.sha256(answer.encode('utf-8')).hexdigest()
+        with conn:
+            row = conn.execute('SELECT uses FROM answers WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                conn.execute('DELETE FROM answers WHERE key = ?', (key,))
+            conn.execute('INSERT INTO answers (key, prompt, answer, used_at, uses) VALUES (?, ?, ?, ?, ?)',
+                         (key, prompt or '', answer, time.time(), row[0] + 1 if row else 1))
+            excess = conn.execute('SELECT count(*) FROM answers').fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute('DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY id LIMIT ?)',
+                             (excess,))
+        return True
+
+    def search(self, query, limit=20):
+        """按最近使用的顺序返回匹配的回答[(answer, prompt)]；query按空白拆分为多个词，需全部匹配"""
+        conn = self.connect()
+        terms = query.split()
+        if not terms:
+            return conn.execute('SELECT answer, prompt FROM answers ORDER BY id DESC LIMIT ?',
+                                (limit,)).fetchall()
+        if self.fts and all(len(term) >= 3 for term in terms):
+            match = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+            return conn.execute(
+                'SELECT a.answer, a.prompt FROM answers_fts JOIN answers a ON a.id = answers_fts.rowid '
+                'WHERE answers_fts MATCH ? ORDER BY answers_fts.rowid DESC LIMIT ?',
+                (match, limit)).fetchall()
+        conditions = ' AND '.join(["(answer LIKE ? ESCAPE '\\' OR prompt LIKE ? ESCAPE '\\')"] * len(terms))
+        params = []
+        for term in terms:
+            pattern = '%' + re.sub(r'([%_\\])', r'\\\1', term) + '%'
+            params += [pattern, pattern]
+        window = ''
+        if self.fts:
+            window = 'id > (SELECT coalesce(max(id), 0) FROM answers) - ? AND '
+            params.insert(0, self.SHORT_QUERY_WINDOW)
+        return conn.execute(f'SELECT answer, prompt FROM answers WHERE {window}{conditions} '
+                            f'ORDER BY id DESC LIMIT ?', params + [limit]).fetchall()
+
+
+def record_history(history, prompt, answer):
+    """记录提交的回答，失败时只输出警告"""
+    if history is None:
+        return
+    try:
+        history.record(prompt, answer)
+    except Exception as e:
+        print(f"[ask_user] 记录历史回答失败: {e}", file=sys.stderr)
+
+
+def get_default_socket_path():
+    """常驻模式使用的Unix socket路径，需与ask_user.js保持一致"""
+    socket_path = os.environ.get('ASK_USER_SOCKET')
+    if socket_path:
+        return socket_path
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.path.join(tempfile.gettempdir(), f"herding-ask-user-{uid}.sock")
+
+
+class PromptServer:
+    """常驻模式：保持一个预先构建、隐藏的输入窗口，通过本地Unix socket逐个处理提问
+
+    请求为一行JSON：{"prompt": ..., "stdin": ..., "countdown": ..., "history": ..., "cwd": ..., "deadline": ..., "deadline_default": ...}
+    响应为结果帧（见encode_result_frames），与--result-fd的格式相同；窗口标题使用请求中的cwd（提问方的工作目录）。
+    每个连接由独立线程处理，多个客户端的提问依次排队，同一时间只展示一个。
+    客户端发送请求后保持连接直到收到响应，中途断开时放弃该提问（排队中的不再展示，正在展示的隐藏窗口）；
+    设置了deadline（秒，从收到请求开始计时）时，到期由连接线程直接返回默认回答，排队等待中同样生效，不依赖Tk事件循环。
+    """
+    POLL_INTERVAL_MS = 50
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.sessions = queue.Queue()
+        self.current = None
+        self.window = None
+        self.listener = None
+
+    def bind(self):
+        """绑定socket，清理上一次异常退出残留的socket文件"""
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise RuntimeError(f"已有常驻进程在监听 {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.socket_path)
+            finally:
+                probe.close()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        listener.listen(16)
+        return listener
+
+    def serve_forever(self):
+        self.listener = self.bind()
+        try:
+            self.window = ModernPromptInputWindow("", on_finish=self.on_session_finished)
+            threading.Thread(target=self.accept_loop, daemon=True).start()
+            self.window.root.after(self.POLL_INTERVAL_MS, self.poll_sessions)
+            self.window.root.mainloop()
+        finally:
+            self.listener.close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        if self.window is not None:
+            self.window.root.quit()
+
+    def accept_loop(self):
+        """后台线程：接收连接，每个连接交给独立线程等待结果"""
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve_connection, args=(conn,), daemon=True).start()
+
+    def serve_connection(self, conn):
+        with conn:
+            try:
+                self.handle_connection(conn)
+            except Exception as e:
+                print(f"处理请求出错: {e}", file=sys.stderr)
+
+    def handle_connection(self, conn):
+        request = json.loads(self.read_line(conn) or b'{}')
+        if request.get('action') == 'shutdown':
+            self.window.root.after(0, self.shutdown)
+            return
+        deadline = request.get('deadline')
+        expires_at = time.perf_counter() + float(deadline) if deadline else None
+        session = {'request': request, 'done': threading.Event(), 'response': None, 'abandoned': False}
+        self.sessions.put(session)
+        while not session['done'].wait(self.POLL_INTERVAL_MS / 1000):
+            if expires_at is not None and time.perf_counter() >= expires_at:
+                session['abandoned'] = True
+                answer = request.get('deadline_default')
+                conn.sendall(encode_result_frames(
+                    'deadline', DEFAULT_DEADLINE_ANSWER if answer is None else answer))
+                return
+            if self.client_closed(conn):
+                session['abandoned'] = True
+                return
+        conn.sendall(session['response'])
+
+    @staticmethod
+    def client_closed(conn):
+        """客户端发送请求后不再写入，连接可读说明已断开（EOF或出错）"""
+        readable, _, _ = select.select([conn], [], [], 0)
+        if not readable:
+            return False
+        try:
+            return conn.recv(1, socket.MSG_PEEK) == b''
+        except OSError:
+            return True
+
+    @staticmethod
+    def read_line(conn):
+        chunks = []
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            newline = chunk.find(b'\n')
+            if newline >= 0:
+                chunks.append(chunk[:newline])
+                break
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def poll_sessions(self):
+        """Tk线程：取出排队的提问并复用窗口展示，客户端已断开的提问直接结束"""
+        if self.current is not None and self.current['abandoned']:
+            self.window.finish(None, 'cancel')
+        while self.current is None:
+            try:
+                session = self.sessions.get_nowait()
+            except queue.Empty:
+                break
+            if session['abandoned']:
+                continue
+            self.current = session
+            request = session['request']
+            if self.window.history is not None:
+                self.window.history.close()
+            self.window.history = AnswerHistory(request['history']) if request.get('history') else None
+            self.window.present(request.get('prompt') or "请输入您的内容：",
+                                request.get('stdin') or None,
+                                request.get('countdown', 60),
+                                request.get('cwd'))
+        self.window.root.after(self.POLL_INTERVAL_MS, self.poll_sessions)
+
+    def on_session_finished(self, result):
+        session, self.current = self.current, None
+        if session is None:
+            return
+        session['response'] = encode_result_frames(result_status(result, self.window.end_reason), result)
+        session['done'].set()
+        if result is not None and not session['abandoned']:
+            record_history(self.window.history, session['request'].get('prompt') or '', result)
+
+
+class StdinDecoder:
+    """增量解码stdin的字节流，各平台共用
+
+    先根据BOM和有限长度的前缀选择编码（管道内容可能为UTF-8或GBK），之后按块增量解码；
+    若后续块证明猜测错误，只把出错位置之后的字节改用下一个候选编码解码，已输出的文本保持不变。
+    候选编码都失败时退回UTF-8并替换无法解码的字节。
+    """
+    SNIFF_BYTES = 4096
+    CANDIDATES = ('utf-8', 'gbk')
+    BOMS = (
+        (codecs.BOM_UTF8, 'utf-8-sig'),
+        (codecs.BOM_UTF16_LE, 'utf-16'),
+        (codecs.BOM_UTF16_BE, 'utf-16'),
+    )
+
+    def __init__(self):
+        self.encoding = None
+        self.decoder = None
+        self.fallbacks = []
+        self.pending = b''  # 选定编码前暂存的前缀
+
+    def decode(self, data, final=False):
+        if self.decoder is None:
+            self.pending += data
+            if len(self.pending) < self.SNIFF_BYTES and not final:
+                return ''
+            data, self.pending = self.pending, b''
+            self.select_encoding(data, final)
+        parts = []
+        while True:
+            try:
+                parts.append(self.decoder.decode(data, final))
+                return ''.join(parts)
+            except UnicodeDecodeError as e:
+                # e.object包含解码器内部暂存的字节，出错位置之前的内容按当前编码是有效的
+                parts.append(e.object[:e.start].decode(self.encoding, errors='replace'))
+                data = e.object[e.start:]
+                self.use_encoding(*self.next_fallback())
+
+    def select_encoding(self, prefix, final):
+        for bom, encoding in self.BOMS:
+            if prefix.startswith(bom):
+                self.use_encoding(encoding, [], 'strict')
+                return
+        for index, encoding in enumerate(self.CANDIDATES):
+            try:
+                # 前缀可能截断在多字节字符中间，非final时允许末尾不完整
+                codecs.getincrementaldecoder(encoding)().decode(prefix, final)
+            except UnicodeDecodeError:
+                continue
+            self.use_encoding(encoding, [c for c in self.CANDIDATES if c != encoding], 'strict')
+            return
+        self.use_encoding('utf-8', [], 'replace')
+
+    def next_fallback(self):
+        if self.fallbacks:
+            return self.fallbacks[0], self.fallbacks[1:], 'strict'
+        return 'utf-8', [], 'replace'
+
+    def use_encoding(self, encoding, fallbacks, errors):
+        self.encoding = encoding
+        self.fallbacks = fallbacks
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+
+
+class StdinStreamReader(threading.Thread):
+    """后台线程分块读取stdin，解码后放入队列，由界面线程批量插入
+
+    队列以None结尾；末尾的换行符会被去除（与一次性读取时的rstrip一致）。
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, fd):
+        super().__init__(daemon=True)
+        self.fd = fd
+        self.chunks = queue.Queue()
+        self.bytes_read = 0
+        self.encoding = None
+
+    def run(self):
+        held_newlines = ''
+        started = time.perf_counter()
+        try:
+            for text in self.iter_decoded():
+                # 暂存块末尾的换行符，只有后面还有内容时才输出
+                text = held_newlines + text
+                stripped = text.rstrip('\n\r')
+                held_newlines = text[len(stripped):]
+                if stripped:
+                    self.chunks.put(stripped)
+        except Exception as e:
+            # 调试信息
+            print(f"Error reading stdin: {e}", file=sys.stderr)
+        finally:
+            metrics.set('stdin_bytes', self.bytes_read)
+            metrics.set('stdin_encoding', self.encoding)
+            metrics.set('stdin_load_ms', round((time.perf_counter() - started) * 1000, 3))
+            self.chunks.put(None)
+
+    def iter_decoded(self):
+        decoder = StdinDecoder()
+        while True:
+            data = os.read(self.fd, self.CHUNK_SIZE)
+            if not data:
+                break
+            self.bytes_read += len(data)
+            text = decoder.decode(data)
+            if text:
+                yield text
+        tail = decoder.decode(b'', final=True)
+        self.encoding = decoder.encoding
+        if tail:
+            yield tail
+
+    def read_all(self):
+        """阻塞读取全部内容，没有内容时返回None"""
+        parts = []
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                break
+            parts.append(chunk)
+        return ''.join(parts) or None
+
+
+class ControlChannelReader(threading.Thread):
+    """后台线程读取控制通道（--control-fd）中的JSON行，放入队列，由界面线程批量应用
+
+    每行一条消息：
+        {"type": "prompt", "text": ...}                          更新提示文字
+        {"type": "status", "text": ...}                          在只读状态区追加一行
+        {"type": "countdown", "action": "extend", "seconds": N}  延长倒计时（已结束时重新开始）
+        {"type": "countdown", "action": "cancel"}                终止倒计时
+        {"type": "close", "answer": ...}                         以answer结束提问（省略时提交当前内容）
+    无效的消息输出到stderr后忽略；队列以None结尾。
+    """
+    MESSAGE_TYPES = ('prompt', 'status', 'countdown', 'close')
+
+    def __init__(self, fd):
+        super().__init__(name='ask-user-control', daemon=True)
+        self.fd = fd
+        self.messages = queue.Queue()
+
+    def run(self):
+        try:
+            with os.fdopen(self.fd, 'rb') as stream:
+                for line in stream:
+                    message = self.parse(line)
+                    if message is not None:
+                        self.messages.put(message)
+        except Exception as e:
+            print(f"Error reading control channel: {e}", file=sys.stderr)
+        finally:
+            self.messages.put(None)
+
+    def parse(self, line):
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            message = json.loads(line.decode('utf-8'))
+        except ValueError as e:
+            print(f"[ask_user] 忽略无效的控制消息: {e}", file=sys.stderr)
+            return None
+        if not isinstance(message, dict) or message.get('type') not in self.MESSAGE_TYPES:
+            print(f"[ask_user] 忽略未知类型的控制消息: {line[:200].decode('utf-8', 'replace')}", file=sys.stderr)
+            return None
+        return message
+
+    def drain(self, limit):
+        """取出最多limit条消息，返回(消息列表, 通道是否已关闭)"""
+        batch = []
+        for _ in range(limit):
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if message is None:
+                return batch, True
+            batch.append(message)
+        return batch, False
+
+
+def open_stdin_stream():
+    """若stdin来自管道或重定向，则启动后台读取线程"""
+    try:
+        if sys.stdin is not None and not sys.stdin.isatty():
+            reader = StdinStreamReader(sys.stdin.fileno())
+            reader.start()
+            return reader
     except Exception as e:
         # 调试信息
         print(f"Error reading stdin: {e}", file=sys.stderr)
@@ -611,31 +2347,158 @@ def main():
                        help="显示在窗口中的提示信息")
     parser.add_argument("--countdown", "-c", type=int, default=60,
                        help="完成按钮倒计时秒数，默认60秒。传0关闭倒计时。")
+    parser.add_argument("--batch", action="store_true",
+                       help="批量提问：从stdin读取JSON问题列表，在一个窗口中回答，输出JSON答案")
+    parser.add_argument("--file", default=None,
+                       help="在只读预览区中展示的文件（内存映射，按可见行渲染），文本框作为回复区")
+    parser.add_argument("--backend", choices=["auto", "tk", "terminal", "script"],
+                       default=os.environ.get('ASK_USER_BACKEND') or "auto",
+                       help="输入界面：auto在无图形显示时自动使用终端，tk为窗口，terminal为终端，"
+                            "script为不显示界面立即自动提交（用于基准测试），默认取ASK_USER_BACKEND")
+    parser.add_argument("--serve", action="store_true",
+                       help="常驻模式：预先构建窗口并通过本地Unix socket接收提问")
+    parser.add_argument("--socket", default=None,
+                       help="常驻模式使用的socket路径，默认与ask_user.js约定的临时目录路径一致")
+    parser.add_argument("--result-fd", type=int, default=None,
+                       help="将结果以长度前缀的帧写入指定的文件描述符（供ask_user.js使用）")
+    parser.add_argument("--deadline", type=float, default=None,
+                       help="截止秒数（从进程启动计时）：到期仍未提交时输出默认回答并以退出码3结束")
+    parser.add_argument("--deadline-default", default=None,
+                       help=f"截止时间到期时的回答，默认为\"{DEFAULT_DEADLINE_ANSWER}\"（批量提问时为各问题的默认答案）")
+    parser.add_argument("--control-fd", type=int, default=None,
+                       help="从指定的文件描述符读取JSON行控制消息（更新提示、追加状态、调整倒计时、结束提问，供ask_user.js使用）")
+    parser.add_argument("--output", choices=["full", "diff"], default="full",
+                       help="full输出提交的完整内容；diff只输出相对stdin预填内容的修改（unified diff）")
+    parser.add_argument("--history", default=os.environ.get('ASK_USER_HISTORY'),
+                       help="回答历史数据库（SQLite），记录提交的回答，窗口中按Ctrl+R搜索，默认取ASK_USER_HISTORY，off为不记录")
+    parser.add_argument("--cache", default=None,
+                       help="回答缓存文件（格式与ask_user.js的.sleepdog/.cache/ask_user.json相同），规则匹配时直接返回缓存的回答")
+    parser.add_argument("--metrics", default=os.environ.get('ASK_USER_METRICS'),
+                       help="将本次会话的延迟数据以JSON行追加写入指定文件")
+    parser.add_argument("--session-id", default=None,
+                       help="写入metrics记录的会话ID，便于与ask_user.js的记录关联")
     parser.add_argument("--version", action="version", version="3.1.0")
     
     args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics, args.session_id)
     
+    if args.serve:
+        if not hasattr(socket, 'AF_UNIX'):
+            print("当前系统不支持常驻模式", file=sys.stderr)
+            sys.exit(1)
+        try:
+            load_tkinter()
+            server = PromptServer(args.socket or get_default_socket_path())
+            signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print(f"常驻模式运行出错: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+    
+    channel = ResultChannel(args.result_fd)
+    preview_file = None
+    watchdog = None
+    if args.deadline:
+        watchdog = DeadlineWatchdog(args.deadline, channel,
+                                    args.deadline_default if args.deadline_default is not None
+                                    else DEFAULT_DEADLINE_ANSWER)
+        watchdog.start()
     try:
-        # 检查stdin输入
-        stdin_content = check_stdin_input()
+        # 后台读取stdin，窗口无需等待读取完成即可显示
+        stdin_stream = open_stdin_stream()
+        history = AnswerHistory(args.history) if args.history not in (None, '', 'off') and not args.batch else None
+        control = None
+        if args.control_fd is not None:
+            control = ControlChannelReader(args.control_fd)
+            control.start()
+        if args.file:
+            preview_file = MappedTextFile(args.file)
         
-        # 创建并显示输入窗口
-        window = ModernPromptInputWindow(args.prompt, stdin_content, args.countdown)
+        # 无图形显示时直接使用终端输入，避免导入tkinter后再失败
+        use_terminal = args.backend == 'terminal' or (args.backend == 'auto' and not has_display())
+        stdin_content = cache = cache_status = None
+        if args.cache and not args.batch:
+            # 缓存键包含stdin内容，需先读取完整
+            cache = AnswerCache(args.cache)
+            stdin_content = stdin_stream.read_all() if stdin_stream else None
+            stdin_stream = None
+            cache_status, cached_answer = cache.lookup(args.prompt, stdin_content)
+            metrics.set('cache', cache_status)
+            if cache_status == 'hit':
+                print("[ask_user] 命中回答缓存", file=sys.stderr)
+                if args.output == 'diff':
+                    cached_answer = diff_submitted_text(stdin_content, cached_answer)
+                channel.send('submitted', cached_answer)
+                return
+        if args.batch:
+            questions = parse_batch_spec(stdin_stream.read_all() if stdin_stream else '')
+            if watchdog is not None and args.deadline_default is None:
+                watchdog.answer = json.dumps({question['id']: question['default'] for question in questions},
+                                             ensure_ascii=False)
+            if args.backend == 'script':
+                defaults = {question['id']: question['default'] for question in questions}
+                window = ScriptedPromptInput(json.dumps(defaults, ensure_ascii=False))
+            elif use_terminal:
+                window = TerminalBatchPromptInput(questions, args.countdown)
+            else:
+                load_tkinter()
+                window = BatchPromptInputWindow(questions, args.countdown)
+        elif args.backend == 'script':
+            if stdin_stream:
+                stdin_content = stdin_stream.read_all()
+            window = ScriptedPromptInput(stdin_content)
+        elif use_terminal:
+            if stdin_stream:
+                stdin_content = stdin_stream.read_all()
+            prompt = args.prompt
+            if preview_file is not None:
+                prompt += f"\n📄 {args.file}（共{preview_file.line_count}行）"
+            window = TerminalPromptInput(prompt, stdin_content, args.countdown)
+        else:
+            load_tkinter()
+            window = ModernPromptInputWindow(args.prompt, stdin_content, countdown_seconds=args.countdown,
+                                             stdin_stream=stdin_stream, preview_file=preview_file,
+                                             keep_original=args.output == 'diff', history=history)
+        # 终端后端不处理控制消息
+        if control is not None and hasattr(window, 'attach_control_channel'):
+            window.attach_control_channel(control)
         result = window.show()
+        if watchdog is not None:
+            watchdog.stop()
+        if cache_status == 'miss' and result is not None:
+            cache.store(args.prompt, stdin_content, result)
+            print("[ask_user] 未命中回答缓存，已记录本次回答", file=sys.stderr)
+        answer = result
+        if args.output == 'diff' and result is not None and not args.batch:
+            original = window.original_content() if hasattr(window, 'original_content') else stdin_content
+            diff_start = time.perf_counter()
+            result = diff_submitted_text(original, result)
+            metrics.set('diff_ms', round((time.perf_counter() - diff_start) * 1000, 3))
         
         # 输出结果
+        channel.send(result_status(result, window.end_reason), result)
         if result is not None:
-            print(result)
+            metrics.set('result_bytes', len(result.encode('utf-8')))
+            # 脚本后端的回答不是用户输入的，不记入历史
+            if not isinstance(window, ScriptedPromptInput):
+                record_history(history, args.prompt, answer)
         else:
-            print("用户取消了输入", file=sys.stderr)
             sys.exit(1)
             
     except KeyboardInterrupt:
-        print("\n程序被用户中断", file=sys.stderr)
+        channel.send('cancelled', message="\n程序被用户中断")
         sys.exit(1)
     except Exception as e:
-        print(f"程序运行出错: {e}", file=sys.stderr)
+        channel.send('error', message=f"程序运行出错: {e}")
         sys.exit(1)
+    finally:
+        if preview_file is not None:
+            preview_file.close()
+        metrics.write()
 
 
 if __name__ == "__main__":
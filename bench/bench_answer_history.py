@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回答历史（AnswerHistory）搜索延迟基准
+
+在临时数据库中写入N条合成回答（中英文混合，部分多行），统计：
+  - 打开数据库（首次按Ctrl+R时的耗时）
+  - 不同查询的搜索延迟：空查询、常见词、罕见词、不存在的词、短词（LIKE）、多个词
+  - 记录一次回答（含淘汰）的耗时
+并以--no-fts对比没有FTS5时的LIKE查询。
+
+用法：
+    python3 bench/bench_answer_history.py [--entries 100000] [--repeat 50] [--no-fts] [--json out.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ask_user_ui import AnswerHistory  # noqa: E402
+
+PHRASES = [
+    "继续", "请先运行单元测试", "修改一下变量命名", "回滚上一个提交", "检查日志输出",
+    "部署到测试环境", "补充边界条件的测试", "确认无误，可以合并", "把重复代码提取成函数",
+    "fix the flaky test", "refactor the parser", "update the changelog", "bump the version",
+]
+
+QUERIES = {
+    'empty': '',
+    'common': '单元测试',
+    'common_en': 'parser',
+    'rare': '#99991',
+    'missing': '不存在的回答',
+    'short_like': '继续',
+    'multi_term': '测试环境 回滚',
+}
+
+
+def make_answer(rng, index):
+    lines = [' '.join(rng.choice(PHRASES) for _ in range(rng.randint(1, 4)))
+             for _ in range(rng.choice((1, 1, 1, 3)))]
+    lines[-1] += f" #{index}"
+    return '\n'.join(lines)
+
+
+def populate(history, entries, seed=1):
+    """直接批量插入，比逐条record快得多（触发器同样维护FTS索引）"""
+    rng = random.Random(seed)
+    conn = history.connect()
+    with conn:
+        conn.executemany(
+            'INSERT INTO answers (key, prompt, answer, used_at) VALUES (?, ?, ?, ?)',
+            ((str(i), '请确认修改', make_answer(rng, i), time.time()) for i in range(entries)))
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'p50_ms': round(statistics.median(ordered), 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        'max_ms': round(ordered[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回答历史搜索延迟基准")
+    parser.add_argument("--entries", type=int, default=100000, help="历史回答条数，默认100000")
+    parser.add_argument("--repeat", type=int, default=50, help="每个查询的重复次数")
+    parser.add_argument("--no-fts", action="store_true", help="不创建FTS5索引，测试LIKE查询")
+    parser.add_argument("--json", default=None, help="将结果以JSON写入指定文件")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'history.db')
+        history = AnswerHistory(path, max_entries=args.entries)
+        if args.no_fts:
+            history.FTS_SCHEMA = "SELECT fts5_not_available();"
+        start = time.perf_counter()
+        populate(history, args.entries)
+        print(f"写入{args.entries}条: {time.perf_counter() - start:.1f}s  FTS5: {'是' if history.fts else '否'}")
+        history.close()
+
+        report = {'entries': args.entries, 'fts': not args.no_fts}
+        start = time.perf_counter()
+        history.connect()
+        report['open_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        print(f"  {'open':<12} {report['open_ms']:>9.3f} ms")
+        for name, query in QUERIES.items():
+            count = len(history.search(query))
+            stats = summarize(timed(lambda: history.search(query), args.repeat))
+            report[name] = dict(stats, results=count)
+            print(f"  {name:<12} p50 {stats['p50_ms']:>9.3f} ms   p95 {stats['p95_ms']:>9.3f} ms   "
+                  f"max {stats['max_ms']:>9.3f} ms   {count}条  {query!r}")
+        rng = random.Random(2)
+        stats = summarize(timed(lambda: history.record('请确认修改', make_answer(rng, rng.random())),
+                                args.repeat))
+        report['record'] = stats
+        print(f"  {'record':<12} p50 {stats['p50_ms']:>9.3f} ms   p95 {stats['p95_ms']:>9.3f} ms   "
+              f"max {stats['max_ms']:>9.3f} ms")
+        history.close()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ask_user_ui.py 交互处理函数延迟基准
+
+在Xvfb（或现有DISPLAY）下构建ModernPromptInputWindow，预填1KB~50MB的内容，
+通过event_generate驱动全选、失焦、按键、Ctrl+Enter等处理函数，统计每个处理函数的延迟；
+并模拟分块快速粘贴，统计滚动条布局请求次数、实际几何重排次数与pack调用次数
+（合并前的pack调用次数由布局请求次数推算，输出中标注为derived）。
+
+用法：
+    python3 bench/bench_ask_user_ui.py [--sizes 1K,1M,50M] [--repeat 20] [--json out.json]
+
+没有DISPLAY时会尝试自动启动Xvfb。
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import ask_user_ui  # noqa: E402
+
+DEFAULT_SIZES = "1K,64K,1M,10M,50M"
+UNITS = {'K': 1024, 'M': 1024 * 1024}
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def make_payload(size):
+    """生成指定字节数的多行文本，行宽与测试日志相近"""
+    line = "2025-01-10 12:00:00 INFO test_module.py::test_case PASSED [ 42%] 中文日志\n"
+    repeat = size // len(line.encode('utf-8')) + 1
+    return (line * repeat)[:size]
+
+
+def start_xvfb():
+    """没有DISPLAY时启动Xvfb，返回进程对象"""
+    if os.environ.get('DISPLAY'):
+        return None
+    xvfb = shutil.which('Xvfb')
+    if not xvfb:
+        sys.exit("没有可用的DISPLAY，且未找到Xvfb，请使用xvfb-run运行")
+    display = ':99'
+    proc = subprocess.Popen([xvfb, display, '-screen', '0', '1280x1024x24', '-nolisten', 'tcp'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ['DISPLAY'] = display
+    time.sleep(0.5)
+    return proc
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'p50_ms': round(statistics.median(ordered), 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        'max_ms': round(ordered[-1], 3),
+    }
+
+
+def bench_size(size, repeat):
+    payload = make_payload(size)
+    window = ask_user_ui.ModernPromptInputWindow("benchmark", countdown_seconds=0)
+    # 拦截提交，避免退出主循环
+    window.finish = lambda result, reason: None
+    root, text = window.root, window.text_area
+    root.update()
+
+    results = {}
+    start = time.perf_counter()
+    window.stdin_content = payload
+    window.set_stdin_content()
+    root.update_idletasks()
+    results['set_stdin_content'] = summarize([(time.perf_counter() - start) * 1000])
+    del payload
+
+    text.focus_force()
+    root.update()
+
+    handlers = {
+        'select_all (<Control-a>)': lambda: text.event_generate('<Control-a>'),
+        'focus_out (<FocusOut>)': lambda: text.event_generate('<FocusOut>'),
+        'key_press (<KeyPress>)': lambda: text.event_generate('<KeyPress>', keysym='Right'),
+        'ctrl_enter (<Control-Return>)': lambda: root.event_generate('<Control-Return>'),
+        'is_blank': window.is_blank,
+        'is_placeholder_content': window.is_placeholder_content,
+    }
+    for name, fn in handlers.items():
+        results[name] = summarize(timed(fn, repeat))
+        root.update()
+
+    root.destroy()
+    return results
+
+
+def bench_paste(size, chunks=200):
+    """模拟快速粘贴：分块插入并触发按键事件，统计布局请求与实际几何重排次数"""
+    payload = make_payload(size)
+    window = ask_user_ui.ModernPromptInputWindow("benchmark", countdown_seconds=0)
+    root, text = window.root, window.text_area
+    # 统计滚动条实际执行的pack/pack_forget次数
+    pack_calls = [0]
+    for scrollbar in (window.scrollbar_v, window.scrollbar_h):
+        for method in ('pack', 'pack_forget'):
+            original = getattr(scrollbar, method)
+
+            def counted(*args, _original=original, **kwargs):
+                pack_calls[0] += 1
+                return _original(*args, **kwargs)
+            setattr(scrollbar, method, counted)
+    root.update()
+    window.clear_placeholder()
+    text.focus_force()
+
+    step = max(1, len(payload) // chunks)
+    start = time.perf_counter()
+    for offset in range(0, len(payload), step):
+        text.insert('end-1c', payload[offset:offset + step])
+        text.event_generate('<KeyPress>', keysym='v', state=0x4)
+        text.event_generate('<KeyRelease>', keysym='v', state=0x4)
+        root.update()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    requested, dispatched = window.dispatcher.stats.get('scrollbars', [0, 0])
+    root.destroy()
+    return {
+        'elapsed_ms': round(elapsed_ms, 3),
+        'layout_requests': requested,
+        'layout_passes': dispatched,
+        'pack_calls': pack_calls[0],
+        # 推算值而非实测：合并前每次请求都会对两个滚动条各执行一次pack/pack_forget
+        'legacy_pack_calls_derived': requested * 2,
+        'geometry_passes': window.geometry_passes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ask_user_ui.py 处理函数延迟基准")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"缓冲区大小列表，默认{DEFAULT_SIZES}")
+    parser.add_argument("--repeat", type=int, default=20, help="每个处理函数的重复次数")
+    parser.add_argument("--json", default=None, help="将结果以JSON写入指定文件")
+    args = parser.parse_args()
+
+    xvfb = start_xvfb()
+    try:
+        ask_user_ui.load_tkinter()
+        report = {}
+        for size_text in args.sizes.split(','):
+            size = parse_size(size_text)
+            report[size_text] = bench_size(size, args.repeat)
+            print(f"== {size_text} ({size} bytes)")
+            for name, stats in report[size_text].items():
+                print(f"  {name:<32} p50 {stats['p50_ms']:>9.3f} ms   "
+                      f"p95 {stats['p95_ms']:>9.3f} ms   max {stats['max_ms']:>9.3f} ms")
+            paste = bench_paste(size)
+            report[size_text]['paste'] = paste
+            print(f"  {'paste (200 chunks)':<32} {paste['elapsed_ms']:.1f} ms   "
+                  f"layout requests {paste['layout_requests']} -> passes {paste['layout_passes']}   "
+                  f"pack calls {paste['pack_calls']} (legacy derived: {paste['legacy_pack_calls_derived']})")
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+
+
+if __name__ == "__main__":
+    main()
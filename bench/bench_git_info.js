@@ -0,0 +1,91 @@
+#!/usr/bin/env node
+/**
+ * git元数据获取耗时基准
+ *
+ * 对比原先formatContext使用的`git config user.name`（经shell启动git）与git-info.js：
+ *   - exec: execPromise('git config user.name')
+ *   - files: 直接解析.git（不使用缓存）
+ *   - cache: 按mtime缓存命中
+ *   - files+dirty / command+dirty: 额外判断工作区状态
+ *
+ * 用法：
+ *     node bench/bench_git_info.js [--repeat 50] [--cwd DIR] [--json out.json]
+ */
+
+import { exec } from 'child_process';
+import { promises as fs } from 'fs';
+import * as os from 'os';
+import * as path from 'path';
+import { performance } from 'perf_hooks';
+import { promisify } from 'util';
+import { getGitInfo, getGitInfoFromCommand } from '../git-info.js';
+
+const execPromise = promisify(exec);
+
+const parseOptions = (args) => {
+  const options = { repeat: 50, cwd: process.cwd(), json: null };
+  for (let i = 0; i < args.length; i++) {
+    if (args[i] === '--repeat') {
+      options.repeat = Number(args[++i]);
+    } else if (args[i] === '--cwd') {
+      options.cwd = path.resolve(args[++i]);
+    } else if (args[i] === '--json') {
+      options.json = args[++i];
+    }
+  }
+  return options;
+};
+
+const summarize = (samples) => {
+  const ordered = [...samples].sort((a, b) => a - b);
+  const pick = (q) => ordered[Math.min(ordered.length - 1, Math.floor(ordered.length * q))];
+  return {
+    p50_ms: Math.round(pick(0.5) * 1000) / 1000,
+    p95_ms: Math.round(pick(0.95) * 1000) / 1000,
+    max_ms: Math.round(ordered[ordered.length - 1] * 1000) / 1000
+  };
+};
+
+const timed = async (fn, repeat) => {
+  const samples = [];
+  for (let i = 0; i < repeat; i++) {
+    const start = performance.now();
+    await fn();
+    samples.push(performance.now() - start);
+  }
+  return summarize(samples);
+};
+
+const main = async () => {
+  const options = parseOptions(process.argv.slice(2));
+  const cacheDir = await fs.mkdtemp(path.join(os.tmpdir(), 'herding-git-bench-'));
+  const cachePath = path.join(cacheDir, 'git-info.json');
+  const { cwd, repeat } = options;
+
+  try {
+    const cases = {
+      'exec (git config user.name)': () => execPromise('git config user.name', { cwd }).catch(() => null),
+      'files': () => getGitInfo({ cwd, dirty: false }),
+      'cache': () => getGitInfo({ cwd, dirty: false, cachePath }),
+      'files+dirty': () => getGitInfo({ cwd, dirty: true }),
+      'command+dirty': () => getGitInfoFromCommand(cwd)
+    };
+    // 预先写入缓存
+    await getGitInfo({ cwd, dirty: false, cachePath });
+
+    const report = {};
+    for (const [name, fn] of Object.entries(cases)) {
+      report[name] = await timed(fn, repeat);
+      const stats = report[name];
+      console.log(`${name.padEnd(30)} p50 ${stats.p50_ms.toFixed(3).padStart(9)} ms   `
+        + `p95 ${stats.p95_ms.toFixed(3).padStart(9)} ms   max ${stats.max_ms.toFixed(3).padStart(9)} ms`);
+    }
+    if (options.json) {
+      await fs.writeFile(options.json, JSON.stringify(report, null, 2));
+    }
+  } finally {
+    await fs.rm(cacheDir, { recursive: true, force: true });
+  }
+};
+
+main();
@@ -0,0 +1,202 @@
+#!/usr/bin/env node
+/**
+ * gitignore.js与git的一致性测试
+ *
+ * 按随机种子生成若干组用例，每组在临时仓库中写入随机的.gitignore规则（根目录、子目录和.git/info/exclude）
+ * 以及随机的文件树，然后对所有文件和目录比较：
+ *   - git check-ignore --no-index --stdin 的结果
+ *   - GitignoreMatcher.isIgnored 的结果
+ * 有不一致时输出用例的规则和路径，并以退出码1结束。
+ *
+ * 用法：
+ *     node bench/conformance_gitignore.js [--cases 200] [--seed 1] [--paths 40] [--keep]
+ */
+
+import { execFile } from 'child_process';
+import { promises as fs } from 'fs';
+import * as os from 'os';
+import * as path from 'path';
+import { promisify } from 'util';
+import { GitignoreMatcher, GITIGNORE_FILE } from '../gitignore.js';
+
+const execFilePromise = promisify(execFile);
+
+// 路径中使用的名称，规则中的字面量从中选取，保证有足够多的命中
+const NAMES = ['a', 'b', 'ab', 'ba', 'foo', 'x.js', 'y.md', '#c', '!d', 'e f'];
+// 规则的路径段
+const SEGMENTS = [
+  'a', 'b', 'ab', 'foo', 'x.js', '*', '*.js', '*.md', '?', '??', 'a*', '*b', 'a*b',
+  '[ab]', '[!a]*', '[a-c]?', '**', '\\#c', '\\!d', 'e f', 'e\\ f', 'f[o]o'
+];
+const MAX_DEPTH = 4;
+
+const parseOptions = (args) => {
+  const options = { cases: 200, seed: 1, paths: 40, keep: false };
+  for (let i = 0; i < args.length; i++) {
+    if (args[i] === '--cases') {
+      options.cases = Number(args[++i]);
+    } else if (args[i] === '--seed') {
+      options.seed = Number(args[++i]);
+    } else if (args[i] === '--paths') {
+      options.paths = Number(args[++i]);
+    } else if (args[i] === '--keep') {
+      options.keep = true;
+    }
+  }
+  return options;
+};
+
+// 可复现的伪随机数（mulberry32）
+const createRandom = (seed) => {
+  let state = seed >>> 0;
+  const next = () => {
+    state = (state + 0x6d2b79f5) >>> 0;
+    let t = state;
+    t = Math.imul(t ^ (t >>> 15), t | 1);
+    t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+    return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+  };
+  next.int = (max) => Math.floor(next() * max);
+  next.pick = (items) => items[next.int(items.length)];
+  return next;
+};
+
+const generateRule = (random) => {
+  const segments = Array.from({ length: 1 + random.int(3) }, () => random.pick(SEGMENTS));
+  let rule = segments.join('/');
+  if (random() < 0.25) {
+    rule = `/${rule}`;
+  }
+  if (random() < 0.25) {
+    rule += '/';
+  }
+  if (random() < 0.25) {
+    rule = `!${rule}`;
+  }
+  if (random() < 0.05) {
+    // 未转义的结尾空格会被忽略
+    rule += '  ';
+  }
+  return rule;
+};
+
+const generateRules = (random) => {
+  const lines = Array.from({ length: 1 + random.int(6) }, () => generateRule(random));
+  if (random() < 0.2) {
+    lines.splice(random.int(lines.length + 1), 0, '# 注释', '');
+  }
+  return lines.join('\n') + '\n';
+};
+
+// 生成不冲突的文件路径集合，返回 { files, dirs }
+const generateTree = (random, count) => {
+  const files = new Set();
+  const dirs = new Set();
+  for (let i = 0; i < count; i++) {
+    const depth = 1 + random.int(MAX_DEPTH);
+    const parts = Array.from({ length: depth }, () => random.pick(NAMES));
+    const prefixes = parts.slice(0, -1).map((_, index) => parts.slice(0, index + 1).join('/'));
+    const filePath = parts.join('/');
+    // 同一路径不能既是文件又是目录
+    if (prefixes.some((prefix) => files.has(prefix)) || dirs.has(filePath)) {
+      continue;
+    }
+    prefixes.forEach((prefix) => dirs.add(prefix));
+    files.add(filePath);
+  }
+  return { files: [...files], dirs: [...dirs] };
+};
+
+const writeCase = async (repo, random, options) => {
+  await fs.mkdir(repo, { recursive: true });
+  await execFilePromise('git', ['init', '-q', repo]);
+  const tree = generateTree(random, options.paths);
+  for (const filePath of tree.files) {
+    await fs.mkdir(path.dirname(path.join(repo, filePath)), { recursive: true });
+    await fs.writeFile(path.join(repo, filePath), '');
+  }
+  const ignoreFiles = { [GITIGNORE_FILE]: generateRules(random) };
+  if (tree.dirs.length > 0 && random() < 0.5) {
+    ignoreFiles[`${random.pick(tree.dirs)}/${GITIGNORE_FILE}`] = generateRules(random);
+  }
+  if (random() < 0.3) {
+    ignoreFiles['.git/info/exclude'] = generateRules(random);
+  }
+  for (const [name, content] of Object.entries(ignoreFiles)) {
+    await fs.mkdir(path.dirname(path.join(repo, name)), { recursive: true });
+    await fs.writeFile(path.join(repo, name), content);
+  }
+  return { tree, ignoreFiles };
+};
+
+// git check-ignore返回被忽略的路径集合
+const gitIgnored = async (repo, paths) => {
+  const result = await new Promise((resolve, reject) => {
+    const child = execFile('git', ['check-ignore', '--no-index', '--stdin', '-z'], { cwd: repo }, (error, stdout) => {
+      // 没有路径被忽略时退出码为1
+      if (error && error.code !== 1) {
+        reject(error);
+      } else {
+        resolve(stdout);
+      }
+    });
+    child.stdin.end(paths.join('\0') + '\0');
+  });
+  return new Set(result.split('\0').filter(Boolean));
+};
+
+const runCase = async (repo, random, options) => {
+  const { tree, ignoreFiles } = await writeCase(repo, random, options);
+  const queries = [...tree.dirs.map((dir) => [dir, true]), ...tree.files.map((file) => [file, false])];
+  const expected = await gitIgnored(repo, queries.map(([relativePath]) => relativePath));
+  const matcher = await GitignoreMatcher.create(repo);
+  const mismatches = [];
+  for (const [relativePath, isDir] of queries) {
+    const actual = await matcher.isIgnored(relativePath, isDir);
+    if (actual !== expected.has(relativePath)) {
+      mismatches.push(`${relativePath}${isDir ? '/' : ''}  git: ${expected.has(relativePath)}  gitignore.js: ${actual}`);
+    }
+  }
+  return { ignoreFiles, queries: queries.length, ignored: expected.size, mismatches };
+};
+
+const main = async () => {
+  const options = parseOptions(process.argv.slice(2));
+  const workdir = await fs.mkdtemp(path.join(os.tmpdir(), 'herding-gitignore-'));
+  let checked = 0;
+  let ignored = 0;
+  let failedCases = 0;
+  try {
+    for (let index = 0; index < options.cases; index++) {
+      const random = createRandom(options.seed * 100003 + index);
+      const repo = path.join(workdir, `case${index}`);
+      const result = await runCase(repo, random, options);
+      checked += result.queries;
+      ignored += result.ignored;
+      if (result.mismatches.length > 0) {
+        failedCases++;
+        console.error(`用例${index}（--seed ${options.seed}）不一致：`);
+        for (const [name, content] of Object.entries(result.ignoreFiles)) {
+          console.error(`  ${name}:\n${content.trimEnd().split('\n').map((line) => `    ${JSON.stringify(line)}`).join('\n')}`);
+        }
+        console.error(result.mismatches.map((line) => `  ${line}`).join('\n'));
+      }
+      if (!options.keep) {
+        await fs.rm(repo, { recursive: true, force: true });
+      }
+    }
+  } finally {
+    if (!options.keep) {
+      await fs.rm(workdir, { recursive: true, force: true });
+    }
+  }
+  console.log(`${options.cases}个用例，比较了${checked}个路径（git忽略其中${ignored}个），${failedCases}个用例不一致`);
+  if (failedCases > 0) {
+    process.exit(1);
+  }
+};
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
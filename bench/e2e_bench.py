@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+get-project-info / ask_user 端到端延迟基准
+
+在合成仓库上运行真实的CLI进程，统计每种场景的p50/p95延迟与峰值RSS：
+  - 仓库规模：1k、100k、1M个条目（文件+目录），deep（窄而深）与wide（宽而浅）两种形状，
+    含node_modules、dist、日志等需被.gitignore排除的内容和子目录.gitignore
+  - get-project-info：cold（删除.sleepdog后初始化，使用本地模板代替git clone）、
+    warm（已初始化）、refresh-tree（增量刷新目录树）
+  - ask_user：通过ask_user.js启动ask_user_ui.py的script后端，立即自动提交
+
+用法：
+    python3 bench/e2e_bench.py [--scales 1k,100k,1M] [--shapes deep,wide] [--repeat 5]
+                               [--workdir DIR] [--json out.json]
+
+合成仓库生成在--workdir下并在多次运行间复用。
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GET_PROJECT_INFO = os.path.join(PACKAGE_DIR, 'get-project-info.js')
+ASK_USER = os.path.join(PACKAGE_DIR, 'ask_user.js')
+
+DEFAULT_SCALES = "1k,100k,1M"
+DEFAULT_SHAPES = "deep,wide"
+UNITS = {'K': 1000, 'M': 1000 * 1000}
+
+# 形状：每个目录的子目录数与文件数
+SHAPES = {
+    'deep': {'dirs': 2, 'files': 3},
+    'wide': {'dirs': 40, 'files': 20},
+}
+# 被.gitignore排除的内容占总条目数的比例
+IGNORED_SHARE = 0.2
+SOURCE_EXTENSIONS = ['.js', '.ts', '.py', '.go', '.java', '.md', '.json']
+
+ROOT_GITIGNORE = """# 依赖与构建产物
+node_modules/
+dist/
+build/
+coverage/
+*.log
+!keep.log
+.env
+"""
+NESTED_GITIGNORE = """generated/
+*.tmp
+"""
+
+TEMPLATE_PROJECT = """# 项目说明
+
+基准测试使用的本地模板。
+"""
+TEMPLATE_TODO = """# 任务清单
+
+- [ ] 示例任务
+"""
+
+
+def parse_scale(text):
+    text = text.strip().upper()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def touch(path):
+    with open(path, 'w'):
+        pass
+
+
+def generate_repo(path, entries, shape):
+    """生成指定条目数的合成仓库，已生成过时直接复用"""
+    marker = os.path.join(path, '.bench-complete')
+    if os.path.exists(marker):
+        with open(marker) as f:
+            return json.load(f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    rng = random.Random(f"{entries}-{shape}")
+    layout = SHAPES[shape]
+    stats = {'entries': 0, 'dirs': 0, 'files': 0, 'ignored_entries': 0}
+
+    with open(os.path.join(path, '.gitignore'), 'w') as f:
+        f.write(ROOT_GITIGNORE)
+
+    def fill(root, budget, key):
+        """按层序生成目录和文件，直到用完条目预算"""
+        queue = [root]
+        head = 0
+        while head < len(queue) and stats[key] < budget:
+            directory = queue[head]
+            head += 1
+            for i in range(layout['files']):
+                if stats[key] >= budget:
+                    return
+                touch(os.path.join(directory, f"file{i}{rng.choice(SOURCE_EXTENSIONS)}"))
+                stats[key] += 1
+                stats['files'] += 1
+            for i in range(layout['dirs']):
+                if stats[key] >= budget:
+                    return
+                child = os.path.join(directory, f"dir{i}")
+                os.mkdir(child)
+                stats[key] += 1
+                stats['dirs'] += 1
+                queue.append(child)
+                # 部分子目录带有自己的.gitignore和被其排除的生成目录
+                if rng.random() < 0.02:
+                    with open(os.path.join(child, '.gitignore'), 'w') as f:
+                        f.write(NESTED_GITIGNORE)
+                    os.mkdir(os.path.join(child, 'generated'))
+                    stats[key] += 1
+                    stats['dirs'] += 1
+
+    ignored_budget = int(entries * IGNORED_SHARE)
+    for name in ('node_modules', 'dist'):
+        os.mkdir(os.path.join(path, name))
+    fill(os.path.join(path, 'node_modules'), ignored_budget * 3 // 4, 'ignored_entries')
+    fill(os.path.join(path, 'dist'), ignored_budget, 'ignored_entries')
+    os.mkdir(os.path.join(path, 'logs'))
+    for i in range(10):
+        touch(os.path.join(path, 'logs', f"run{i}.log"))
+    touch(os.path.join(path, 'logs', 'keep.log'))
+    os.mkdir(os.path.join(path, 'src'))
+    fill(os.path.join(path, 'src'), entries - stats['ignored_entries'], 'entries')
+    stats['entries'] += stats['ignored_entries']
+
+    with open(marker, 'w') as f:
+        json.dump(stats, f)
+    return stats
+
+
+def make_template(path):
+    """本地模板目录，代替从GitHub克隆的template分支"""
+    os.makedirs(os.path.join(path, 'templates'), exist_ok=True)
+    with open(os.path.join(path, 'project.md'), 'w', encoding='utf-8') as f:
+        f.write(TEMPLATE_PROJECT)
+    with open(os.path.join(path, 'templates', '_todo.md'), 'w', encoding='utf-8') as f:
+        f.write(TEMPLATE_TODO)
+
+
+def run_measured(args, cwd, env, stdin_data=None):
+    """运行进程，返回(耗时毫秒, 峰值RSS KB)；进程失败时抛出异常"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(args, cwd=cwd, env=env, stdin=subprocess.PIPE,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if stdin_data is not None:
+        proc.stdin.write(stdin_data)
+    proc.stdin.close()
+    stderr = proc.stderr.read()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} 退出码 {proc.returncode}: {stderr.decode('utf-8', 'replace')}")
+    # Linux上ru_maxrss单位为KB，macOS为字节
+    peak_rss_kb = rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+    return elapsed_ms, peak_rss_kb
+
+
+def summarize(samples):
+    times = sorted(sample[0] for sample in samples)
+    return {
+        'p50_ms': round(statistics.median(times), 3),
+        'p95_ms': round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+        'max_ms': round(times[-1], 3),
+        'peak_rss_kb': max(sample[1] for sample in samples),
+        'runs': len(samples),
+    }
+
+
+def reset_sleepdog(repo):
+    shutil.rmtree(os.path.join(repo, '.sleepdog'), ignore_errors=True)
+    shutil.rmtree(os.path.join(repo, '.cursor'), ignore_errors=True)
+
+
+def bench_repo(repo, env, repeat):
+    node = shutil.which('node') or 'node'
+    cases = {}
+
+    cold = []
+    for _ in range(repeat):
+        reset_sleepdog(repo)
+        cold.append(run_measured([node, GET_PROJECT_INFO], repo, env))
+    cases['get-project-info cold'] = summarize(cold)
+
+    cases['get-project-info warm'] = summarize(
+        [run_measured([node, GET_PROJECT_INFO], repo, env) for _ in range(repeat)])
+    cases['get-project-info --refresh-tree'] = summarize(
+        [run_measured([node, GET_PROJECT_INFO, '--refresh-tree'], repo, env) for _ in range(repeat)])
+
+    ask_env = dict(env, ASK_USER_BACKEND='script')
+    cases['ask_user round trip'] = summarize(
+        [run_measured([node, ASK_USER, '请审查代码修改并提供反馈'], repo, ask_env) for _ in range(repeat)])
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="get-project-info / ask_user 端到端延迟基准")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help=f"仓库条目数列表，默认{DEFAULT_SCALES}")
+    parser.add_argument("--shapes", default=DEFAULT_SHAPES, help=f"仓库形状列表，默认{DEFAULT_SHAPES}")
+    parser.add_argument("--repeat", type=int, default=5, help="每个场景的重复次数")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), 'herding-e2e-bench'),
+                        help="合成仓库所在目录，多次运行间复用")
+    parser.add_argument("--json", default=None, help="将结果以JSON写入指定文件")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    template = os.path.join(args.workdir, 'template')
+    make_template(template)
+    home = tempfile.mkdtemp(prefix='herding-bench-home-')
+    # 隔离HOME，避免初始化时修改真实的.bashrc；ask_user不连接常驻进程
+    env = dict(os.environ,
+               HOME=home,
+               HERDING_TEMPLATE_DIR=template,
+               TASK_TRACE_ID='herding-e2e-bench',
+               ASK_USER_SOCKET=os.path.join(home, 'no-server.sock'))
+    env.pop('PLAN', None)
+    env.pop('ASK_USER_METRICS', None)
+
+    report = {
+        'meta': {
+            'started_at': time.time(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'node': subprocess.run(['node', '--version'], capture_output=True, text=True).stdout.strip(),
+            'repeat': args.repeat,
+        },
+        'results': {},
+    }
+    try:
+        for scale_text in args.scales.split(','):
+            for shape in args.shapes.split(','):
+                name = f"{scale_text}-{shape}"
+                repo = os.path.join(args.workdir, name)
+                print(f"== {name}: 生成仓库...", flush=True)
+                stats = generate_repo(repo, parse_scale(scale_text), shape)
+                cases = bench_repo(repo, env, args.repeat)
+                report['results'][name] = {'repo': stats, 'cases': cases}
+                for case, result in cases.items():
+                    print(f"  {case:<34} p50 {result['p50_ms']:>10.1f} ms   p95 {result['p95_ms']:>10.1f} ms   "
+                          f"peak RSS {result['peak_rss_kb'] / 1024:>7.1f} MB", flush=True)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env node
+/**
+ * 多个agent并发使用同一个.sleepdog的压力测试
+ *
+ * 在临时目录中同时启动多个get-project-info（首次初始化、PLAN=true、--refresh-tree，
+ * 部分没有TASK_TRACE_ID）和ask_user（脚本后端）进程，结束后检查：
+ *   - 所有进程都以退出码0结束
+ *   - project.md中只有一个目录树区块，.sleepdog下没有残留的临时文件和锁目录
+ *   - 同一TASK_TRACE_ID的任务文件只创建一次且内容完整
+ *   - $HOME/.bashrc中最多追加一次TASK_TRACE_ID（只有执行初始化的进程没有TASK_TRACE_ID时才追加）
+ *
+ * 用法：
+ *     node bench/stress_sleepdog.js [--processes 48] [--rounds 3] [--workdir DIR] [--keep]
+ */
+
+import { spawn } from 'child_process';
+import { promises as fs } from 'fs';
+import * as os from 'os';
+import * as path from 'path';
+import { fileURLToPath } from 'url';
+import { performance } from 'perf_hooks';
+
+const ROOT = path.resolve(path.dirname(fileURLToPath(import.meta.url)), '..');
+const GET_PROJECT_INFO = path.join(ROOT, 'get-project-info.js');
+const ASK_USER = path.join(ROOT, 'ask_user.js');
+
+const TREE_START = '<!-- herding:file-tree:start -->';
+const TEMPLATE_PROJECT = '# 项目说明\n\n压力测试使用的模板。\n';
+const TEMPLATE_TODO = '# 任务清单\n\n- [ ] 拆分任务\n';
+
+const parseOptions = (args) => {
+  const options = { processes: 48, rounds: 3, workdir: null, keep: false };
+  for (let i = 0; i < args.length; i++) {
+    if (args[i] === '--processes') {
+      options.processes = Number(args[++i]);
+    } else if (args[i] === '--rounds') {
+      options.rounds = Number(args[++i]);
+    } else if (args[i] === '--workdir') {
+      options.workdir = path.resolve(args[++i]);
+    } else if (args[i] === '--keep') {
+      options.keep = true;
+    }
+  }
+  return options;
+};
+
+const makeRepo = async (repo) => {
+  for (let i = 0; i < 20; i++) {
+    const dir = path.join(repo, 'src', `module${i}`);
+    await fs.mkdir(dir, { recursive: true });
+    await fs.writeFile(path.join(dir, 'index.js'), `export const id = ${i};\n`);
+  }
+};
+
+const makeTemplate = async (template) => {
+  await fs.mkdir(path.join(template, 'templates'), { recursive: true });
+  await fs.writeFile(path.join(template, 'project.md'), TEMPLATE_PROJECT);
+  await fs.writeFile(path.join(template, 'templates', '_todo.md'), TEMPLATE_TODO);
+};
+
+const run = (script, args, { cwd, env, stdin }) => new Promise((resolve) => {
+  const start = performance.now();
+  const child = spawn(process.execPath, [script, ...args], { cwd, env, stdio: ['pipe', 'pipe', 'pipe'] });
+  let stderr = '';
+  child.stdout.resume();
+  child.stderr.on('data', (data) => {
+    stderr += data;
+  });
+  child.stdin.end(stdin || '');
+  child.on('close', (code) => {
+    resolve({ command: `${path.basename(script)} ${args.join(' ')}`, code, stderr, ms: performance.now() - start });
+  });
+});
+
+// 第i个进程的角色：大部分为get-project-info，其余为ask_user和--refresh-tree
+const jobFor = (i, round, repo, baseEnv) => {
+  const env = { ...baseEnv };
+  // 8个agent共用TASK_TRACE_ID，第一轮中部分进程没有TASK_TRACE_ID（会写入.bashrc）
+  if (round === 0 && i % 6 === 5) {
+    delete env.TASK_TRACE_ID;
+  } else {
+    env.TASK_TRACE_ID = `stress-${i % 8}`;
+  }
+  if (i % 5 === 3) {
+    return [ASK_USER, ['请确认'], { cwd: repo, env: { ...env, PLAN: 'true' }, stdin: '继续' }];
+  }
+  if (round > 0 && i % 7 === 2) {
+    return [GET_PROJECT_INFO, ['--refresh-tree'], { cwd: repo, env }];
+  }
+  return [GET_PROJECT_INFO, [], { cwd: repo, env: { ...env, PLAN: i % 2 === 0 ? 'true' : 'false' } }];
+};
+
+// 收集.sleepdog下残留的临时文件和锁目录
+const findLeftovers = async (dir, leftovers = []) => {
+  for (const entry of await fs.readdir(dir, { withFileTypes: true })) {
+    const fullPath = path.join(dir, entry.name);
+    if (entry.name.endsWith('.tmp') || entry.name.includes('.tmp-')) {
+      leftovers.push(fullPath);
+    } else if (entry.name === '.locks') {
+      // 锁释放后锁目录即被删除，.locks本身保留
+      for (const name of await fs.readdir(fullPath)) {
+        leftovers.push(path.join(fullPath, name));
+      }
+    } else if (entry.isDirectory()) {
+      await findLeftovers(fullPath, leftovers);
+    }
+  }
+  return leftovers;
+};
+
+const check = async (repo, home) => {
+  const failures = [];
+  const sleepDogPath = path.join(repo, '.sleepdog');
+  const project = await fs.readFile(path.join(sleepDogPath, 'project.md'), 'utf-8');
+  const blocks = project.split(TREE_START).length - 1;
+  if (blocks !== 1) {
+    failures.push(`project.md中有${blocks}个目录树区块`);
+  }
+  if (!project.startsWith(TEMPLATE_PROJECT)) {
+    failures.push('project.md开头不是模板内容');
+  }
+
+  const leftovers = [
+    ...await findLeftovers(sleepDogPath),
+    ...(await fs.readdir(repo)).filter((name) => name.startsWith('.sleepdog.')).map((name) => path.join(repo, name))
+  ];
+  for (const leftover of leftovers) {
+    failures.push(`残留文件: ${path.relative(repo, leftover)}`);
+  }
+
+  const taskDir = path.join(sleepDogPath, 'task');
+  for (const name of await fs.readdir(taskDir)) {
+    if (!name.endsWith('.md')) {
+      continue;
+    }
+    const content = await fs.readFile(path.join(taskDir, name), 'utf-8');
+    if (content !== TEMPLATE_TODO) {
+      failures.push(`任务文件内容不完整: ${name}`);
+    }
+  }
+
+  const bashrc = await fs.readFile(path.join(home, '.bashrc'), 'utf-8').catch(() => '');
+  const exports = bashrc.split('export TASK_TRACE_ID=').length - 1;
+  if (exports > 1) {
+    failures.push(`.bashrc中追加了${exports}次TASK_TRACE_ID`);
+  }
+  if ((await fs.readdir(home)).some((name) => name.endsWith('.lock'))) {
+    failures.push('$HOME下残留.bashrc的锁目录');
+  }
+  return failures;
+};
+
+const main = async () => {
+  const options = parseOptions(process.argv.slice(2));
+  const workdir = options.workdir || await fs.mkdtemp(path.join(os.tmpdir(), 'herding-stress-'));
+  const repo = path.join(workdir, 'repo');
+  const home = path.join(workdir, 'home');
+  const template = path.join(workdir, 'template');
+  await fs.rm(repo, { recursive: true, force: true });
+  await fs.rm(home, { recursive: true, force: true });
+  await makeRepo(repo);
+  await makeTemplate(template);
+  await fs.mkdir(home, { recursive: true });
+
+  const baseEnv = {
+    ...process.env,
+    HOME: home,
+    HERDING_TEMPLATE_DIR: template,
+    ASK_USER_BACKEND: 'script'
+  };
+  delete baseEnv.ASK_USER_SOCKET;
+  delete baseEnv.ASK_USER_DEADLINE;
+
+  const failures = [];
+  for (let round = 0; round < options.rounds; round++) {
+    const start = performance.now();
+    const results = await Promise.all(Array.from({ length: options.processes }, (_, i) => {
+      const [script, args, runOptions] = jobFor(i, round, repo, baseEnv);
+      return run(script, args, runOptions);
+    }));
+    const slowest = Math.max(...results.map((result) => result.ms));
+    console.log(`第${round + 1}轮：${results.length}个进程，总耗时${Math.round(performance.now() - start)}ms，最慢${Math.round(slowest)}ms`);
+    for (const result of results.filter((result) => result.code !== 0)) {
+      failures.push(`${result.command} 退出码${result.code}: ${result.stderr.trim().split('\n').pop()}`);
+    }
+    // 在两轮之间修改目录，下一轮的--refresh-tree与其他进程并发写入project.md
+    await fs.mkdir(path.join(repo, 'src', `added${round}`), { recursive: true });
+  }
+  failures.push(...await check(repo, home));
+
+  if (!options.keep && !options.workdir) {
+    await fs.rm(workdir, { recursive: true, force: true });
+  }
+  if (failures.length > 0) {
+    console.error(failures.join('\n'));
+    process.exit(1);
+  }
+  console.log('检查通过');
+};
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
@@ -8,13 +8,11 @@
  * @date 2025-01-10
  */
 
-import { exec } from "child_process";
 import { existsSync, promises as fs } from "fs";
 import * as path from "path";
-import { promisify } from "util";
 import * as os from "os";
-
-const execPromise = promisify(exec);
+import { createHash, randomBytes } from "crypto";
+import { getGitInfo } from "./git-info.js";
 
 // ==================== 常量配置 ====================
 
@@ -27,9 +25,17 @@ export const IS_LINUX = SYSTEM_TYPE === 'linux';
 // 路径常量
 export const SLEEPDOG_DIR = '.sleepdog';
 export const TASK_DIR = 'task';
+export const CACHE_DIR = '.cache';
+export const LOCK_DIR = '.locks';
+export const ASK_USER_DIR = '.ask_user';
+// 工具自身在.sleepdog下维护的目录（锁、缓存、异步提问的工单和回答历史），初始化之前就可能被创建
+export const TOOL_OWNED_DIRS = [LOCK_DIR, CACHE_DIR, ASK_USER_DIR];
+// 初始化.sleepdog时使用的锁目录（.sleepdog尚不存在，位于项目根目录）
+export const INIT_LOCK_DIR = `${SLEEPDOG_DIR}.lock`;
 export const TEMPLATES_DIR = 'templates';
 export const CURSOR_RULES_DIR = '.cursor/rules';
 export const ASK_USER_SCRIPT = 'ask_user_ui.py';
+export const ASK_USER_SOCKET_PREFIX = 'herding-ask-user';
 
 // 文件名常量
 export const PROJECT_FILE = 'project.md';
@@ -80,7 +86,7 @@ export const FOLDER_BLACKLIST = [
   "vendor",
 ];
 
-export const FORCE_BLACKLIST = [".git", SLEEPDOG_DIR, ".vscode", ".idea"];
+export const FORCE_BLACKLIST = [".git", SLEEPDOG_DIR, INIT_LOCK_DIR, ".vscode", ".idea"];
 
 // 任务状态常量
 export const TASK_STATUS = {
@@ -95,8 +101,17 @@ export const MESSAGES = {
   TASK_COMPLETE_TIP: '最后：请阅读.sleepdog/project.md，并根据您刚才所做的更改更新它们。',
   DEFAULT_TIPS: '请提供反馈',
   SCRIPT_NOT_FOUND: '⚠️  未找到ask_user_ui.py文件，请确保已正确安装herding工具',
-  INIT_SUCCESS: 'Successfully initialized .sleepDog directory with template'
+  INIT_SUCCESS: 'Successfully initialized .sleepDog directory with template',
+  // 截止时间到期时的默认回答，需与ask_user_ui.py中的DEFAULT_DEADLINE_ANSWER保持一致
+  DEADLINE_DEFAULT: '继续'
+};
+
+// ask_user_ui.py结果帧类型，需与ask_user_ui.py中的RESULT_FRAME_*保持一致
+export const RESULT_FRAME = {
+  STATUS: 1,
+  RESULT: 2
 };
+const RESULT_FRAME_HEADER_SIZE = 5;
 
 // ==================== 公共工具函数 ====================
 
@@ -118,8 +133,17 @@ export const getPPID = () => {
 
 /**
  * 生成任务ID（异步版本）
+ * 同一进程内多次调用结果相同，只计算一次
  */
-export const generateTaskId = async () => {
+let taskIdPromise = null;
+export const generateTaskId = () => {
+  if (!taskIdPromise) {
+    taskIdPromise = computeTaskId();
+  }
+  return taskIdPromise;
+};
+
+const computeTaskId = async () => {
   // 方法1: 优先使用TASK_TRACE_ID（如果存在）
   if (process.env.TASK_TRACE_ID) {
     // 使用TASK_TRACE_ID的哈希值作为会话ID
@@ -151,15 +175,10 @@ export const getCurrentDate = () => {
 };
 
 /**
- * 获取Git用户名
+ * 获取git元数据缓存文件路径，.sleepdog尚未初始化时不缓存
  */
-export const getGitUserName = async () => {
-  try {
-    const { stdout } = await execPromise('git config user.name');
-    return stdout.trim();
-  } catch (error) {
-    return 'unknown';
-  }
+const getGitInfoCachePath = () => {
+  return existsSync(getSleepDogPath()) ? path.join(getCacheDirPath(), 'git-info.json') : null;
 };
 
 /**
@@ -183,6 +202,27 @@ export const getTaskDirPath = () => {
   return path.join(getSleepDogPath(), TASK_DIR);
 };
 
+/**
+ * 获取缓存目录路径
+ */
+export const getCacheDirPath = () => {
+  return path.join(getSleepDogPath(), CACHE_DIR);
+};
+
+/**
+ * 获取.sleepdog内的锁路径
+ */
+export const getLockPath = (name) => {
+  return path.join(getSleepDogPath(), LOCK_DIR, name);
+};
+
+/**
+ * 获取初始化锁路径
+ */
+export const getInitLockPath = () => {
+  return path.join(getProjectRoot(), INIT_LOCK_DIR);
+};
+
 /**
  * 获取任务文件路径
  */
@@ -226,6 +266,60 @@ export const findAskUserScript = () => {
   return possiblePaths[0]; // 返回当前目录作为默认值
 };
 
+/**
+ * 获取ask_user_ui.py常驻模式的socket路径
+ * 需与ask_user_ui.py中的get_default_socket_path保持一致
+ */
+export const getAskUserSocketPath = () => {
+  if (process.env.ASK_USER_SOCKET) {
+    return process.env.ASK_USER_SOCKET;
+  }
+  const uid = typeof process.getuid === 'function' ? process.getuid() : 0;
+  return path.join(os.tmpdir(), `${ASK_USER_SOCKET_PREFIX}-${uid}.sock`);
+};
+
+/**
+ * 获取ask_user --control控制通道的socket路径
+ * 按项目根目录和名称区分，不同项目中的同名通道互不影响
+ */
+export const getAskUserControlPath = (name) => {
+  const uid = typeof process.getuid === 'function' ? process.getuid() : 0;
+  const key = createHash('sha1').update(`${getProjectRoot()}\0${name}`).digest('hex').slice(0, 16);
+  return path.join(os.tmpdir(), `${ASK_USER_SOCKET_PREFIX}-${uid}-control-${key}.sock`);
+};
+
+/**
+ * 解析ask_user_ui.py输出的结果帧（1字节类型 + 4字节大端长度 + 内容）
+ * 返回 { status, message, result }，没有状态帧时返回null
+ */
+export const parseResultFrames = (buffer) => {
+  let header = null;
+  let result = null;
+  let offset = 0;
+  while (offset + RESULT_FRAME_HEADER_SIZE <= buffer.length) {
+    const kind = buffer.readUInt8(offset);
+    const length = buffer.readUInt32BE(offset + 1);
+    const start = offset + RESULT_FRAME_HEADER_SIZE;
+    if (start + length > buffer.length) {
+      throw new Error(`结果帧不完整: 需要${length}字节，实际${buffer.length - start}字节`);
+    }
+    const payload = buffer.subarray(start, start + length);
+    if (kind === RESULT_FRAME.STATUS) {
+      header = JSON.parse(payload.toString('utf8'));
+    } else if (kind === RESULT_FRAME.RESULT) {
+      result = payload.toString('utf8');
+    }
+    offset = start + length;
+  }
+  if (!header) {
+    return null;
+  }
+  if (result !== null && header.bytes !== undefined && Buffer.byteLength(result) !== header.bytes) {
+    throw new Error(`结果长度不一致: 声明${header.bytes}字节`);
+  }
+  return { status: header.status, message: header.message, result };
+};
+
 /**
  * 检查文件是否存在
  */
@@ -240,6 +334,24 @@ export const ensureDir = async (dirPath) => {
   await fs.mkdir(dirPath, { recursive: true });
 };
 
+/**
+ * 递归复制目录（fs.cp需要Node 16.7以上）
+ */
+export const copyDirectory = async (sourceDir, targetDir) => {
+  await ensureDir(targetDir);
+  for (const dirent of await fs.readdir(sourceDir, { withFileTypes: true })) {
+    const sourcePath = path.join(sourceDir, dirent.name);
+    const targetPath = path.join(targetDir, dirent.name);
+    if (dirent.isDirectory()) {
+      await copyDirectory(sourcePath, targetPath);
+    } else if (dirent.isSymbolicLink()) {
+      await fs.symlink(await fs.readlink(sourcePath), targetPath);
+    } else {
+      await fs.copyFile(sourcePath, targetPath);
+    }
+  }
+};
+
 /**
  * 读取文件内容
  */
@@ -254,6 +366,55 @@ export const writeFile = async (filePath, content) => {
   await fs.writeFile(filePath, content);
 };
 
+/**
+ * 原子写入文件内容：先写临时文件再重命名，读者不会看到写了一半的文件
+ */
+export const writeFileAtomic = async (filePath, content) => {
+  await ensureDir(path.dirname(filePath));
+  // 临时文件名带随机后缀，同一进程内并发写入同一文件时也不会冲突
+  const tmpPath = `${filePath}.${process.pid}.${randomBytes(4).toString('hex')}.tmp`;
+  try {
+    await fs.writeFile(tmpPath, content);
+    await fs.rename(tmpPath, filePath);
+  } catch (error) {
+    await fs.rm(tmpPath, { force: true });
+    throw error;
+  }
+};
+
+/**
+ * 原子创建文件：文件已存在时不覆盖并返回false
+ * 先写临时文件再硬链接到目标路径，读者不会看到写了一半的文件，并发创建时只有一个成功
+ */
+export const createFileAtomic = async (filePath, content) => {
+  await ensureDir(path.dirname(filePath));
+  const tmpPath = `${filePath}.${process.pid}.${randomBytes(4).toString('hex')}.tmp`;
+  await fs.writeFile(tmpPath, content);
+  try {
+    await fs.link(tmpPath, filePath);
+    return true;
+  } catch (error) {
+    if (error.code === 'EEXIST') {
+      return false;
+    }
+    throw error;
+  } finally {
+    await fs.rm(tmpPath, { force: true });
+  }
+};
+
+/**
+ * 判断本机进程是否仍在运行
+ */
+export const isProcessAlive = (pid) => {
+  try {
+    process.kill(pid, 0);
+    return true;
+  } catch (error) {
+    return error.code === 'EPERM';
+  }
+};
+
 /**
  * 追加文件内容
  */
@@ -305,14 +466,22 @@ export const formatFileContent = (fileName, content) => {
  * 格式化上下文信息
  */
 export const formatContext = async () => {
-  const gitUserName = await getGitUserName();
+  // 检查工作区状态需要stat所有已跟踪的文件，设置HERDING_GIT_DIRTY=1时才检查
+  const checkDirty = process.env.HERDING_GIT_DIRTY === '1';
+  const git = await getGitInfo({ cachePath: getGitInfoCachePath(), dirty: checkDirty });
   const currentTime = getCurrentTime();
+  const context = {
+    userName: git.userName || 'unknown',
+    currentTime: currentTime,
+    branch: git.branch,
+    commit: git.commit
+  };
+  if (checkDirty) {
+    context.dirty = git.dirty;
+  }
   return `
 <context>
-${JSON.stringify({
-    userName: gitUserName,
-    currentTime: currentTime
-  }, null, 2)}
+${JSON.stringify(context, null, 2)}
 </context>
 `;
 };
@@ -0,0 +1,134 @@
+#!/usr/bin/env node
+
+/**
+ * context-bundle - get-project-info输出的.sleepdog文件内容
+ * 并发读取.sleepdog下的非隐藏文件，按字节预算截断，
+ * 并以各文件的(名称, mtime, 大小)为键缓存渲染结果，文件都未变化时不再读取
+ */
+
+import { promises as fs } from 'fs';
+import * as path from 'path';
+import {
+  getCacheDirPath,
+  fileExists,
+  readFile,
+  writeFileAtomic,
+  formatFileContent
+} from './common.js';
+
+export const CONTEXT_BUNDLE_CACHE_FILE = 'context-bundle.json';
+
+export const DEFAULT_BUNDLE_OPTIONS = {
+  // 单个文件最多输出的字节数
+  maxFileBytes: 64 * 1024,
+  // 所有文件合计最多输出的字节数
+  maxTotalBytes: 256 * 1024
+};
+
+const BUNDLE_OPTION_ENV = {
+  maxFileBytes: 'HERDING_CONTEXT_MAX_FILE_BYTES',
+  maxTotalBytes: 'HERDING_CONTEXT_MAX_BYTES'
+};
+
+/**
+ * 从环境变量读取字节预算，未设置的使用默认值
+ */
+export const bundleOptionsFromEnv = () => {
+  const options = { ...DEFAULT_BUNDLE_OPTIONS };
+  for (const [name, envName] of Object.entries(BUNDLE_OPTION_ENV)) {
+    const value = Number(process.env[envName]);
+    if (process.env[envName] && value > 0) {
+      options[name] = value;
+    }
+  }
+  return options;
+};
+
+/**
+ * 获取上下文缓存文件路径
+ */
+export const getContextBundleCachePath = () => {
+  return path.join(getCacheDirPath(), CONTEXT_BUNDLE_CACHE_FILE);
+};
+
+// 读取文件开头的limit个字节，截断处不完整的UTF-8字符会被去掉
+const readHead = async (filePath, limit) => {
+  const handle = await fs.open(filePath, 'r');
+  try {
+    const buffer = Buffer.alloc(limit);
+    const { bytesRead } = await handle.read(buffer, 0, limit, 0);
+    return buffer.subarray(0, bytesRead).toString('utf8').replace(/\uFFFD+$/, '');
+  } finally {
+    await handle.close();
+  }
+};
+
+// 列出目录下的非隐藏文件及其mtime和大小，按名称排序
+const listFiles = async (dir) => {
+  const entries = await fs.readdir(dir, { withFileTypes: true });
+  const names = entries
+    .filter((entry) => !entry.name.startsWith('.') && !entry.isDirectory())
+    .map((entry) => entry.name)
+    .sort();
+  const stats = await Promise.all(names.map((name) => fs.stat(path.join(dir, name)).catch(() => null)));
+  return names
+    .map((name, i) => (stats[i] && stats[i].isFile() ? { name, mtimeMs: stats[i].mtimeMs, size: stats[i].size } : null))
+    .filter(Boolean);
+};
+
+/**
+ * 生成目录下所有非隐藏文件的<file:...>内容
+ * 超过maxFileBytes的文件只输出开头部分；合计超过maxTotalBytes后，剩余文件截断或跳过
+ */
+export const buildContextBundle = async (dir, options = {}) => {
+  const { maxFileBytes, maxTotalBytes, cachePath = getContextBundleCachePath() } = {
+    ...DEFAULT_BUNDLE_OPTIONS,
+    ...options
+  };
+  const files = await listFiles(dir);
+  const key = JSON.stringify({ maxFileBytes, maxTotalBytes, files });
+
+  if (cachePath && fileExists(cachePath)) {
+    try {
+      const cached = JSON.parse(await readFile(cachePath));
+      if (cached.key === key) {
+        return cached.bundle;
+      }
+    } catch (error) {
+      // 缓存损坏时重新生成
+    }
+  }
+
+  // 先按预算分配每个文件读取的字节数，再并发读取
+  let remaining = maxTotalBytes;
+  const plans = files.map((file) => {
+    const limit = Math.min(file.size, maxFileBytes, remaining);
+    remaining -= limit;
+    return { ...file, limit };
+  });
+  const contents = await Promise.all(plans.map((plan) => {
+    if (plan.limit === 0 && plan.size > 0) {
+      return null;
+    }
+    const filePath = path.join(dir, plan.name);
+    return plan.limit < plan.size ? readHead(filePath, plan.limit) : readFile(filePath);
+  }));
+
+  const parts = plans.map((plan, i) => {
+    if (contents[i] === null) {
+      return formatFileContent(plan.name, `...（已超出输出预算，未读取，共${plan.size}字节）`);
+    }
+    const suffix = plan.limit < plan.size ? `\n...（文件过大，已截断，共${plan.size}字节）` : '';
+    return formatFileContent(plan.name, contents[i] + suffix);
+  });
+  const bundle = parts.join('\n');
+
+  if (cachePath) {
+    try {
+      await writeFileAtomic(cachePath, JSON.stringify({ key, bundle }));
+    } catch (error) {
+      // 缓存写入失败不影响输出
+    }
+  }
+  return bundle;
+};
@@ -0,0 +1,528 @@
+#!/usr/bin/env node
+
+/**
+ * file-tree - 项目目录树遍历
+ * 以有限并发的任务队列预读目录，按名称排序后以深度优先顺序逐个产出目录节点，
+ * 输出顺序与并发度无关；支持最大深度、最大条目数和总耗时限制。
+ * 预读的目录数不超过遍历位置之后的一个窗口，遍历因限制停止时读取也随之停止。
+ * 遍历结果可保存为快照（记录每个目录的mtime），再次遍历时只读取mtime有变化的目录。
+ * 写入project.md的目录树由renderFileTree在行数和字节数预算内折叠渲染
+ */
+
+import { promises as fs } from 'fs';
+import * as path from 'path';
+import { performance } from 'perf_hooks';
+import { GitignoreMatcher, GITIGNORE_FILE } from './gitignore.js';
+import {
+  getCacheDirPath,
+  fileExists,
+  readFile,
+  writeFileAtomic,
+  TREE_INDENT,
+  FOLDER_BLACKLIST,
+  FORCE_BLACKLIST
+} from './common.js';
+
+export const TREE_SNAPSHOT_FILE = 'tree-snapshot.json';
+const SNAPSHOT_VERSION = 2;
+
+export const DEFAULT_WALK_OPTIONS = {
+  concurrency: 16,
+  maxDepth: 64,
+  maxEntries: 100000,
+  timeBudgetMs: 30000,
+  // 已开始读取但尚未遍历到的目录数上限
+  prefetchWindow: 1024
+};
+
+// 可通过环境变量调整的遍历和渲染选项
+const TREE_OPTION_ENV = {
+  concurrency: 'HERDING_TREE_CONCURRENCY',
+  maxDepth: 'HERDING_TREE_MAX_DEPTH',
+  maxEntries: 'HERDING_TREE_MAX_ENTRIES',
+  timeBudgetMs: 'HERDING_TREE_TIME_BUDGET_MS',
+  maxLines: 'HERDING_TREE_MAX_LINES',
+  maxBytes: 'HERDING_TREE_MAX_BYTES',
+  collapseThreshold: 'HERDING_TREE_COLLAPSE_THRESHOLD',
+  fullDepth: 'HERDING_TREE_FULL_DEPTH'
+};
+
+// 目录树渲染预算
+export const DEFAULT_RENDER_OPTIONS = {
+  maxLines: 400,
+  maxBytes: 24 * 1024,
+  collapseThreshold: 40,
+  fullDepth: 2
+};
+
+// 统计源码文件时识别的扩展名
+export const SOURCE_EXTENSIONS = new Set([
+  '.js', '.mjs', '.cjs', '.jsx', '.ts', '.tsx', '.vue', '.svelte',
+  '.py', '.java', '.kt', '.scala', '.go', '.rs', '.c', '.h', '.cc', '.cpp', '.hpp',
+  '.cs', '.swift', '.m', '.rb', '.php', '.lua', '.dart', '.sh', '.sql'
+]);
+
+const TRUNCATE_REASONS = {
+  maxEntries: '超出条目上限',
+  timeBudget: '超出耗时上限'
+};
+
+/**
+ * 从环境变量读取遍历和渲染选项，未设置的使用默认值
+ */
+export const treeOptionsFromEnv = () => {
+  const options = { ...DEFAULT_WALK_OPTIONS, ...DEFAULT_RENDER_OPTIONS };
+  for (const [name, envName] of Object.entries(TREE_OPTION_ENV)) {
+    const value = Number(process.env[envName]);
+    if (process.env[envName] && value > 0) {
+      options[name] = value;
+    }
+  }
+  return options;
+};
+
+/**
+ * 创建并发限制器：同时最多执行concurrency个任务，其余按提交顺序排队
+ */
+export const createLimiter = (concurrency) => {
+  let active = 0;
+  let head = 0;
+  const waiting = [];
+  const next = () => {
+    while (active < concurrency && head < waiting.length) {
+      const { task, resolve, reject } = waiting[head];
+      waiting[head++] = null;
+      active++;
+      task().then(resolve, reject).finally(() => {
+        active--;
+        next();
+      });
+    }
+    if (head === waiting.length) {
+      waiting.length = head = 0;
+    }
+  };
+  return (task) => new Promise((resolve, reject) => {
+    waiting.push({ task, resolve, reject });
+    next();
+  });
+};
+
+const compareNames = (a, b) => (a.name < b.name ? -1 : a.name > b.name ? 1 : 0);
+
+const statMtime = async (filePath) => {
+  const stat = await fs.stat(filePath).catch(() => null);
+  return stat ? stat.mtimeMs : null;
+};
+
+/**
+ * 获取目录树快照文件路径
+ */
+export const getTreeSnapshotPath = () => {
+  return path.join(getCacheDirPath(), TREE_SNAPSHOT_FILE);
+};
+
+/**
+ * 读取目录树快照，不存在或格式不符时返回null
+ */
+export const loadTreeSnapshot = async (snapshotPath = getTreeSnapshotPath()) => {
+  if (!fileExists(snapshotPath)) {
+    return null;
+  }
+  try {
+    const snapshot = JSON.parse(await readFile(snapshotPath));
+    return snapshot.version === SNAPSHOT_VERSION ? snapshot : null;
+  } catch (error) {
+    return null;
+  }
+};
+
+/**
+ * 保存遍历得到的目录树快照
+ */
+export const saveTreeSnapshot = async (walker, snapshotPath = getTreeSnapshotPath()) => {
+  await writeFileAtomic(snapshotPath, JSON.stringify(walker.snapshot()));
+};
+
+// 目录树遍历器
+export class FileTreeWalker {
+  constructor(rootPath, options = {}) {
+    this.rootPath = rootPath;
+    this.options = { ...DEFAULT_WALK_OPTIONS, ...options };
+    this.matcher = options.matcher || null;
+    this.limit = createLimiter(this.options.concurrency);
+    this.stopped = false;
+    this.truncated = null;
+    // 上次遍历的快照：目录 -> { mtimeMs, gitignoreMtimeMs, children, files, sourceFiles }
+    this.previousDirs = options.snapshot ? options.snapshot.dirs : null;
+    this.dirs = {};
+    this.excludeMtimeMs = null;
+    this.stats = { directoriesRead: 0, directoriesReused: 0, entries: 0 };
+    // 已开始读取和已被遍历取走的目录数，两者之差即预读窗口的占用
+    this.started = 0;
+    this.consumed = 0;
+  }
+
+  // 快照中各目录的.gitignore有变化（修改、新增或删除）时，忽略规则可能改变，整个快照失效
+  async validateSnapshot(snapshot) {
+    if (!snapshot || snapshot.hasRootGitignore !== this.matcher.hasRootGitignore
+      || snapshot.excludeMtimeMs !== this.excludeMtimeMs) {
+      return false;
+    }
+    // 不存在的.gitignore记录为null，与当前stat结果比较即可发现新增的文件
+    const changed = await Promise.all(Object.entries(snapshot.dirs).map(([relativePath, dir]) => this.limit(async () => (
+      await statMtime(path.join(this.rootPath, relativePath, GITIGNORE_FILE)) !== dir.gitignoreMtimeMs
+    ))));
+    return !changed.includes(true);
+  }
+
+  /**
+   * 本次遍历的快照，只包含实际遍历到的目录
+   */
+  snapshot() {
+    return {
+      version: SNAPSHOT_VERSION,
+      hasRootGitignore: this.matcher.hasRootGitignore,
+      excludeMtimeMs: this.excludeMtimeMs,
+      dirs: this.dirs
+    };
+  }
+
+  // 根目录没有.gitignore时使用默认黑名单
+  shouldIgnore(name, relativePath) {
+    if (this.matcher.ignores(relativePath, true)) {
+      return true;
+    }
+    return !this.matcher.hasRootGitignore && FOLDER_BLACKLIST.includes(name);
+  }
+
+  // 读取目录下未被忽略的子目录名（按名称排序）和文件数并记录到快照；mtime未变化时直接使用上次的结果
+  async readDirectory(relativePath) {
+    const dirPath = path.join(this.rootPath, relativePath);
+    const mtimeMs = await statMtime(dirPath);
+    const previous = this.previousDirs && this.previousDirs[relativePath];
+    if (previous && mtimeMs !== null && previous.mtimeMs === mtimeMs) {
+      this.stats.directoriesReused++;
+      this.dirs[relativePath] = previous;
+      return previous;
+    }
+    await this.matcher.enterPath(relativePath);
+    const dirents = await fs.readdir(dirPath, { withFileTypes: true }).catch(() => []);
+    this.stats.directoriesRead++;
+    const names = [];
+    let files = 0;
+    let sourceFiles = 0;
+    for (const dirent of dirents) {
+      // readdir已返回类型，无需再stat；符号链接不跟随，避免循环
+      if (dirent.isFile()) {
+        files++;
+        if (SOURCE_EXTENSIONS.has(path.extname(dirent.name).toLowerCase())) {
+          sourceFiles++;
+        }
+        continue;
+      }
+      if (!dirent.isDirectory() || FORCE_BLACKLIST.includes(dirent.name)) {
+        continue;
+      }
+      const childPath = relativePath ? `${relativePath}/${dirent.name}` : dirent.name;
+      if (!this.shouldIgnore(dirent.name, childPath)) {
+        names.push(dirent.name);
+      }
+    }
+    names.sort();
+    const entry = {
+      mtimeMs,
+      gitignoreMtimeMs: await statMtime(path.join(dirPath, GITIGNORE_FILE)),
+      children: names,
+      files,
+      sourceFiles
+    };
+    this.dirs[relativePath] = entry;
+    return entry;
+  }
+
+  // 读取目录，并在预读窗口内预读下一层
+  listDirectory(relativePath, depth) {
+    this.started++;
+    return this.limit(async () => {
+      if (this.stopped) {
+        return { children: [], files: 0, sourceFiles: 0 };
+      }
+      const entry = await this.readDirectory(relativePath);
+      const children = entry.children.map((name) => ({
+        name,
+        relativePath: relativePath ? `${relativePath}/${name}` : name,
+        depth: depth + 1,
+        listing: null
+      }));
+      this.prefetch(children);
+      return { children, files: entry.files, sourceFiles: entry.sourceFiles };
+    });
+  }
+
+  // 窗口已满时剩余的子目录留待遍历到时再读取
+  prefetch(children) {
+    for (const child of children) {
+      if (this.started - this.consumed >= this.options.prefetchWindow) {
+        return;
+      }
+      if (!child.listing && child.depth < this.options.maxDepth) {
+        child.listing = this.listDirectory(child.relativePath, child.depth);
+      }
+    }
+  }
+
+  // 取得子目录的读取结果，尚未预读时立即读取
+  async takeListing(child) {
+    const listing = await (child.listing || this.listDirectory(child.relativePath, child.depth));
+    this.consumed++;
+    return listing;
+  }
+
+  /**
+   * 按深度优先顺序逐个产出目录节点 { name, relativePath, depth, parent, children, files, sourceFiles }，
+   * 节点的文件数在读取该目录后填入；超出限制时设置truncated并停止
+   */
+  async *nodes() {
+    if (!this.matcher) {
+      this.matcher = await GitignoreMatcher.create(this.rootPath);
+    }
+    this.excludeMtimeMs = await statMtime(path.join(this.rootPath, '.git', 'info', 'exclude'));
+    if (this.previousDirs && !(await this.validateSnapshot(this.options.snapshot))) {
+      this.previousDirs = null;
+    }
+    const deadline = performance.now() + this.options.timeBudgetMs;
+    const root = { name: 'root', relativePath: '', depth: 0, parent: null, children: [] };
+    const listing = await this.takeListing({ relativePath: '', depth: 0, listing: null });
+    Object.assign(root, { files: listing.files, sourceFiles: listing.sourceFiles });
+    this.root = root;
+    const stack = [{ node: root, children: listing.children, index: 0 }];
+    try {
+      while (stack.length) {
+        const frame = stack[stack.length - 1];
+        if (frame.index >= frame.children.length) {
+          stack.pop();
+          continue;
+        }
+        if (this.stats.entries >= this.options.maxEntries) {
+          this.truncated = 'maxEntries';
+          break;
+        }
+        if (performance.now() > deadline) {
+          this.truncated = 'timeBudget';
+          break;
+        }
+        const child = frame.children[frame.index++];
+        const node = {
+          name: child.name,
+          relativePath: child.relativePath,
+          depth: child.depth,
+          parent: frame.node,
+          children: [],
+          files: 0,
+          sourceFiles: 0
+        };
+        this.stats.entries++;
+        yield node;
+        if (child.depth < this.options.maxDepth) {
+          const { children, files, sourceFiles } = await this.takeListing(child);
+          node.files = files;
+          node.sourceFiles = sourceFiles;
+          stack.push({ node, children, index: 0 });
+          this.prefetch(children);
+        }
+      }
+    } finally {
+      // 停止尚未开始的预读
+      this.stopped = true;
+    }
+  }
+
+  // 截断说明行
+  truncatedLine(depth) {
+    return `${TREE_INDENT.repeat(Math.max(depth - 1, 0))}- ...（${TRUNCATE_REASONS[this.truncated]}，已截断）`;
+  }
+
+  /**
+   * 遍历并返回完整的目录树根节点
+   */
+  async buildTree() {
+    for await (const node of this.nodes()) {
+      node.parent.children.push(node);
+    }
+    return this.root;
+  }
+}
+
+// 按最大的优先、相同时按路径排序的二叉堆
+class CandidateHeap {
+  constructor() {
+    this.items = [];
+  }
+
+  get size() {
+    return this.items.length;
+  }
+
+  static before(a, b) {
+    if (a.score !== b.score) {
+      return a.score > b.score;
+    }
+    return a.node.relativePath < b.node.relativePath;
+  }
+
+  push(item) {
+    const items = this.items;
+    items.push(item);
+    let i = items.length - 1;
+    while (i > 0) {
+      const parent = (i - 1) >> 1;
+      if (!CandidateHeap.before(items[i], items[parent])) {
+        break;
+      }
+      [items[i], items[parent]] = [items[parent], items[i]];
+      i = parent;
+    }
+  }
+
+  pop() {
+    const items = this.items;
+    const top = items[0];
+    const last = items.pop();
+    if (items.length) {
+      items[0] = last;
+      let i = 0;
+      while (true) {
+        const left = i * 2 + 1;
+        const right = left + 1;
+        let best = i;
+        if (left < items.length && CandidateHeap.before(items[left], items[best])) {
+          best = left;
+        }
+        if (right < items.length && CandidateHeap.before(items[right], items[best])) {
+          best = right;
+        }
+        if (best === i) {
+          break;
+        }
+        [items[i], items[best]] = [items[best], items[i]];
+        i = best;
+      }
+    }
+    return top;
+  }
+}
+
+// 统计每个节点子树中的目录数和源码文件数
+const summarizeSubtrees = (node) => {
+  node.subtreeDirs = 0;
+  node.subtreeSourceFiles = node.sourceFiles || 0;
+  node.subtreeFiles = node.files || 0;
+  for (const child of node.children) {
+    summarizeSubtrees(child);
+    node.subtreeDirs += child.subtreeDirs + 1;
+    node.subtreeSourceFiles += child.subtreeSourceFiles;
+    node.subtreeFiles += child.subtreeFiles;
+  }
+};
+
+// 目录未展开时的行：有子目录时附带子树摘要
+const collapsedLine = (node) => {
+  const indent = TREE_INDENT.repeat(node.depth - 1);
+  if (!node.children.length) {
+    return `${indent}- ${node.name}`;
+  }
+  return `${indent}- ${node.name}/ (${node.subtreeDirs} dirs, ${node.subtreeFiles} files)`;
+};
+
+const expandedLine = (node) => `${TREE_INDENT.repeat(node.depth - 1)}- ${node.name}`;
+
+/**
+ * 在行数和字节数预算内渲染目录树
+ *
+ * 浅层（fullDepth以内）优先完整展开，子目录超过collapseThreshold个的目录折叠为
+ * `name/ (N dirs, M files)`；剩余预算按得分（源码文件越多、层级越浅越优先）贪心展开，
+ * 得分相同时按路径排序，结果与遍历顺序和并发度无关
+ */
+export const renderFileTree = (root, options = {}) => {
+  const { maxLines, maxBytes, collapseThreshold, fullDepth } = { ...DEFAULT_RENDER_OPTIONS, ...options };
+  summarizeSubtrees(root);
+  const expanded = new Set([root]);
+  let lines = 1;
+  let bytes = Buffer.byteLength(root.name) + 1;
+  const lineBytes = (line) => Buffer.byteLength(line) + 1;
+
+  // 展开节点的代价：新增子目录行，并把自身从摘要行改为普通行
+  const expand = (node) => {
+    const added = node.children.reduce((sum, child) => sum + lineBytes(collapsedLine(child)), 0);
+    const delta = node === root ? added : added + lineBytes(expandedLine(node)) - lineBytes(collapsedLine(node));
+    if (lines + node.children.length > maxLines || bytes + delta > maxBytes) {
+      return false;
+    }
+    expanded.add(node);
+    lines += node.children.length;
+    bytes += delta;
+    return true;
+  };
+
+  // 根目录的子目录过多时只列出预算内的部分
+  const rootChildren = [];
+  for (const child of root.children) {
+    const cost = lineBytes(collapsedLine(child));
+    if (lines + 2 > maxLines || bytes + cost > maxBytes) {
+      break;
+    }
+    rootChildren.push(child);
+    lines++;
+    bytes += cost;
+  }
+  const omitted = root.children.length - rootChildren.length;
+
+  const expandable = (node) => node.children.length > 0 && node.children.length <= collapseThreshold;
+  const score = (node) => (node.subtreeSourceFiles + 1) / ((node.depth + 1) * (node.depth + 1));
+
+  // 浅层按层序完整展开
+  let level = rootChildren;
+  const candidates = new CandidateHeap();
+  while (level.length) {
+    const next = [];
+    for (const node of level) {
+      if (node.depth < fullDepth && expandable(node) && expand(node)) {
+        next.push(...node.children);
+      } else if (expandable(node)) {
+        candidates.push({ node, score: score(node) });
+      }
+    }
+    level = next;
+  }
+
+  // 剩余预算按得分贪心展开
+  while (candidates.size) {
+    const { node } = candidates.pop();
+    if (expand(node)) {
+      for (const child of node.children) {
+        if (expandable(child)) {
+          candidates.push({ node: child, score: score(child) });
+        }
+      }
+    }
+  }
+
+  const output = [root.name];
+  const stack = [...rootChildren].reverse();
+  while (stack.length) {
+    const node = stack.pop();
+    if (expanded.has(node)) {
+      output.push(expandedLine(node));
+      for (let i = node.children.length - 1; i >= 0; i--) {
+        stack.push(node.children[i]);
+      }
+    } else {
+      output.push(collapsedLine(node));
+    }
+  }
+  if (omitted > 0) {
+    output.push(`- ... (${omitted} more dirs)`);
+  }
+  return output.join('\n');
+};
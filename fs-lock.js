@@ -0,0 +1,206 @@
+#!/usr/bin/env node
+
+/**
+ * fs-lock - 多个进程共用.sleepdog时的咨询锁
+ * 每个锁是一个目录：独占锁的持有者创建其中的exclusive文件，共享锁的持有者各自创建shared-*文件。
+ * 锁文件记录持有者的pid和主机名，持有进程已退出的锁视为失效并清除。
+ * 独占锁创建exclusive后即阻止新的共享锁，再等待已有的共享锁释放，写者不会被持续的读者饿死。
+ */
+
+import { randomBytes } from 'crypto';
+import { promises as fs } from 'fs';
+import * as os from 'os';
+import * as path from 'path';
+import { isProcessAlive } from './common.js';
+
+export const DEFAULT_LOCK_TIMEOUT_MS = 30000;
+
+const EXCLUSIVE_FILE = 'exclusive';
+const SHARED_PREFIX = 'shared-';
+// 清除失效锁文件时先重命名为该前缀的唯一文件名
+const STALE_PREFIX = 'stale-';
+// 重试间隔从RETRY_MIN_MS起倍增到RETRY_MAX_MS
+const RETRY_MIN_MS = 5;
+const RETRY_MAX_MS = 100;
+// 内容为空或无法解析（持有者尚未写完）的锁文件超过该时间后视为失效
+const UNREADABLE_STALE_MS = 10000;
+
+const HOSTNAME = os.hostname();
+
+/**
+ * 从环境变量HERDING_LOCK_TIMEOUT_MS读取获取锁的超时时间，未设置时使用默认值
+ */
+export const lockTimeoutFromEnv = () => {
+  const value = Number(process.env.HERDING_LOCK_TIMEOUT_MS);
+  return value > 0 ? value : DEFAULT_LOCK_TIMEOUT_MS;
+};
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// 创建锁文件并写入持有者信息，已存在时返回false
+const createLockFile = async (filePath) => {
+  let handle;
+  try {
+    handle = await fs.open(filePath, 'wx');
+  } catch (error) {
+    if (error.code === 'EEXIST') {
+      return false;
+    }
+    if (error.code === 'ENOENT') {
+      // 锁目录刚被其他进程释放时删除
+      await fs.mkdir(path.dirname(filePath), { recursive: true });
+      return createLockFile(filePath);
+    }
+    throw error;
+  }
+  try {
+    await handle.writeFile(JSON.stringify({ pid: process.pid, host: HOSTNAME, acquired_at: Date.now() / 1000 }));
+  } finally {
+    await handle.close();
+  }
+  return true;
+};
+
+// 判断锁文件是否仍然有效；文件不存在或已失效时返回false，失效的锁文件会被删除
+const isHeld = async (filePath) => {
+  let content;
+  let stat;
+  try {
+    [content, stat] = await Promise.all([fs.readFile(filePath, 'utf-8'), fs.stat(filePath)]);
+  } catch (error) {
+    if (error.code === 'ENOENT') {
+      return false;
+    }
+    throw error;
+  }
+  let stale;
+  try {
+    const owner = JSON.parse(content);
+    // 其他主机上的持有者无法判断是否存活，视为有效
+    stale = owner.host === HOSTNAME && !isProcessAlive(owner.pid);
+  } catch (error) {
+    stale = Date.now() - stat.mtimeMs > UNREADABLE_STALE_MS;
+  }
+  if (stale) {
+    await removeStale(filePath, stat.ino, content);
+  }
+  return !stale;
+};
+
+// 清除失效的锁文件：先重命名为唯一的文件名，确认仍是判断时的那个文件后再删除。
+// 判断与删除之间其他进程可能已清除失效的锁并重新获取，直接按路径删除会误删有效的锁
+const removeStale = async (filePath, ino, content) => {
+  const claimed = path.join(path.dirname(filePath), `${STALE_PREFIX}${process.pid}-${randomBytes(4).toString('hex')}`);
+  try {
+    await fs.rename(filePath, claimed);
+  } catch (error) {
+    if (error.code === 'ENOENT') {
+      return;
+    }
+    throw error;
+  }
+  const [stat, current] = await Promise.all([fs.stat(claimed), fs.readFile(claimed, 'utf-8')]);
+  if (stat.ino !== ino || current !== content) {
+    // 重命名的是其他进程新获取的锁，放回原处
+    try {
+      await fs.link(claimed, filePath);
+    } catch (error) {
+      if (error.code !== 'EEXIST') {
+        throw error;
+      }
+    }
+  }
+  await fs.rm(claimed, { force: true });
+};
+
+// 锁：mode为'shared'（读）或'exclusive'（写）
+export class FileLock {
+  constructor(lockPath, mode = 'exclusive') {
+    if (mode !== 'shared' && mode !== 'exclusive') {
+      throw new Error(`无效的锁模式: ${mode}`);
+    }
+    this.lockPath = lockPath;
+    this.mode = mode;
+    this.ownFile = null;
+  }
+
+  get exclusivePath() {
+    return path.join(this.lockPath, EXCLUSIVE_FILE);
+  }
+
+  /**
+   * 获取锁，超过timeoutMs毫秒仍未获取时抛出错误
+   */
+  async acquire(timeoutMs = lockTimeoutFromEnv()) {
+    await fs.mkdir(this.lockPath, { recursive: true });
+    const deadline = Date.now() + timeoutMs;
+    let delay = RETRY_MIN_MS;
+    while (!(await this.tryAcquire())) {
+      if (Date.now() >= deadline) {
+        await this.release();
+        throw new Error(`获取${this.mode === 'shared' ? '共享' : '独占'}锁超时(${timeoutMs}ms): ${this.lockPath}`);
+      }
+      await sleep(delay);
+      delay = Math.min(delay * 2, RETRY_MAX_MS);
+    }
+    return this;
+  }
+
+  async tryAcquire() {
+    if (this.mode === 'exclusive') {
+      if (!this.ownFile) {
+        if (!(await createLockFile(this.exclusivePath))) {
+          // 已有其他写者，失效时清除后下次重试
+          await isHeld(this.exclusivePath);
+          return false;
+        }
+        this.ownFile = this.exclusivePath;
+      }
+      return !(await this.hasSharedHolders());
+    }
+
+    this.ownFile = path.join(this.lockPath, `${SHARED_PREFIX}${process.pid}-${randomBytes(4).toString('hex')}`);
+    await createLockFile(this.ownFile);
+    if (await isHeld(this.exclusivePath)) {
+      // 有写者持有或正在等待，让出后重试
+      await fs.rm(this.ownFile, { force: true });
+      this.ownFile = null;
+      return false;
+    }
+    return true;
+  }
+
+  // 是否还有其他有效的共享锁
+  async hasSharedHolders() {
+    const names = await fs.readdir(this.lockPath).catch(() => []);
+    for (const name of names) {
+      if (name.startsWith(SHARED_PREFIX) && (await isHeld(path.join(this.lockPath, name)))) {
+        return true;
+      }
+    }
+    return false;
+  }
+
+  /**
+   * 释放锁；锁目录为空时一并删除
+   */
+  async release() {
+    if (this.ownFile) {
+      await fs.rm(this.ownFile, { force: true });
+      this.ownFile = null;
+    }
+    await fs.rmdir(this.lockPath).catch(() => {});
+  }
+}
+
+/**
+ * 持有锁执行fn，结束后释放
+ */
+export const withLock = async (lockPath, mode, fn, timeoutMs = lockTimeoutFromEnv()) => {
+  const lock = await new FileLock(lockPath, mode).acquire(timeoutMs);
+  try {
+    return await fn();
+  } finally {
+    await lock.release();
+  }
+};
@@ -9,6 +9,7 @@
  */
 
 import { exec } from "child_process";
+import { randomBytes } from "crypto";
 import * as path from "path";
 import { promisify } from "util";
 import {
@@ -18,14 +19,17 @@ import {
   getSleepDogPath,
   getProjectRoot,
   getTaskDirPath,
+  getLockPath,
+  getInitLockPath,
   fileExists,
+  copyDirectory,
   readFile,
-  writeFile,
+  writeFileAtomic,
+  createFileAtomic,
   appendFile,
   ensureDir,
   setupErrorHandling,
   withErrorHandling,
-  formatFileContent,
   formatContext,
   formatNextStep,
   SLEEPDOG_DIR,
@@ -33,60 +37,31 @@ import {
   TEMPLATES_DIR,
   CURSOR_RULES_DIR,
   PROJECT_FILE,
+  TOOL_OWNED_DIRS,
   TODO_TEMPLATE,
   CURSOR_RULE_FILE,
-  TREE_INDENT,
-  FOLDER_BLACKLIST,
-  FORCE_BLACKLIST,
   MESSAGES
 } from './common.js';
 import { promises as fs } from "fs";
+import { TaskIndex, formatTaskStatus } from './task-index.js';
+import { withLock } from './fs-lock.js';
+import { buildContextBundle, bundleOptionsFromEnv } from './context-bundle.js';
+import {
+  FileTreeWalker,
+  treeOptionsFromEnv,
+  renderFileTree,
+  loadTreeSnapshot,
+  saveTreeSnapshot
+} from './file-tree.js';
 
 const execPromise = promisify(exec);
 
-// 解析.gitignore文件
-async function parseGitignore(rootPath, relativePath) {
-  try {
-    const gitignorePath = path.join(rootPath, '.gitignore');
-    const gitignoreStat = await fs.stat(gitignorePath).catch(() => null);
-    if (!gitignoreStat || !gitignoreStat.isFile()) {
-      return null; // 如果.gitignore不存在，返回null使用默认黑名单
-    }
-    
-    const content = await fs.readFile(gitignorePath, 'utf-8');
-    const lines = content
-      .split(/\r?\n/)
-      .map(line => line.trim())
-      .filter(line => line && !line.startsWith('#'));
-    
-    // 简单的gitignore匹配逻辑
-    for (const pattern of lines) {
-      if (pattern.endsWith('/')) {
-        // 目录匹配
-        const dirPattern = pattern.slice(0, -1);
-        if (relativePath === dirPattern || relativePath.startsWith(dirPattern + '/')) {
-          return true;
-        }
-      } else {
-        // 文件或目录匹配
-        if (relativePath === pattern || relativePath.endsWith('/' + pattern)) {
-          return true;
-        }
-        // 通配符匹配（简单实现）
-        if (pattern.includes('*')) {
-          const regex = new RegExp(pattern.replace(/\*/g, '.*'));
-          if (regex.test(relativePath)) {
-            return true;
-          }
-        }
-      }
-    }
-    
-    return false;
-  } catch (error) {
-    return null; // 解析失败时返回null使用默认黑名单
-  }
-}
+// 读写project.md等.sleepdog文件时使用的锁
+const PROJECT_LOCK = 'project';
+// 等待其他进程完成初始化（可能需要git clone）的超时时间
+const INIT_LOCK_TIMEOUT_MS = 5 * 60 * 1000;
+
+const TASK_TRACE_ID_EXPORT = `\nexport TASK_TRACE_ID=\`openssl rand -hex 16 | sed 's/\\(........\\)\\(....\\)\\(....\\)\\(....\\)\\(............\\)/\\1-\\2-\\3-\\4-\\5/'\``;
 
 // 生成cursorRule内容
 const generateCursorRuleContent = () => {
@@ -137,102 +112,113 @@ alwaysApply: true
 - ask_user: 交互式用户反馈工具
   - **command**: \`ask_user "<tips_message>"\` 注：tips文字参数应当非常简短, 不超过3行文本
   - **example**: \`ask_user "请审查代码修改并提供反馈"\`
+  - **batch**: \`ask_user --batch questions.json\` 需要连续确认多个问题时，将问题写入JSON数组 \`[{"id": "scope", "prompt": "修改范围？", "default": "仅当前模块"}]\`，一次窗口回答全部问题，输出JSON答案
 
 `;
 };
 
-// 获取文件夹树
-async function getFileTree(rootPath) {
-  const indent = TREE_INDENT;
-
-  // 递归处理单个路径（目录或文件）
-  const processEntry = async (entryPath, displayName, prefix, relativePath) => {
-    const stat = await fs.stat(entryPath).catch(() => null);
-    const lines = [];
-    if (stat && stat.isDirectory()) {
-      lines.push(`${prefix}- ${displayName}`);
-      const entries = await fs.readdir(entryPath, { withFileTypes: true });
-      for (const entry of entries) {
-        if (entry.isDirectory() && FORCE_BLACKLIST.includes(entry.name)) continue;
-        const entryRelativePath = path.join(relativePath, entry.name).replace(/\\/g, "/");
-        const subPath = path.join(entryPath, entry.name);
-        lines.push(...(await processEntry(subPath, entry.name, prefix + indent, entryRelativePath)));
-      }
-    } else if (stat && stat.isFile()) {
-      // lines.push(`${prefix}- ${displayName}`);
-    }
-    return lines;
-  };
-
-  const buildTree = async (
-    dir,
-    prefix,
-    relativePath = ""
-  ) => {
-    const result = [];
-    const entries = await fs.readdir(dir, { withFileTypes: true });
-    for (const entry of entries) {
-      if (entry.isDirectory() && FORCE_BLACKLIST.includes(entry.name)) {
-        continue;
-      }
-      
-      // 尝试解析.gitignore文件
-      // 如果.gitignore存在且解析成功，使用其规则；否则使用默认黑名单
-      const entryRelativePath = path
-        .join(relativePath, entry.name)
-        .replace(/\\/g, "/");
-      const isIgnore = await parseGitignore(rootPath, entryRelativePath);
-
-      // 使用.gitignore规则或默认黑名单进行过滤
-      const shouldIgnore =
-        typeof isIgnore === "boolean"
-          ? isIgnore
-          : FOLDER_BLACKLIST.includes(entry.name);
-      if (!shouldIgnore) {
-        const entryPath = path.join(dir, entry.name);
-        result.push(...(await processEntry(entryPath, entry.name, prefix, entryRelativePath)));
-      }
-    }
+// project.md中目录树区块的起止标记，刷新时只替换标记之间的内容
+const FILE_TREE_START = '<!-- herding:file-tree:start -->';
+const FILE_TREE_END = '<!-- herding:file-tree:end -->';
+// 没有标记的旧版project.md中直接追加的目录树
+const LEGACY_FILE_TREE = /\n```\nroot\n[\s\S]*?\n```\n/;
+
+// 获取文件夹树，snapshot为上次遍历的快照时只重新读取有变化的目录；返回目录树文本和遍历器
+async function getFileTree(rootPath, snapshot = null) {
+  const options = treeOptionsFromEnv();
+  const walker = new FileTreeWalker(rootPath, { ...options, snapshot });
+  const root = await walker.buildTree();
+  let fileTree = renderFileTree(root, options);
+  if (walker.truncated) {
+    fileTree += `\n${walker.truncatedLine(1)}`;
+  }
+  return { fileTree, walker };
+}
 
-    return result;
-  };
+// 生成带起止标记的目录树区块
+const formatFileTreeBlock = (fileTree) => {
+  return `${FILE_TREE_START}\n\`\`\`\n${fileTree}\n\`\`\`\n${FILE_TREE_END}\n`;
+};
 
-  const result = await buildTree(rootPath, "", "");
-  return ["root", ...result].join("\n");
-}
+// 替换project.md中的目录树区块，没有区块时追加到末尾
+const replaceFileTreeBlock = (content, fileTree) => {
+  const block = formatFileTreeBlock(fileTree);
+  const start = content.indexOf(FILE_TREE_START);
+  const end = content.indexOf(FILE_TREE_END, start);
+  if (start !== -1 && end !== -1) {
+    let after = end + FILE_TREE_END.length;
+    if (content[after] === '\n') {
+      after++;
+    }
+    return content.slice(0, start) + block + content.slice(after);
+  }
+  if (LEGACY_FILE_TREE.test(content)) {
+    return content.replace(LEGACY_FILE_TREE, `\n${block}`);
+  }
+  return `${content}\n${block}`;
+};
 
 // 项目信息获取类
 class ProjectInfoManager {
   constructor() {
     this.rootPath = getProjectRoot();
     this.sleepDogPath = getSleepDogPath();
+    this.taskIndex = new TaskIndex();
   }
 
-  // 获取项目信息
-  async getProjectInfo() {
-    // 检查是否需要初始化
-    if (!fileExists(path.join(this.sleepDogPath, PROJECT_FILE))) {
-      await this.initializeSleepdog();
-      return;
+  // 增量刷新project.md中的目录树：只重新读取mtime有变化的目录，原子替换目录树区块
+  async refreshTree() {
+    const projectFile = path.join(this.sleepDogPath, PROJECT_FILE);
+    if (!fileExists(projectFile)) {
+      throw new Error(`${SLEEPDOG_DIR}/${PROJECT_FILE}不存在，请先运行get-project-info初始化`);
     }
+    const { fileTree, walker } = await getFileTree(this.rootPath, await loadTreeSnapshot());
+    // 读取、替换、写回期间持有独占锁，避免并发刷新或其他写入互相覆盖
+    const updated = await withLock(getLockPath(PROJECT_LOCK), 'exclusive', async () => {
+      const content = await readFile(projectFile);
+      const replaced = replaceFileTreeBlock(content, fileTree);
+      if (replaced !== content) {
+        await writeFileAtomic(projectFile, replaced);
+      }
+      await saveTreeSnapshot(walker);
+      return replaced !== content;
+    });
+    const { directoriesRead, directoriesReused } = walker.stats;
+    console.log(`目录树已${updated ? '更新' : '是最新的'}：重新读取${directoriesRead}个目录，复用${directoriesReused}个目录`);
+  }
 
-    // 读取sleepDogPath下所有的非隐藏文件,但不包括文件夹，并将其内容输出
-    const files = await import('fs').then(fs => fs.promises.readdir(this.sleepDogPath));
-    const fileContent = [];
-    for (const file of files) {
-      if (file.startsWith('.')) continue;
-      const filePath = path.join(this.sleepDogPath, file);
-      const stat = await import('fs').then(fs => fs.promises.stat(filePath));
-      if (stat.isFile()) {
-        const content = await readFile(filePath);
-        fileContent.push(formatFileContent(file, content));  
+  // 输出任务状态摘要
+  async printStatus() {
+    console.log(formatTaskStatus(await this.taskIndex.summary(), await generateTaskId()));
+  }
+
+  // 获取项目信息
+  async getProjectInfo() {
+    // 检查是否需要初始化；多个进程同时运行时只有一个执行初始化，其余等待其完成后直接输出项目信息
+    const projectFile = path.join(this.sleepDogPath, PROJECT_FILE);
+    if (!fileExists(projectFile)) {
+      const initialized = await withLock(getInitLockPath(), 'exclusive', async () => {
+        if (fileExists(projectFile)) {
+          return false;
+        }
+        await this.initializeSleepdog();
+        return true;
+      }, INIT_LOCK_TIMEOUT_MS);
+      if (initialized) {
+        return;
       }
     }
+
+    // 并发读取sleepDogPath下所有的非隐藏文件（不包括文件夹），文件都未变化时直接使用缓存的内容
+    const [fileContent, context] = await Promise.all([
+      withLock(getLockPath(PROJECT_LOCK), 'shared', () => buildContextBundle(this.sleepDogPath, bundleOptionsFromEnv())),
+      formatContext()
+    ]);
     if(process.env.PLAN === 'true') {
       console.log(await this.plan());
     }
-    console.log(`${fileContent.join('\n')}
-${await formatContext()}`);
+    console.log(`${fileContent}
+${context}`);
   }
 
   // 制定计划
@@ -245,59 +231,94 @@ ${await formatContext()}`);
     // 确保目录存在
     await ensureDir(taskDir);
 
-    // 创建空的todo文件
+    // 创建空的todo文件：并发时只有一个进程创建成功，其余视为已存在
+    let created = false;
     if (!fileExists(taskFile)) {
       const templatePath = path.join(this.sleepDogPath, TEMPLATES_DIR, TODO_TEMPLATE);
       const templateContent = await readFile(templatePath);
-      await writeFile(taskFile, templateContent);
+      created = await createFileAtomic(taskFile, templateContent);
+    }
+    if (created) {
       return `${formatNextStep(`在${filePath}中记录和拆分你接下来要完成的工作，并以此一步一步执行下去`)}`;
     } else {
-      return `${formatNextStep(`在${filePath}中继续完成未完成的任务`)}`;
+      const task = await this.taskIndex.getTask(taskId);
+      const progress = task ? `（未完成${task.pending}项，进行中${task.inProgress}项，已完成${task.completed}项）` : '';
+      return `${formatNextStep(`在${filePath}中继续完成未完成的任务${progress}`)}`;
     }
   }
 
-  // 初始化sleepdog
+  // 如果TASK_TRACE_ID不存在，则尝试追加一行写入$HOME/.bashrc的环境中（已追加过时不再重复）
+  async exportTaskTraceId() {
+    const bashrc = path.join(process.env.HOME, '.bashrc');
+    await withLock(`${bashrc}.herding.lock`, 'exclusive', async () => {
+      const content = fileExists(bashrc) ? await readFile(bashrc) : '';
+      if (!content.includes('export TASK_TRACE_ID=')) {
+        await appendFile(bashrc, TASK_TRACE_ID_EXPORT);
+      }
+    });
+  }
+
+  // .sleepdog中已有工具自身的目录时不能整体重命名：逐项移入，project.md最后移入，
+  // 其他进程在此之前仍视为未初始化；工具自身的目录保持不变
+  async moveIntoSleepdog(tmpPath) {
+    const names = (await fs.readdir(tmpPath)).filter((name) => name !== PROJECT_FILE && !TOOL_OWNED_DIRS.includes(name));
+    for (const name of names) {
+      await fs.rename(path.join(tmpPath, name), path.join(this.sleepDogPath, name));
+    }
+    await fs.rename(path.join(tmpPath, PROJECT_FILE), path.join(this.sleepDogPath, PROJECT_FILE));
+    await fs.rm(tmpPath, { recursive: true, force: true });
+  }
+
+  // 初始化sleepdog，调用方需持有初始化锁
   async initializeSleepdog() {
     try {
-      // 如果TASK_TRACE_ID不存在，则尝试追加一行写入$HOME/.bashrc的环境中
       if(!process.env.TASK_TRACE_ID) {
-        await appendFile(path.join(process.env.HOME, '.bashrc'), `\nexport TASK_TRACE_ID=\`openssl rand -hex 16 | sed 's/\\(........\\)\\(....\\)\\(....\\)\\(....\\)\\(............\\)/\\1-\\2-\\3-\\4-\\5/'\``);
+        await this.exportTaskTraceId();
       }
-      await ensureDir(this.sleepDogPath);
       
-      // 检查目标目录是否为空
-      const files = await import('fs').then(fs => fs.promises.readdir(this.sleepDogPath));
-      if (files.length === 0) {
-        const { stdout, stderr } = await execPromise(
-          `git clone https://github.com/qinyongliang/herding.git --branch template ${this.sleepDogPath}`
-        );
-
-        // remove .git folder
-        await import('fs').then(fs => fs.promises.rm(path.join(this.sleepDogPath, ".git"), {
-          recursive: true,
-        }));
-        
-        const fileTree = await getFileTree(this.rootPath);
+      // 检查目标目录是否为空（工具自身的目录不算，例如初始化之前ask_user --async创建的工单）
+      const existing = fileExists(this.sleepDogPath) ? await fs.readdir(this.sleepDogPath) : [];
+      if (existing.every((name) => TOOL_OWNED_DIRS.includes(name))) {
+        // 目录树在创建临时目录之前生成
+        const { fileTree, walker } = await getFileTree(this.rootPath);
+
+        // 先在临时目录中准备好模板和目录树，完成后重命名为.sleepdog，其他进程不会看到初始化到一半的内容
+        const tmpPath = `${this.sleepDogPath}.tmp-${process.pid}-${randomBytes(4).toString('hex')}`;
+        try {
+          if (process.env.HERDING_TEMPLATE_DIR) {
+            // 使用本地模板目录代替从GitHub克隆（离线环境和基准测试）
+            await copyDirectory(process.env.HERDING_TEMPLATE_DIR, tmpPath);
+          } else {
+            const { stdout, stderr } = await execPromise(
+              `git clone https://github.com/qinyongliang/herding.git --branch template ${tmpPath}`
+            );
+          }
 
-        // append filetree to .sleepDog/project.md
-        await appendFile(
-          path.join(this.sleepDogPath, PROJECT_FILE),
-          `\n\`\`\`\n${fileTree}\n\`\`\`\n`
-        );
-        
-        // 读取sleepDogPath下所有的非隐藏文件,但不包括文件夹，并将其内容输出
-        const files = await import('fs').then(fs => fs.promises.readdir(this.sleepDogPath));
-        const fileContent = [];
-        for (const file of files) {
-          if (file.startsWith('.')) continue;
-          const filePath = path.join(this.sleepDogPath, file);
-          //相对项目的相对路径
-          const relativePath = path.relative(this.rootPath, filePath);
-          const stat = await import('fs').then(fs => fs.promises.stat(filePath));
-          if (stat.isFile()) {
-            fileContent.push(relativePath);
+          // remove .git folder
+          await fs.rm(path.join(tmpPath, ".git"), {
+            recursive: true,
+            force: true,
+          });
+
+          // append filetree to .sleepDog/project.md
+          await appendFile(
+            path.join(tmpPath, PROJECT_FILE),
+            `\n${formatFileTreeBlock(fileTree)}`
+          );
+          if (existing.length > 0) {
+            await this.moveIntoSleepdog(tmpPath);
+          } else {
+            if (fileExists(this.sleepDogPath)) {
+              await fs.rmdir(this.sleepDogPath);
+            }
+            await fs.rename(tmpPath, this.sleepDogPath);
           }
+        } catch (error) {
+          await fs.rm(tmpPath, { recursive: true, force: true });
+          throw error;
         }
+        await saveTreeSnapshot(walker);
+        
         console.log(MESSAGES.INIT_SUCCESS);
         console.log(`[Attention]\n
 Next step you should do:\n
@@ -325,13 +346,21 @@ ${await formatContext()}
     
     // 确保目录存在
     await ensureDir(ruleDir);
-    await writeFile(ruleFile, rule);
+    await writeFileAtomic(ruleFile, rule);
   }
 }
 
 // 主函数
 const main = withErrorHandling(async () => {
   const manager = new ProjectInfoManager();
+  if (process.argv.includes('--refresh-tree')) {
+    await manager.refreshTree();
+    return;
+  }
+  if (process.argv.includes('--status')) {
+    await manager.printStatus();
+    return;
+  }
   await manager.getProjectInfo();
 });
 
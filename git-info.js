@@ -0,0 +1,538 @@
+#!/usr/bin/env node
+
+/**
+ * git-info - 进程内读取git元数据
+ * 直接解析.git目录（含worktree、packed-refs、config的include/includeIf）获取用户名、分支、HEAD提交，
+ * 需要时通过比较index与工作区文件的stat判断是否有未暂存的修改；
+ * 结果按相关文件的mtime缓存，无法解析时才调用git命令
+ */
+
+import { execFile } from 'child_process';
+import { createHash } from 'crypto';
+import { promises as fs } from 'fs';
+import * as os from 'os';
+import * as path from 'path';
+import { promisify } from 'util';
+import { compileGlob } from './gitignore.js';
+
+const execFilePromise = promisify(execFile);
+
+export const DEFAULT_GIT_INFO_OPTIONS = {
+  // index条目超过该数量时改用git status判断工作区状态
+  maxIndexEntries: 20000,
+  // stat不一致时，不超过该大小的文件会计算blob哈希确认内容是否变化
+  maxHashBytes: 1024 * 1024,
+  // 同时stat的文件数
+  statConcurrency: 64
+};
+
+const MAX_INCLUDE_DEPTH = 10;
+const MAX_SYMREF_DEPTH = 5;
+// 只存在于各worktree自身gitdir中的引用
+const PER_WORKTREE_REFS = /^(HEAD|refs\/(bisect|worktree|rewritten)\/)/;
+
+const S_IFMT = 0o170000;
+const S_IFLNK = 0o120000;
+const S_IFGITLINK = 0o160000;
+
+const readText = (filePath) => fs.readFile(filePath, 'utf-8').catch(() => null);
+
+const mtimeOf = async (filePath) => {
+  const stat = await fs.stat(filePath).catch(() => null);
+  return stat ? [stat.mtimeMs, stat.size] : null;
+};
+
+const expandHome = (filePath) => {
+  return filePath.startsWith('~/') ? path.join(os.homedir(), filePath.slice(2)) : filePath;
+};
+
+/**
+ * 从startDir向上查找仓库，返回 { workTree, gitDir, commonDir }，不在仓库中时返回null
+ * .git为文件时（worktree、子模块）按其中的gitdir定位，commondir指向主仓库的.git目录
+ */
+export const findGitDir = async (startDir) => {
+  let dir = path.resolve(startDir);
+  while (true) {
+    const dotGit = path.join(dir, '.git');
+    const stat = await fs.stat(dotGit).catch(() => null);
+    let gitDir = null;
+    if (stat && stat.isDirectory()) {
+      gitDir = dotGit;
+    } else if (stat && stat.isFile()) {
+      const match = /^gitdir:\s*(.+?)\s*$/m.exec(await readText(dotGit) || '');
+      if (match) {
+        gitDir = path.resolve(dir, match[1]);
+      }
+    }
+    if (gitDir) {
+      const commonDir = await readText(path.join(gitDir, 'commondir'));
+      return {
+        workTree: dir,
+        gitDir,
+        commonDir: commonDir ? path.resolve(gitDir, commonDir.trim()) : gitDir
+      };
+    }
+    const parent = path.dirname(dir);
+    if (parent === dir) {
+      return null;
+    }
+    dir = parent;
+  }
+};
+
+// 解析配置值：处理引号、转义和行内注释
+const parseConfigValue = (raw) => {
+  let value = '';
+  let quoted = false;
+  let pendingSpace = '';
+  for (let i = 0; i < raw.length; i++) {
+    const char = raw[i];
+    if (char === '"') {
+      quoted = !quoted;
+    } else if (char === '\\' && i + 1 < raw.length) {
+      const next = raw[++i];
+      value += pendingSpace + ({ n: '\n', t: '\t', b: '\b' }[next] || next);
+      pendingSpace = '';
+    } else if (!quoted && (char === '#' || char === ';')) {
+      break;
+    } else if (!quoted && /\s/.test(char)) {
+      // 未加引号时，值两端的空白被忽略，中间的空白保留
+      if (value) {
+        pendingSpace += char;
+      }
+    } else {
+      value += pendingSpace + char;
+      pendingSpace = '';
+    }
+  }
+  return value;
+};
+
+/**
+ * 解析git配置文件内容，按出现顺序返回 [{ key, value }]
+ * key为"section.key"或"section.subsection.key"，section和key不区分大小写（转为小写），subsection区分大小写
+ */
+export const parseGitConfig = (content) => {
+  const entries = [];
+  let section = '';
+  const lines = content.split(/\r?\n/);
+  for (let i = 0; i < lines.length; i++) {
+    let line = lines[i].trim();
+    if (!line || line.startsWith('#') || line.startsWith(';')) {
+      continue;
+    }
+    if (line.startsWith('[')) {
+      const match = /^\[\s*([^\s\]"]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\](.*)$/.exec(line);
+      if (!match) {
+        continue;
+      }
+      const [, name, subsection] = match;
+      if (subsection !== undefined) {
+        section = `${name.toLowerCase()}.${subsection.replace(/\\(.)/g, '$1')}`;
+      } else {
+        // 旧式的[section.subsection]写法，subsection不区分大小写
+        section = name.toLowerCase();
+      }
+      line = match[3].trim();
+      if (!line || line.startsWith('#') || line.startsWith(';')) {
+        continue;
+      }
+    }
+    // 行尾的\表示值在下一行继续
+    while (line.endsWith('\\') && i + 1 < lines.length) {
+      line = line.slice(0, -1) + lines[++i];
+    }
+    const match = /^([A-Za-z][A-Za-z0-9-]*)\s*(?:=(.*))?$/.exec(line);
+    if (match && section) {
+      entries.push({
+        key: `${section}.${match[1].toLowerCase()}`,
+        // 只有键名没有=时表示布尔值true
+        value: match[2] === undefined ? 'true' : parseConfigValue(match[2])
+      });
+    }
+  }
+  return entries;
+};
+
+// 判断includeIf条件是否成立，支持gitdir、gitdir/i和onbranch；configDir为条件所在配置文件的目录
+const includeConditionMatches = (condition, repo, branch, configDir) => {
+  const match = /^(gitdir|gitdir\/i|onbranch):(.+)$/.exec(condition);
+  if (!match || !repo) {
+    return false;
+  }
+  const [, kind, rawPattern] = match;
+  if (kind === 'onbranch') {
+    if (!branch) {
+      return false;
+    }
+    const pattern = rawPattern.endsWith('/') ? `${rawPattern}**` : rawPattern;
+    return new RegExp(`^${compileGlob(pattern)}$`).test(branch);
+  }
+  let pattern = expandHome(rawPattern);
+  if (pattern.startsWith('./')) {
+    // 与git一致，./替换为所在配置文件的目录
+    pattern = `${configDir.split(path.sep).join('/')}/${pattern.slice(2)}`;
+  } else if (!pattern.startsWith('/')) {
+    pattern = `**/${pattern}`;
+  }
+  if (pattern.endsWith('/')) {
+    pattern += '**';
+  }
+  const flags = kind === 'gitdir/i' ? 'i' : '';
+  const target = repo.gitDir.split(path.sep).join('/');
+  return new RegExp(`^${compileGlob(pattern)}$`, flags).test(target);
+};
+
+// 读取配置文件并展开include/includeIf，读取过的文件记录在files中用于缓存校验
+const loadConfigFile = async (filePath, context, files, depth = 0) => {
+  files.push(filePath);
+  const content = await readText(filePath);
+  if (content === null) {
+    return [];
+  }
+  const result = [];
+  for (const entry of parseGitConfig(content)) {
+    let include = null;
+    if (entry.key === 'include.path') {
+      include = entry.value;
+    } else if (entry.key.startsWith('includeif.') && entry.key.endsWith('.path')) {
+      const condition = entry.key.slice('includeif.'.length, -'.path'.length);
+      if (includeConditionMatches(condition, context.repo, context.branch, path.dirname(filePath))) {
+        include = entry.value;
+      }
+    }
+    if (include === null) {
+      result.push(entry);
+    } else if (depth < MAX_INCLUDE_DEPTH) {
+      const includePath = path.resolve(path.dirname(filePath), expandHome(include));
+      result.push(...(await loadConfigFile(includePath, context, files, depth + 1)));
+    }
+  }
+  return result;
+};
+
+const xdgConfigHome = () => process.env.XDG_CONFIG_HOME || path.join(os.homedir(), '.config');
+
+// 配置文件按优先级从低到高排列，后读取的值覆盖先读取的值
+// 系统配置的位置取决于git的安装前缀，这里只读取默认的/etc/gitconfig
+const configFiles = (repo) => {
+  const files = [];
+  if (!process.env.GIT_CONFIG_NOSYSTEM) {
+    files.push(process.env.GIT_CONFIG_SYSTEM || '/etc/gitconfig');
+  }
+  files.push(
+    path.join(xdgConfigHome(), 'git', 'config'),
+    process.env.GIT_CONFIG_GLOBAL || path.join(os.homedir(), '.gitconfig')
+  );
+  if (repo) {
+    files.push(path.join(repo.commonDir, 'config'), path.join(repo.gitDir, 'config.worktree'));
+  }
+  return files;
+};
+
+/**
+ * 读取合并后的配置，返回 { values: Map(key -> 最后的值), files }
+ */
+export const readGitConfig = async (repo, branch = null) => {
+  const files = [];
+  const values = new Map();
+  const context = { repo, branch };
+  for (const filePath of configFiles(repo)) {
+    // config.worktree只有在启用extensions.worktreeConfig时才生效
+    if (filePath.endsWith('config.worktree') && values.get('extensions.worktreeconfig') !== 'true') {
+      continue;
+    }
+    for (const { key, value } of await loadConfigFile(filePath, context, files)) {
+      values.set(key, value);
+    }
+  }
+  return { values, files };
+};
+
+// 解析packed-refs文件
+const readPackedRefs = async (commonDir) => {
+  const refs = new Map();
+  const content = await readText(path.join(commonDir, 'packed-refs'));
+  for (const line of (content || '').split('\n')) {
+    if (!line || line.startsWith('#') || line.startsWith('^')) {
+      continue;
+    }
+    const space = line.indexOf(' ');
+    refs.set(line.slice(space + 1).trim(), line.slice(0, space));
+  }
+  return refs;
+};
+
+/**
+ * 解析HEAD，返回 { branch, commit, files }
+ * 分离HEAD时branch为null；尚无提交的分支commit为null
+ */
+export const readHead = async (repo) => {
+  const files = [path.join(repo.gitDir, 'HEAD'), path.join(repo.commonDir, 'packed-refs')];
+  let packedRefs = null;
+  let ref = 'HEAD';
+  let branch = null;
+  for (let depth = 0; depth < MAX_SYMREF_DEPTH; depth++) {
+    const refPath = path.join(PER_WORKTREE_REFS.test(ref) ? repo.gitDir : repo.commonDir, ref);
+    files.push(refPath);
+    let value = await readText(refPath);
+    if (value === null) {
+      packedRefs = packedRefs || await readPackedRefs(repo.commonDir);
+      value = packedRefs.get(ref) || null;
+    }
+    if (value === null) {
+      return { branch, commit: null, files };
+    }
+    value = value.trim();
+    if (!value.startsWith('ref:')) {
+      return { branch, commit: value, files };
+    }
+    ref = value.slice(4).trim();
+    if (branch === null) {
+      branch = ref.replace(/^refs\/heads\//, '');
+    }
+  }
+  return { branch, commit: null, files };
+};
+
+// git blob对象的sha1
+const blobSha1 = (content) => {
+  return createHash('sha1').update(`blob ${content.length}\0`).update(content).digest('hex');
+};
+
+/**
+ * 检出和暂存时内容是否可能经过转换（换行符转换、clean/smudge过滤器）
+ * 此时工作区文件的哈希与index中的blob不一定相同，无法直接比较内容
+ */
+export const mayConvertContent = async (repo, values, entries) => {
+  if (['true', 'input'].includes((values.get('core.autocrlf') || '').toLowerCase())) {
+    return true;
+  }
+  if (entries.some((entry) => path.posix.basename(entry.name) === '.gitattributes')) {
+    return true;
+  }
+  const attributeFiles = [
+    path.join(repo.commonDir, 'info', 'attributes'),
+    expandHome(values.get('core.attributesfile') || path.join(xdgConfigHome(), 'git', 'attributes'))
+  ];
+  const stats = await Promise.all(attributeFiles.map((filePath) => fs.stat(filePath).catch(() => null)));
+  return stats.some(Boolean);
+};
+
+// 判断工作区文件与index条目是否一致：stat一致即视为未修改，否则比较内容哈希
+// 内容可能经过转换时只能确认stat一致的文件，其余返回null
+const entryChanged = async (repo, entry, options) => {
+  const filePath = path.join(repo.workTree, entry.name);
+  const stat = await fs.lstat(filePath, { bigint: true }).catch(() => null);
+  if (!stat) {
+    return true;
+  }
+  const isLink = (entry.mode & S_IFMT) === S_IFLNK;
+  if (isLink !== stat.isSymbolicLink()) {
+    return true;
+  }
+  // index中的大小只保留低32位
+  if (Number(stat.size & 0xffffffffn) !== entry.size) {
+    return true;
+  }
+  const mtimeSeconds = Number(stat.mtimeNs / 1000000000n);
+  const mtimeNanos = Number(stat.mtimeNs % 1000000000n);
+  if (mtimeSeconds === entry.mtimeSeconds && (entry.mtimeNanos === 0 || mtimeNanos === entry.mtimeNanos)) {
+    return false;
+  }
+  if (options.mayConvert) {
+    return null;
+  }
+  if (Number(stat.size) > options.maxHashBytes) {
+    return true;
+  }
+  const content = isLink ? Buffer.from(await fs.readlink(filePath)) : await fs.readFile(filePath);
+  return blobSha1(content) !== entry.sha;
+};
+
+/**
+ * 解析index（版本2、3），返回条目列表；不支持的格式或条目数超过上限时返回null
+ */
+export const readIndexEntries = async (repo, maxEntries) => {
+  const buffer = await fs.readFile(path.join(repo.gitDir, 'index')).catch(() => null);
+  if (buffer === null) {
+    return [];
+  }
+  if (buffer.length < 12 || buffer.toString('latin1', 0, 4) !== 'DIRC') {
+    return null;
+  }
+  const version = buffer.readUInt32BE(4);
+  const count = buffer.readUInt32BE(8);
+  if ((version !== 2 && version !== 3) || count > maxEntries) {
+    return null;
+  }
+  const entries = [];
+  let offset = 12;
+  for (let i = 0; i < count; i++) {
+    const flags = buffer.readUInt16BE(offset + 60);
+    const extended = version >= 3 && (flags & 0x4000) !== 0;
+    const extendedFlags = extended ? buffer.readUInt16BE(offset + 62) : 0;
+    const nameStart = offset + 62 + (extended ? 2 : 0);
+    let nameEnd = nameStart + (flags & 0x0fff);
+    if ((flags & 0x0fff) === 0x0fff) {
+      nameEnd = buffer.indexOf(0, nameStart);
+    }
+    entries.push({
+      name: buffer.toString('utf8', nameStart, nameEnd),
+      mtimeSeconds: buffer.readUInt32BE(offset + 8),
+      mtimeNanos: buffer.readUInt32BE(offset + 12),
+      mode: buffer.readUInt32BE(offset + 24),
+      size: buffer.readUInt32BE(offset + 36),
+      sha: buffer.toString('hex', offset + 40, offset + 60),
+      stage: (flags >> 12) & 0x3,
+      assumeValid: (flags & 0x8000) !== 0,
+      skipWorktree: (extendedFlags & 0x4000) !== 0
+    });
+    // 条目以NUL结尾并补齐到8字节
+    offset += ((nameEnd - offset) + 8) & ~7;
+  }
+  return entries;
+};
+
+/**
+ * 工作区中已跟踪的文件是否有未暂存的修改（不含未跟踪文件），无法判断时返回null
+ * values为合并后的配置，用于判断内容是否可能经过转换
+ */
+export const isWorkTreeDirty = async (repo, values, options = {}) => {
+  const entries = await readIndexEntries(repo, options.maxIndexEntries || DEFAULT_GIT_INFO_OPTIONS.maxIndexEntries);
+  if (entries === null) {
+    return null;
+  }
+  const settings = {
+    ...DEFAULT_GIT_INFO_OPTIONS,
+    ...options,
+    mayConvert: await mayConvertContent(repo, values, entries)
+  };
+  const tracked = [];
+  for (const entry of entries) {
+    if (entry.stage !== 0) {
+      // 存在未解决的冲突
+      return true;
+    }
+    if (!entry.assumeValid && !entry.skipWorktree && (entry.mode & S_IFMT) !== S_IFGITLINK) {
+      tracked.push(entry);
+    }
+  }
+  let unknown = false;
+  for (let i = 0; i < tracked.length; i += settings.statConcurrency) {
+    const batch = tracked.slice(i, i + settings.statConcurrency);
+    const changed = await Promise.all(batch.map((entry) => entryChanged(repo, entry, settings)));
+    if (changed.includes(true)) {
+      return true;
+    }
+    unknown = unknown || changed.includes(null);
+  }
+  return unknown ? null : false;
+};
+
+// 通过git命令获取信息，用于无法直接解析的情况
+const runGit = async (args, cwd) => {
+  try {
+    const { stdout } = await execFilePromise('git', args, { cwd });
+    return stdout.trim();
+  } catch (error) {
+    return null;
+  }
+};
+
+/**
+ * 通过git命令获取全部信息（回退路径）
+ */
+export const getGitInfoFromCommand = async (cwd = process.cwd()) => {
+  const [userName, branch, commit, status] = await Promise.all([
+    runGit(['config', 'user.name'], cwd),
+    runGit(['symbolic-ref', '--short', '-q', 'HEAD'], cwd),
+    runGit(['rev-parse', '-q', '--verify', 'HEAD'], cwd),
+    runGit(['status', '--porcelain', '--untracked-files=no'], cwd)
+  ]);
+  return {
+    userName: userName || null,
+    branch: branch || null,
+    commit: commit || null,
+    dirty: status === null ? null : status !== '',
+    source: 'git'
+  };
+};
+
+const readCache = async (cachePath) => {
+  if (!cachePath) {
+    return null;
+  }
+  try {
+    return JSON.parse(await fs.readFile(cachePath, 'utf-8'));
+  } catch (error) {
+    return null;
+  }
+};
+
+const writeCache = async (cachePath, data) => {
+  if (!cachePath) {
+    return;
+  }
+  try {
+    await fs.mkdir(path.dirname(cachePath), { recursive: true });
+    const tmpPath = `${cachePath}.${process.pid}.tmp`;
+    await fs.writeFile(tmpPath, JSON.stringify(data));
+    await fs.rename(tmpPath, cachePath);
+  } catch (error) {
+    // 缓存写入失败不影响结果
+  }
+};
+
+/**
+ * 获取 { userName, branch, commit, dirty, source }
+ *
+ * options.cachePath：用户名、分支和提交按配置文件、HEAD和引用文件的mtime缓存在该文件中；
+ * options.dirty：为true时检查工作区状态（默认不检查，dirty为null）。
+ * 工作区状态与每个已跟踪文件有关，无法缓存，每次检查都要stat全部文件，大仓库中可能调用git status
+ */
+export const getGitInfo = async (options = {}) => {
+  const { cwd = process.cwd(), cachePath = null, dirty: checkDirty = false } = options;
+  try {
+    const repo = await findGitDir(cwd);
+    const cached = await readCache(cachePath);
+    let info = null;
+    let config = null;
+    if (cached && cached.workTree === (repo && repo.workTree)) {
+      const mtimes = await Promise.all(cached.files.map(mtimeOf));
+      if (JSON.stringify(mtimes) === JSON.stringify(cached.mtimes)) {
+        info = { ...cached.info, source: 'cache' };
+      }
+    }
+    if (!info) {
+      const head = repo ? await readHead(repo) : { branch: null, commit: null, files: [] };
+      config = await readGitConfig(repo, head.branch);
+      const files = [...config.files, ...head.files];
+      info = {
+        // 用户名可能来自未读取的配置（其他位置的系统配置、GIT_CONFIG_*环境变量等），读不到时询问git
+        userName: config.values.get('user.name') || await runGit(['config', 'user.name'], cwd) || null,
+        branch: head.branch,
+        commit: head.commit,
+        source: 'files'
+      };
+      await writeCache(cachePath, {
+        workTree: repo && repo.workTree,
+        files,
+        mtimes: await Promise.all(files.map(mtimeOf)),
+        info: { userName: info.userName, branch: info.branch, commit: info.commit }
+      });
+    }
+    info.dirty = null;
+    if (repo && checkDirty) {
+      config = config || await readGitConfig(repo, info.branch);
+      info.dirty = await isWorkTreeDirty(repo, config.values, options);
+      if (info.dirty === null) {
+        const { dirty } = await getGitInfoFromCommand(cwd);
+        info.dirty = dirty;
+      }
+    }
+    return info;
+  } catch (error) {
+    return getGitInfoFromCommand(cwd);
+  }
+};
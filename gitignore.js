@@ -0,0 +1,263 @@
+#!/usr/bin/env node
+
+/**
+ * gitignore - .gitignore规则编译与匹配
+ * 每个.gitignore（根目录、子目录以及.git/info/exclude）只读取和编译一次，
+ * 按git的语义匹配：取反、锚定、**、字符类、转义、仅匹配目录，以及子目录规则优先
+ */
+
+import { promises as fs } from 'fs';
+import * as path from 'path';
+
+export const GITIGNORE_FILE = '.gitignore';
+
+const REGEX_SPECIAL = /[.*+?^${}()|[\]\\/]/;
+
+// 转义正则表达式特殊字符
+const escapeRegex = (char) => (REGEX_SPECIAL.test(char) ? `\\${char}` : char);
+
+// 编译字符类[...]，返回[正则片段, 结束位置]；没有闭合的]时返回null，按普通字符处理
+const compileCharClass = (glob, start) => {
+  let i = start + 1;
+  let negate = false;
+  if (glob[i] === '!' || glob[i] === '^') {
+    negate = true;
+    i++;
+  }
+  let body = '';
+  let first = true;
+  while (i < glob.length && (glob[i] !== ']' || first)) {
+    let char = glob[i];
+    if (char === '\\' && i + 1 < glob.length) {
+      char = glob[++i];
+      body += `\\${char}`;
+    } else if (char === '-') {
+      body += '-';
+    } else {
+      body += /[\\\]\[^]/.test(char) ? `\\${char}` : char;
+    }
+    first = false;
+    i++;
+  }
+  if (i >= glob.length) {
+    return null;
+  }
+  // 与FNM_PATHNAME一致，字符类不匹配路径分隔符
+  return [`(?!/)[${negate ? '^' : ''}${body}]`, i + 1];
+};
+
+/**
+ * 把去掉锚定和结尾/的glob编译为正则表达式源码
+ */
+export const compileGlob = (glob) => {
+  let source = '';
+  let i = 0;
+  while (i < glob.length) {
+    const char = glob[i];
+    if (char === '*') {
+      if (glob[i + 1] === '*') {
+        const atSegmentStart = i === 0 || glob[i - 1] === '/';
+        const atSegmentEnd = i + 2 === glob.length || glob[i + 2] === '/';
+        if (atSegmentStart && atSegmentEnd) {
+          if (i + 2 === glob.length) {
+            // 结尾的/**匹配目录下的所有内容
+            source += '.*';
+            i += 2;
+          } else {
+            // **/匹配零个或多个目录
+            source += '(?:.*/)?';
+            i += 3;
+          }
+          continue;
+        }
+      }
+      // 其他位置的连续*与单个*相同
+      while (glob[i] === '*') {
+        i++;
+      }
+      source += '[^/]*';
+      continue;
+    }
+    if (char === '?') {
+      source += '[^/]';
+      i++;
+    } else if (char === '[') {
+      const compiled = compileCharClass(glob, i);
+      if (compiled) {
+        source += compiled[0];
+        i = compiled[1];
+      } else {
+        source += '\\[';
+        i++;
+      }
+    } else if (char === '\\' && i + 1 < glob.length) {
+      source += escapeRegex(glob[i + 1]);
+      i += 2;
+    } else {
+      source += escapeRegex(char);
+      i++;
+    }
+  }
+  return source;
+};
+
+/**
+ * 解析一行.gitignore规则，空行和注释返回null
+ */
+export const parseRule = (line) => {
+  // 去除未转义的结尾空格
+  let pattern = line.replace(/\r$/, '').replace(/(?<!\\) +$/, '');
+  if (!pattern || pattern.startsWith('#')) {
+    return null;
+  }
+  let negate = false;
+  if (pattern.startsWith('!')) {
+    negate = true;
+    pattern = pattern.slice(1);
+  } else if (pattern.startsWith('\\!') || pattern.startsWith('\\#')) {
+    pattern = pattern.slice(1);
+  }
+  let dirOnly = false;
+  if (pattern.endsWith('/') && !pattern.endsWith('\\/')) {
+    dirOnly = true;
+    pattern = pattern.slice(0, -1);
+  }
+  if (!pattern) {
+    return null;
+  }
+  // 开头或中间含有/的规则相对于.gitignore所在目录锚定，否则匹配任意层级
+  const anchored = pattern.includes('/');
+  if (pattern.startsWith('/')) {
+    pattern = pattern.slice(1);
+  }
+  const prefix = anchored ? '^' : '^(?:.*/)?';
+  return {
+    pattern: line,
+    negate,
+    dirOnly,
+    regex: new RegExp(`${prefix}${compileGlob(pattern)}$`)
+  };
+};
+
+/**
+ * 编译一个.gitignore文件的内容
+ */
+export const compileGitignore = (content) => {
+  return content.split('\n').map(parseRule).filter(Boolean);
+};
+
+// 在一组规则中查找最后一条匹配的规则，返回true（忽略）、false（取反重新包含）或undefined（无匹配）
+const matchRules = (rules, relativePath, isDir) => {
+  for (let i = rules.length - 1; i >= 0; i--) {
+    const rule = rules[i];
+    if (rule.dirOnly && !isDir) {
+      continue;
+    }
+    if (rule.regex.test(relativePath)) {
+      return !rule.negate;
+    }
+  }
+  return undefined;
+};
+
+const readRules = async (filePath) => {
+  try {
+    return compileGitignore(await fs.readFile(filePath, 'utf-8'));
+  } catch (error) {
+    return null;
+  }
+};
+
+// 项目的.gitignore匹配器，路径均为相对于项目根目录、以/分隔的路径
+export class GitignoreMatcher {
+  constructor(rootPath) {
+    this.rootPath = rootPath;
+    // 目录 -> 该目录下.gitignore编译后的规则（没有.gitignore时为null）
+    this.rulesByDir = new Map();
+    // 目录 -> 是否被忽略
+    this.ignoredDirs = new Map();
+    this.excludeRules = null;
+    this.hasRootGitignore = false;
+  }
+
+  /**
+   * 创建匹配器并加载根目录的.gitignore和.git/info/exclude
+   */
+  static async create(rootPath) {
+    const matcher = new GitignoreMatcher(rootPath);
+    matcher.excludeRules = await readRules(path.join(rootPath, '.git', 'info', 'exclude'));
+    await matcher.enterDirectory('');
+    // 根目录存在.gitignore文件（即使没有规则）时不使用默认黑名单
+    const rootStat = await fs.stat(path.join(rootPath, GITIGNORE_FILE)).catch(() => null);
+    matcher.hasRootGitignore = rootStat !== null && rootStat.isFile();
+    return matcher;
+  }
+
+  /**
+   * 加载目录下的.gitignore（每个目录只读取一次），遍历进入目录前调用
+   */
+  async enterDirectory(relativeDir) {
+    if (!this.rulesByDir.has(relativeDir)) {
+      const rules = await readRules(path.join(this.rootPath, relativeDir, GITIGNORE_FILE));
+      this.rulesByDir.set(relativeDir, rules && rules.length ? rules : null);
+    }
+  }
+
+  /**
+   * 加载目录及其所有上级目录下的.gitignore
+   */
+  async enterPath(relativeDir) {
+    await this.enterDirectory('');
+    let index = relativeDir.indexOf('/');
+    while (index !== -1) {
+      await this.enterDirectory(relativeDir.slice(0, index));
+      index = relativeDir.indexOf('/', index + 1);
+    }
+    await this.enterDirectory(relativeDir);
+  }
+
+  /**
+   * 判断路径本身是否被规则忽略（不检查上级目录），所在目录及上级目录需已通过enterDirectory加载
+   */
+  ignores(relativePath, isDir) {
+    if (isDir && this.ignoredDirs.has(relativePath)) {
+      return this.ignoredDirs.get(relativePath);
+    }
+    let ignored;
+    // 从最近的.gitignore开始向上查找，下级目录的规则优先
+    let dir = relativePath;
+    while (ignored === undefined && dir) {
+      const slash = dir.lastIndexOf('/');
+      dir = slash === -1 ? '' : dir.slice(0, slash);
+      const rules = this.rulesByDir.get(dir);
+      if (rules) {
+        ignored = matchRules(rules, dir ? relativePath.slice(dir.length + 1) : relativePath, isDir);
+      }
+    }
+    if (ignored === undefined && this.excludeRules) {
+      ignored = matchRules(this.excludeRules, relativePath, isDir);
+    }
+    ignored = ignored === true;
+    if (isDir) {
+      this.ignoredDirs.set(relativePath, ignored);
+    }
+    return ignored;
+  }
+
+  /**
+   * 判断任意路径是否被忽略：上级目录被忽略时其中的内容也被忽略（与git一致，无法通过取反重新包含）
+   */
+  async isIgnored(relativePath, isDir = false) {
+    const parts = relativePath.split('/');
+    let dir = '';
+    for (let i = 0; i < parts.length - 1; i++) {
+      await this.enterDirectory(dir);
+      dir = dir ? `${dir}/${parts[i]}` : parts[i];
+      if (this.ignores(dir, true)) {
+        return true;
+      }
+    }
+    await this.enterDirectory(dir);
+    return this.ignores(relativePath, isDir);
+  }
+}
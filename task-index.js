@@ -0,0 +1,211 @@
+#!/usr/bin/env node
+
+/**
+ * task-index - 任务文件索引
+ * 在.sleepdog/task/.index.json中记录每个todo文件的任务统计，
+ * 通过mtime和大小校验，只有变化的文件才重新解析
+ * 写入时在独占锁内重新读取索引，只合并本进程更新或删除的条目
+ */
+
+import { promises as fs } from 'fs';
+import * as path from 'path';
+import {
+  getTaskDirPath,
+  writeFileAtomic,
+  TASK_STATUS
+} from './common.js';
+import { withLock } from './fs-lock.js';
+
+export const TASK_INDEX_FILE = '.index.json';
+export const TASK_FILE_SUFFIX = '-todo.md';
+const INDEX_VERSION = 1;
+// 读取首个未完成任务行时每次读取的字节数
+const LINE_READ_SIZE = 4096;
+
+/**
+ * 解析todo文件内容，统计各状态的任务数和首个未完成任务的字节偏移
+ */
+export const parseTaskContent = (buffer) => {
+  const counts = { pending: 0, inProgress: 0, completed: 0, firstPendingOffset: -1 };
+  let offset = 0;
+  while (offset < buffer.length) {
+    let end = buffer.indexOf(0x0a, offset);
+    if (end === -1) {
+      end = buffer.length;
+    }
+    const line = buffer.toString('utf8', offset, end);
+    if (line.includes(TASK_STATUS.PENDING)) {
+      counts.pending++;
+      if (counts.firstPendingOffset === -1) {
+        counts.firstPendingOffset = offset;
+      }
+    } else if (line.includes(TASK_STATUS.IN_PROGRESS)) {
+      counts.inProgress++;
+    } else if (line.includes(TASK_STATUS.COMPLETED)) {
+      counts.completed++;
+    }
+    offset = end + 1;
+  }
+  return counts;
+};
+
+// 任务文件索引
+export class TaskIndex {
+  constructor(taskDir = getTaskDirPath()) {
+    this.taskDir = taskDir;
+    this.indexPath = path.join(taskDir, TASK_INDEX_FILE);
+    this.files = null;
+    // 本进程更新（条目）或删除（null）的文件，写入时合并到最新的索引中
+    this.changes = {};
+  }
+
+  async load() {
+    if (!this.files) {
+      this.files = await this.readIndex();
+    }
+  }
+
+  async readIndex() {
+    try {
+      const data = JSON.parse(await fs.readFile(this.indexPath, 'utf-8'));
+      if (data.version === INDEX_VERSION) {
+        return data.files;
+      }
+    } catch (error) {
+      // 索引不存在或损坏时重新建立
+    }
+    return {};
+  }
+
+  setEntry(fileName, entry) {
+    if (entry) {
+      this.files[fileName] = entry;
+    } else {
+      delete this.files[fileName];
+    }
+    this.changes[fileName] = entry;
+  }
+
+  async save() {
+    if (Object.keys(this.changes).length === 0) {
+      return;
+    }
+    const changes = this.changes;
+    this.changes = {};
+    await withLock(`${this.indexPath}.lock`, 'exclusive', async () => {
+      const files = await this.readIndex();
+      for (const [fileName, entry] of Object.entries(changes)) {
+        if (entry) {
+          files[fileName] = entry;
+        } else {
+          delete files[fileName];
+        }
+      }
+      await writeFileAtomic(this.indexPath, JSON.stringify({ version: INDEX_VERSION, files }));
+    });
+  }
+
+  // 返回文件的索引条目，文件有变化时重新解析，文件不存在时返回null
+  async entry(fileName) {
+    await this.load();
+    const filePath = path.join(this.taskDir, fileName);
+    const stat = await fs.stat(filePath).catch(() => null);
+    if (!stat || !stat.isFile()) {
+      if (this.files[fileName]) {
+        this.setEntry(fileName, null);
+      }
+      return null;
+    }
+    const cached = this.files[fileName];
+    if (cached && cached.mtimeMs === stat.mtimeMs && cached.size === stat.size) {
+      return cached;
+    }
+    const entry = {
+      mtimeMs: stat.mtimeMs,
+      size: stat.size,
+      ...parseTaskContent(await fs.readFile(filePath))
+    };
+    this.setEntry(fileName, entry);
+    return entry;
+  }
+
+  /**
+   * 获取任务的统计信息，任务文件不存在时返回null
+   */
+  async getTask(taskId) {
+    const entry = await this.entry(`${taskId}${TASK_FILE_SUFFIX}`);
+    await this.save();
+    return entry;
+  }
+
+  /**
+   * 读取任务的首个未完成任务行，没有未完成任务时返回null
+   */
+  async firstPending(taskId) {
+    const entry = await this.getTask(taskId);
+    if (!entry || entry.firstPendingOffset < 0) {
+      return null;
+    }
+    const handle = await fs.open(path.join(this.taskDir, `${taskId}${TASK_FILE_SUFFIX}`), 'r');
+    try {
+      const chunks = [];
+      let position = entry.firstPendingOffset;
+      while (true) {
+        const buffer = Buffer.alloc(LINE_READ_SIZE);
+        const { bytesRead } = await handle.read(buffer, 0, LINE_READ_SIZE, position);
+        const newline = buffer.subarray(0, bytesRead).indexOf(0x0a);
+        chunks.push(buffer.subarray(0, newline === -1 ? bytesRead : newline));
+        if (newline !== -1 || bytesRead < LINE_READ_SIZE) {
+          break;
+        }
+        position += bytesRead;
+      }
+      return Buffer.concat(chunks).toString('utf8');
+    } finally {
+      await handle.close();
+    }
+  }
+
+  /**
+   * 获取所有任务文件的统计信息，已删除的文件会从索引中移除
+   */
+  async summary() {
+    await this.load();
+    const names = (await fs.readdir(this.taskDir).catch(() => []))
+      .filter((name) => name.endsWith(TASK_FILE_SUFFIX))
+      .sort();
+    for (const name of Object.keys(this.files)) {
+      if (!names.includes(name)) {
+        this.setEntry(name, null);
+      }
+    }
+    const tasks = [];
+    for (const name of names) {
+      const entry = await this.entry(name);
+      if (entry) {
+        tasks.push({ name, ...entry });
+      }
+    }
+    await this.save();
+    return tasks;
+  }
+}
+
+/**
+ * 格式化任务状态摘要
+ */
+export const formatTaskStatus = (tasks, currentTaskId) => {
+  if (tasks.length === 0) {
+    return '暂无任务文件';
+  }
+  const total = { pending: 0, inProgress: 0, completed: 0 };
+  const lines = tasks.map((task) => {
+    total.pending += task.pending;
+    total.inProgress += task.inProgress;
+    total.completed += task.completed;
+    const current = task.name === `${currentTaskId}${TASK_FILE_SUFFIX}` ? '  <- 当前' : '';
+    return `${task.name}  未完成 ${task.pending}  进行中 ${task.inProgress}  已完成 ${task.completed}${current}`;
+  });
+  lines.push(`合计 ${tasks.length}个文件  未完成 ${total.pending}  进行中 ${total.inProgress}  已完成 ${total.completed}`);
+  return lines.join('\n');
+};